@@ -14,24 +14,378 @@ import gzip
 import hashlib
 import itertools
 
-from linkml_runtime.utils.schemaview import SchemaView
 from linkml_runtime.linkml_model.meta import EnumDefinition, PermissibleValue, SchemaDefinition
 from linkml_runtime.dumpers import yaml_dumper, json_dumper, tsv_dumper
 from linkml_runtime.loaders import json_loader, yaml_loader
 
 from ak_schema import *
 from ak_schema_utils import *
+from cell_pairing_index import ChainRef, CellPairingIndex
+from repertoire_checkpoint import RepertoireCheckpoint, file_sha256, metadata_sha256
+from study_manifest import StudyManifest, code_version
+from run_metrics import RunMetrics
+from run_profile import profile_option
+# ak_schema exports datetime.time, so import the timer by name
+from time import perf_counter
+
+# container fields that receptor_integrate fills, streamed as they are created
+stream_fields = [ 'chains', 'ab_tcell_receptors', 'gd_tcell_receptors', 'bcell_receptors', 'tcr_complex' ]
+
+# rows hashed together in process_repertoire
+hash_batch_size = 10000
+
+# AIRR rearrangement fields used for chains
+fields = [ 'productive', 'junction', 'junction_aa', 'complete_vdj', 'sequence', 'sequence_aa', 'locus', 'v_call', 'j_call', 'duplicate_count', 'cell_id' ]
+field_types = [ 'bool', 'str', 'str', 'bool', 'str', 'str', 'str', 'str', 'str', 'int', 'str' ]
+
+
+def read_rearrangements(filename, counts, skip=0):
+    """Read productive rearrangements with a junction_aa from an AIRR TSV file.
+
+    Yields a dict of the chain fields for each row that passes the filters,
+    and counts all rows in counts['rows']. The first skip rows after the
+    header are neither read nor counted.
+    """
+    line_cnt = 0
+    first = True
+    reader = gzip.open(filename, 'rt')
+    for line in reader:
+        line_cnt += 1
+        if first:
+            headers = line.strip().split('\t')
+            field_idx = []
+            for f in fields:
+                try:
+                    idx = headers.index(f)
+                except ValueError:
+                    idx = None
+                field_idx.append(idx)
+            first = False
+            continue
+        if line_cnt <= skip + 1:
+            continue
+
+        row = {}
+        values = line.strip().split('\t')
+        for (f, idx, t) in zip(fields, field_idx, field_types):
+            if idx is None:
+                row[f] = None
+            else:
+                try:
+                    if idx > len(values):
+                        row[f] = None
+                        continue
+                    if t == 'bool':
+                        row[f] = to_bool(values[idx])
+                    elif t == 'int':
+                        #print(line_cnt, len(values), idx)
+                        row[f] = to_int(values[idx])
+                    elif t == 'str':
+                        if len(values[idx]) == 0:
+                            row[f] = None
+                        else:
+                            row[f] = values[idx]
+                    else:
+                        row[f] = values[idx]
+                except IndexError:
+                    print(idx, 'index not found for', f)
+                    row[f] = None
+
+        counts['rows'] += 1
+        #print(row)
+        #break
+
+        # filters
+        if not row['productive']:
+            continue
+        if row.get('junction_aa') is None:
+            continue
+        if len(row['junction_aa']) < 3:
+            continue
+        yield row
+    reader.close()
+
+
+def read_rearrangements_columnar(filename, counts, chunksize=100000):
+    """Columnar version of read_rearrangements.
+
+    Only the chain fields are loaded, in chunks, and the productive and
+    junction_aa filters are applied to whole columns before any row dict
+    is made. Values are converted the same way as read_rearrangements.
+    """
+    import pandas as pd
+
+    with gzip.open(filename, 'rt') as f:
+        headers = f.readline().strip().split('\t')
+    usecols = [ f for f in fields if f in headers ]
+    if 'productive' not in usecols or 'junction_aa' not in usecols:
+        # every row would be filtered
+        with gzip.open(filename, 'rt') as f:
+            counts['rows'] += sum(1 for line in f) - 1
+        return
+
+    # read_rearrangements strips each line, which trims the first and last fields
+    first_field = headers[0]
+    last_field = headers[-1]
+
+    # index_col=False keeps rows with extra trailing fields lined up with
+    # the header, pandas would otherwise take the first column as the index.
+    # Blank lines are read as empty rows, which the filters drop, so the
+    # rows counted are the lines of the file, as read_rearrangements counts
+    # them and skips them when it takes over.
+    chunks = pd.read_csv(filename, sep='\t', usecols=usecols, dtype=str, na_filter=False, index_col=False,
+                         skip_blank_lines=False, quoting=csv.QUOTE_NONE, compression='gzip', chunksize=chunksize)
+    rows_read = 0
+    while True:
+        try:
+            df = next(chunks)
+        except StopIteration:
+            break
+        except pd.errors.ParserError as e:
+            # read_rearrangements takes any row, read the rest of the file with it
+            print(f'Columnar read of {filename} failed after {rows_read} rows, reading the rest by line: {e}')
+            chunks.close()
+            yield from read_rearrangements(filename, counts, skip=rows_read)
+            return
+        rows_read += len(df)
+        counts['rows'] += len(df)
+        df = df.fillna('')
+        if first_field in usecols:
+            df[first_field] = df[first_field].str.lstrip()
+        if last_field in usecols:
+            df[last_field] = df[last_field].str.rstrip()
+
+        # filters
+        mask = df['productive'].isin(true_values) & (df['junction_aa'].str.len() >= 3)
+        df = df[mask]
+        if len(df) == 0:
+            continue
+
+        columns = []
+        for (f, t) in zip(fields, field_types):
+            if f not in usecols:
+                columns.append(itertools.repeat(None, len(df)))
+            elif t == 'bool':
+                columns.append(df[f].map(to_bool).tolist())
+            elif t == 'int':
+                columns.append([ to_int(v) for v in df[f].tolist() ])
+            else:
+                columns.append([ v if len(v) > 0 else None for v in df[f].tolist() ])
+        for values in zip(*columns):
+            yield dict(zip(fields, values))
+
+
+def pair_cells(container, cells, tcell_receptors, writer=None, metrics=None):
+    """Generate receptors for cells with a pair of chains.
+
+    cells is an iterable of (cell_id, chains).
+    """
+    if metrics is None:
+        metrics = RunMetrics(None)
+    start = perf_counter()
+    dist = [ 0, 0, 0, 0 ]
+    tcr_three = [ 0, 0, 0, 0 ]
+    cell_cnt = 0
+    for c, chains in cells:
+        cell_cnt += 1
+        lenc = len(chains)
+        if lenc < 2: # validation error?
+            dist[0] += 1
+        elif lenc == 3:
+            dist[2] += 1
+            #t = check_three(chains)
+            #tcr_three[0] += t[0]
+            #tcr_three[1] += t[1]
+            #tcr_three[2] += t[2]
+            #tcr_three[3] += t[3]
+        elif lenc > 3:
+            dist[3] += 1
+        else: # 2 chains, obvious case
+            dist[1] += 1
+            receptor = make_receptor(container, chains, record=True)
+            make_complex(container, receptor, None, None, record=True)
+            if object_class(receptor) == AlphaBetaTCR:
+                tcell_receptors.add(receptor.akc_id)
+            elif object_class(receptor) == GammaDeltaTCR:
+                tcell_receptors.add(receptor.akc_id)
+            if writer:
+                writer.flush(container, stream_fields)
+
+    metrics.add_time('pair cells', perf_counter() - start, cell_cnt)
+    metrics.count('paired cells', dist[1])
+    print(cell_cnt, 'unique cell ids')
+    print('cell_id distribution:', dist)
+    print('TCR three chain distribution:', tcr_three)
+
+
+def repertoire_filename(study, rep):
+    return ADC_IMPORT_DATA + '/' + study + '/' + rep['repertoire_id'] + '.airr.tsv.gz'
+
+
+def process_repertoire(study, rep, cell_within_repertoire, columnar=False, writer=None):
+    """Convert the rearrangements for one repertoire to chains and receptors.
+
+    This is run in a worker process when receptor_integrate is given more
+    than one worker, so it only uses its arguments and returns everything
+    the study needs: a container with the chains/receptors/complexes, the
+    T cell chains and receptors for the assay, and, for IPA studies, the
+    chains by cell_id that are paired at the study level. Only the akc_id
+    and locus of chains are kept for pairing. Stage times and counts are
+    returned as metrics.
+    """
+    metrics = RunMetrics(None)
+    hash_before = hash_cache_info()
+    print('Processing repertoire:', rep['repertoire_id'], 'for study id:', rep['study']['study_id'])
+
+    container = AIRRKnowledgeCommons()
+    tcell_receptors = set()
+    tcell_chains = set()
+    cell_id = {}
+
+    paired_chain = False
+    if "contains_paired_chain" in rep['study']['keywords_study']:
+        paired_chain = True
+
+    #if rep['sample'][0]['physical_linkage'] == 'hetero_head-head':
+    #    print('skipping Georgiou study:', study)
+    #    break
+
+    species = None
+    if rep.get('subject') and rep['subject'].get('species') and rep['subject']['species'].get('id'):
+        species = rep['subject']['species']['id']
+
+    prod_cnt = 0
+    counts = { 'rows': 0 }
+    filename = repertoire_filename(study, rep)
+    if columnar:
+        rows = read_rearrangements_columnar(filename, counts)
+    else:
+        rows = read_rearrangements(filename, counts)
+    build_seconds = 0.0
+    write_seconds = 0.0
+    # rows are hashed a batch at a time, which times the hash stage per batch
+    hash_start = hash_time()
+    rows = metrics.timed('read and filter', rows)
+    while True:
+        batch = list(itertools.islice(rows, hash_batch_size))
+        if len(batch) == 0:
+            break
+        hashes = adc_chain_hashes_batch(species, batch)
+        for row, row_hashes in zip(batch, hashes):
+            start = perf_counter()
+            cnt = 1
+            if row['duplicate_count']:
+                cnt = row['duplicate_count']
 
-ak_schema_view = SchemaView("ak-schema/project/linkml/ak_schema.yaml")
+            # make chain, with the sequence hashes
+            chain = make_chain_record_from_adc(species, row, row_hashes)
+            #print(chain.locus)
+            if str(chain.locus) in ['TRA', 'TRB', 'TRG', 'TRD']:
+                tcell_chains.add(chain.akc_id)
+            container.chains[chain.akc_id] = chain
+
+            if not paired_chain:
+                receptor = make_receptor(container, [chain, None], record=True)
+                make_complex(container, receptor, None, None, record=True)
+                if object_class(receptor) == AlphaBetaTCR:
+                    tcell_receptors.add(receptor.akc_id)
+                elif object_class(receptor) == GammaDeltaTCR:
+                    tcell_receptors.add(receptor.akc_id)
+
+            # gather chains by cell_id
+            if row.get('cell_id') is not None and len(row['cell_id']) != 0:
+                chain_ref = ChainRef(chain.akc_id, str(chain.locus))
+                if cell_id.get(row['cell_id']) is None:
+                    cell_id[row['cell_id']] = [ chain_ref ]
+                else:
+                    cell_id[row['cell_id']].append(chain_ref)
+            build_seconds += perf_counter() - start
+
+            if writer:
+                start = perf_counter()
+                writer.flush(container, stream_fields)
+                write_seconds += perf_counter() - start
+
+            prod_cnt = prod_cnt + 1
+            if prod_cnt % 10000 == 0:
+                print('Processed', prod_cnt, 'productive rearrangements.')
+    row_cnt = counts['rows']
+    add_hash_time(metrics, hash_start)
+    metrics.add_time('build chain', build_seconds, prod_cnt)
+    if writer:
+        metrics.add_time('write stream', write_seconds, prod_cnt)
+    metrics.count('rows', row_cnt)
+    metrics.count('productive rows', prod_cnt)
+    metrics.count('filtered rows', row_cnt - prod_cnt)
+
+    # generate receptors for pairs
+    # we create the receptors for single chains in the outer loop
+    if cell_within_repertoire:
+        print(f"cell_within_repertoire is {cell_within_repertoire}")
+        pair_cells(container, cell_id.items(), tcell_receptors, writer, metrics)
+        cell_id = {}
+
+    print(prod_cnt, 'productive rearrangements for repertoire:', rep['repertoire_id'])
+    hash_info = hash_cache_info()
+    print('sequence hash cache:', hash_info)
+    metrics.count('hash cache hits', hash_info.hits - hash_before.hits)
+    metrics.count('hash cache misses', hash_info.misses - hash_before.misses)
+
+    return {
+        'repertoire_id': rep['repertoire_id'],
+        'container': container,
+        'tcell_chains': tcell_chains,
+        'tcell_receptors': tcell_receptors,
+        'cell_id': cell_id,
+        'row_cnt': row_cnt,
+        'prod_cnt': prod_cnt,
+        'metrics': metrics.state(),
+    }
+
+
+def checkpointed_repertoire(study, rep, cell_within_repertoire, columnar, checkpoint_dir, checkpoint_settings):
+    """Run process_repertoire, reusing its saved shard if the input file and settings are unchanged."""
+    # the repertoire metadata decides the species and the pairing, and is
+    # often fixed after the rearrangements were downloaded
+    settings = dict(checkpoint_settings, repertoire=metadata_sha256(rep))
+    checkpoint = RepertoireCheckpoint(checkpoint_dir, settings)
+    input_file = repertoire_filename(study, rep)
+    result = checkpoint.load(rep['repertoire_id'], input_file)
+    if result is not None:
+        print('Using checkpoint for repertoire:', rep['repertoire_id'])
+        # the saved metrics are from the run that made the checkpoint
+        result['metrics'] = { 'stages': {}, 'counters': { 'checkpointed repertoires': 1, 'rows': result['row_cnt'] } }
+        return result
+    result = process_repertoire(study, rep, cell_within_repertoire, columnar)
+    checkpoint.save(rep['repertoire_id'], input_file, result)
+    return result
+
+
+def merge_repertoire(container, result, writer=None):
+    """Merge the chains/receptors from a repertoire into the study container."""
+    if writer:
+        writer.flush(result['container'], stream_fields)
+        return
+    for container_field in stream_fields:
+        objs = container[container_field]
+        for key, obj in result['container'][container_field].items():
+            objs[key] = obj
 
 
 @click.command()
 @click.argument('cache_id')
-def receptor_integrate(cache_id):
+@click.option('--stream', is_flag=True, help='Write chains and receptors as soon as they are first seen, instead of at the end.')
+@click.option('--workers', default=1, show_default=True, help='Number of processes to transform repertoires in parallel.')
+@click.option('--columnar', is_flag=True, help='Read rearrangement files in column chunks with pandas.')
+@click.option('--cell-index-dir', default=None, help='Directory for the IPA cell_id pairing index (default: system temp directory).')
+@click.option('--checkpoint', is_flag=True, help='Save each finished repertoire, and reuse saved repertoires whose input is unchanged.')
+@click.option('--parquet', is_flag=True, help='Also write Parquet files, needs pyarrow.')
+@click.option('--force', is_flag=True, help='Transform the study even if its inputs and code are unchanged.')
+@profile_option(lambda cache_id, **kwargs: f'{ADC_TRANSFORM_DATA}/adc_profile/{cache_id}/chain')
+def receptor_integrate(cache_id, stream, workers, columnar, cell_index_dir, checkpoint, parquet, force):
     """Convert ADC rearrangements to AK chains and receptors."""
 
-    fields = [ 'productive', 'junction', 'junction_aa', 'complete_vdj', 'sequence', 'sequence_aa', 'locus', 'v_call', 'j_call', 'duplicate_count', 'cell_id' ]
-    field_types = [ 'bool', 'str', 'str', 'bool', 'str', 'str', 'str', 'str', 'str', 'int', 'str' ]
+    check_env('ADC_IMPORT_DATA', 'ADC_TRANSFORM_DATA')
 
     if cache_id not in cache_list:
         print(f"Given cache id: {cache_id} is not in the study list")
@@ -47,13 +401,51 @@ def receptor_integrate(cache_id):
     junction_exact_aa_and_vj_match = {}
 
     print('Processing study cache:', study)
+    metrics = RunMetrics('adc_chain_transform', study=study, workers=workers, stream=stream, columnar=columnar,
+                         checkpoint=checkpoint, parquet=parquet, compression=AK_OUTPUT_COMPRESSION)
+
+    # skip the study if nothing has changed since it was last transformed
+    manifest = StudyManifest(f'{ADC_TRANSFORM_DATA}/adc_manifest/{study}', 'chain')
+    # the AIRR repertoire metadata, read once for the manifest and the transform
+    repertoire_file = ADC_IMPORT_DATA + '/' + study + '/repertoires.airr.json'
+    data = airr.read_airr(repertoire_file)
+    manifest_inputs = [ repertoire_file, input_filename(f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}/Assay.jsonl') ]
+    manifest_inputs += [ repertoire_filename(study, rep) for rep in data['Repertoire'] ]
+    manifest_code = code_version('adc_chain_transform.py', ak_schema_file, ak_schema_view.version)
+    manifest_options = { 'stream': stream, 'parquet': parquet, 'compression': AK_OUTPUT_COMPRESSION, 'id_mode': AK_ID_MODE }
+    if not force and manifest.unchanged(manifest_inputs, manifest_code, manifest_options):
+        print(f'Study {study} is unchanged since its last chain transform, skipping (use --force to transform it again).')
+        return
+    manifest.invalidate()
+
+    # output data for just this study
+    directory_name = f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}'
+    try:
+        os.mkdir(directory_name)
+    except FileExistsError:
+        pass
+    directory_name = f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}'
+    try:
+        os.mkdir(directory_name)
+    except FileExistsError:
+        pass
+    parquet_dir = None
+    if parquet:
+        check_parquet()
+        parquet_dir = f'{ADC_TRANSFORM_DATA}/adc_parquet/{study}'
+        os.makedirs(parquet_dir, exist_ok=True)
+
+    # streaming output keeps only the chains still waiting on cell pairing in memory
+    writer = None
+    if stream:
+        writer = StreamingContainerWriter(container, f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}', f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}', parquet_dir)
 
     # load AK Assay for study
     print("load AK Assay for study")
     assays = {}
     assay_file = f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}/Assay.jsonl'
     print(assay_file)
-    with open(assay_file, 'r') as f:
+    with metrics.stage('load assays'), open_input(assay_file) as f:
         for line in f:
             #print(line)
             x = json.loads(line)
@@ -61,6 +453,7 @@ def receptor_integrate(cache_id):
             if assays.get(y.akc_id) is None:
                 assays[y.akc_id] = y
     print(len(assays))
+    metrics.count('assays', len(assays))
     #print(assays)
     assay_by_rep_id = {}
     for akc_id in assays:
@@ -68,10 +461,14 @@ def receptor_integrate(cache_id):
         assay_by_rep_id[assay.repertoire_id] = akc_id
     print(len(assay_by_rep_id))
 
-    # Load the AIRR data
+    # every repertoire must link to an AK assay
+    missing = [ rep['repertoire_id'] for rep in data['Repertoire'] if rep['repertoire_id'] not in assay_by_rep_id ]
+    if missing:
+        print(f"ERROR: no AK assay in {assay_file} for repertoires: {', '.join(missing)}")
+        sys.exit(1)
+
     row_cnt = 0
-    data = airr.read_airr(ADC_IMPORT_DATA + '/' + study + '/repertoires.airr.json')
-    cell_id = {}
+    cell_index = None
 
     # Info within Info is IPA
     cell_within_repertoire = True
@@ -81,209 +478,81 @@ def receptor_integrate(cache_id):
         # the receptor chains within a cell are split across repertoires
         cell_within_repertoire = False
         #continue
+        # chains are held on disk until the study level pairing
+        cell_index = CellPairingIndex(cell_index_dir)
 
-    # loop through the repertoires
-    for rep in data['Repertoire']:
-        print('Processing repertoire:', rep['repertoire_id'], 'for study id:', rep['study']['study_id'])
-
-        # link to AK assay
-        assay_akc_id = assay_by_rep_id[rep['repertoire_id']]
-        print(assay_akc_id)
-        tcell_receptors = set()
-        tcell_chains = set()
-
-        paired_chain = False
-        if "contains_paired_chain" in rep['study']['keywords_study']:
-            paired_chain = True
-
-        #if rep['sample'][0]['physical_linkage'] == 'hetero_head-head':
-        #    print('skipping Georgiou study:', study)
-        #    break
-
-        # match up paired chains using cell_id, but only within the repertoire
-        if cell_within_repertoire:
-            cell_id = {}
-
-        prod_cnt = 0
-        line_cnt = 0
-        first = True
-        reader = gzip.open(ADC_IMPORT_DATA + '/' + study + '/' + rep['repertoire_id'] + '.airr.tsv.gz', 'rt')
-        for line in reader:
-            line_cnt += 1
-            if first:
-                headers = line.strip().split('\t')
-                field_idx = []
-                for f in fields:
-                    try:
-                        idx = headers.index(f)
-                    except ValueError:
-                        idx = None
-                    field_idx.append(idx)
-                first = False
-                continue
-
-            row = {}
-            values = line.strip().split('\t')
-            for (f, idx, t) in zip(fields, field_idx, field_types):
-                if idx is None:
-                    row[f] = None
-                else:
-                    try:
-                        if idx > len(values):
-                            row[f] = None
-                            continue
-                        if t == 'bool':
-                            row[f] = to_bool(values[idx])
-                        elif t == 'int':
-                            #print(line_cnt, len(values), idx)
-                            row[f] = to_int(values[idx])
-                        elif t == 'str':
-                            if len(values[idx]) == 0:
-                                row[f] = None
-                            else:
-                                row[f] = values[idx]
-                        else:
-                            row[f] = values[idx]
-                    except IndexError:
-                        print(idx, 'index not found for', f)
-                        row[f] = None
-                        
-            row_cnt = row_cnt + 1
-            #print(row)
-            #break
-
-            # filters
-            if not row['productive']:
-                continue
-            if row.get('junction_aa') is None:
-                continue
-            if len(row['junction_aa']) < 3:
-                continue
-            cnt = 1
-            if row['duplicate_count']:
-                cnt = row['duplicate_count']
-
-            # make chain
-            species = None
-            if rep.get('subject') and rep['subject'].get('species') and rep['subject']['species'].get('id'):
-                species = rep['subject']['species']['id']
-            chain = make_chain_from_adc(species, row)
-            #print(chain.locus)
-            if str(chain.locus) in ['TRA', 'TRB', 'TRG', 'TRD']:
-                tcell_chains.add(chain.akc_id)
-            container.chains[chain.akc_id] = chain
-
-            if not paired_chain:
-                receptor = make_receptor(container, [chain, None])
-                make_complex(container, receptor, None, None)
-                if type(receptor) == AlphaBetaTCR:
-                    tcell_receptors.add(receptor.akc_id)
-                elif type(receptor) == GammaDeltaTCR:
-                    tcell_receptors.add(receptor.akc_id)
-
-            # gather chains by cell_id
-            if row.get('cell_id') is not None and len(row['cell_id']) != 0:
-                if cell_id.get(row['cell_id']) is None:
-                    cell_id[row['cell_id']] = [ chain ]
-                else:
-                    cell_id[row['cell_id']].append(chain)
-
-            prod_cnt = prod_cnt + 1
-            if prod_cnt % 10000 == 0:
-                print('Processed', prod_cnt, 'productive rearrangements.')
-
-
-        # generate receptors for pairs
-        # we create the receptors for single chains in the outer loop
-        if cell_within_repertoire:
-            print(f"cell_within_repertoire is {cell_within_repertoire}")
-            print(len(cell_id), 'unique cell ids')
-            dist = [ 0, 0, 0, 0 ]
-            tcr_three = [ 0, 0, 0, 0 ]
-            for c in cell_id:
-                lenc = len(cell_id[c])
-                if lenc < 2: # validation error?
-                    dist[0] += 1
-                elif lenc == 3:
-                    dist[2] += 1
-                    #t = check_three(cell_id[c])
-                    #tcr_three[0] += t[0]
-                    #tcr_three[1] += t[1]
-                    #tcr_three[2] += t[2]
-                    #tcr_three[3] += t[3]
-                elif lenc > 3:
-                    dist[3] += 1
-                else: # 2 chains, obvious case
-                    dist[1] += 1
-                    receptor = make_receptor(container, cell_id[c])
-                    make_complex(container, receptor, None, None)
-                    if type(receptor) == AlphaBetaTCR:
-                        tcell_receptors.add(receptor.akc_id)
-                    elif type(receptor) == GammaDeltaTCR:
-                        tcell_receptors.add(receptor.akc_id)
-
-            print('cell_id distribution:', dist)
-            print('TCR three chain distribution:', tcr_three)
-
-        print(prod_cnt, 'productive rearrangements for repertoire:', rep['repertoire_id'])
-        print(row_cnt, 'records for study cache:', study)
-        total_rep_cnt += 1
-
-        # connect chains/receptors to assay
-        assays[assay_akc_id]['tcell_chains'] = list(tcell_chains)
-        print(f'{len(tcell_chains)} TCR chains')
-        assays[assay_akc_id]['tcell_receptors'] = list(tcell_receptors)
-        print(f'{len(tcell_receptors)} TCR receptors')
-
-    # here we match at the study level for IPA
-    if not cell_within_repertoire:
-        print(f"cell_within_repertoire is {cell_within_repertoire}")
-        print(len(cell_id), 'unique cell ids')
-        dist = [ 0, 0, 0, 0 ]
-        tcr_three = [ 0, 0, 0, 0 ]
-        for c in cell_id:
-            lenc = len(cell_id[c])
-            if lenc < 2: # validation error?
-                dist[0] += 1
-            elif lenc == 3:
-                dist[2] += 1
-                #t = check_three(cell_id[c])
-                #tcr_three[0] += t[0]
-                #tcr_three[1] += t[1]
-                #tcr_three[2] += t[2]
-                #tcr_three[3] += t[3]
-            elif lenc > 3:
-                dist[3] += 1
-            else: # 2 chains, obvious case
-                dist[1] += 1
-                #print(lenc)
-                #print(cell_id[c])
-                receptor = make_receptor(container, cell_id[c])
-                make_complex(container, receptor, None, None)
-                if type(receptor) == AlphaBetaTCR:
-                    tcell_receptors.add(receptor.akc_id)
-                elif type(receptor) == GammaDeltaTCR:
-                    tcell_receptors.add(receptor.akc_id)
-
-    # output data for just this study
-    directory_name = f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}'
-    try:
-        os.mkdir(directory_name)
-    except FileExistsError:
-        pass
-    directory_name = f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}'
     try:
-        os.mkdir(directory_name)
-    except FileExistsError:
-        pass
+        # loop through the repertoires, in parallel if requested
+        reps = data['Repertoire']
+        if checkpoint:
+            # shards hold whole repertoires, so they are streamed after each one finishes
+            checkpoint_dir = f'{ADC_TRANSFORM_DATA}/adc_checkpoint/{study}'
+            print('Using checkpoint directory:', checkpoint_dir)
+            # a shard made by other code, with other options or for other assays is not reused
+            checkpoint_settings = { 'code': manifest_code, 'id_mode': AK_ID_MODE, 'columnar': columnar,
+                                    'cell_within_repertoire': cell_within_repertoire,
+                                    'assay': file_sha256(input_filename(assay_file)) }
+            func = checkpointed_repertoire
+            args = [ (study, rep, cell_within_repertoire, columnar, checkpoint_dir, checkpoint_settings) for rep in reps ]
+        else:
+            func = process_repertoire
+            args = [ (study, rep, cell_within_repertoire, columnar) for rep in reps ]
+        if workers > 1:
+            print(f'Processing {len(reps)} repertoires with {workers} workers')
+            results = parallel_map(func, args, workers)
+        elif checkpoint:
+            results = ( func(*a) for a in args )
+        else:
+            results = ( process_repertoire(study, rep, cell_within_repertoire, columnar, writer) for rep in reps )
+        for result in results:
+            metrics.merge(result.get('metrics'))
+            metrics.count('repertoires')
+            with metrics.stage('merge repertoire', result['prod_cnt']):
+                merge_repertoire(container, result, writer)
+            del result['container']
+
+            # IPA chains are paired at the study level
+            for c in result['cell_id']:
+                for chain_ref in result['cell_id'][c]:
+                    cell_index.add(c, chain_ref)
+
+            row_cnt += result['row_cnt']
+            print(row_cnt, 'records for study cache:', study)
+            total_rep_cnt += 1
+
+            # connect chains/receptors to assay
+            assay_akc_id = assay_by_rep_id[result['repertoire_id']]
+            print(assay_akc_id)
+            tcell_chains = result['tcell_chains']
+            tcell_receptors = result['tcell_receptors']
+            assays[assay_akc_id]['tcell_chains'] = list(tcell_chains)
+            print(f'{len(tcell_chains)} TCR chains')
+            assays[assay_akc_id]['tcell_receptors'] = list(tcell_receptors)
+            print(f'{len(tcell_receptors)} TCR receptors')
+
+        # here we match at the study level for IPA
+        if not cell_within_repertoire:
+            print(f"cell_within_repertoire is {cell_within_repertoire}")
+            pair_cells(container, cell_index.cells(), tcell_receptors, writer, metrics)
+    finally:
+        # the index is a temporary file, removed even if the transform fails
+        if cell_index is not None:
+            cell_index.close()
+
+    if writer:
+        with metrics.stage('write stream'):
+            writer.flush(container)
+        totals = { f: writer.count(f) for f in stream_fields }
+    else:
+        totals = { f: len(container[f]) for f in stream_fields }
 
     print()
     print(f'Finished study {study}')
     print(total_rep_cnt, 'total ADC repertoires')
-    print(len(container['chains']), 'total chains')
-    print(len(container['ab_tcell_receptors']), 'total alpha/beta TCRs')
-    print(len(container['gd_tcell_receptors']), 'total gamma/delta TCRs')
-    print(len(container['bcell_receptors']), 'total BCRs')
+    print(totals['chains'], 'total chains')
+    print(totals['ab_tcell_receptors'], 'total alpha/beta TCRs')
+    print(totals['gd_tcell_receptors'], 'total gamma/delta TCRs')
+    print(totals['bcell_receptors'], 'total BCRs')
     print()
     print(len(exact_match), 'nucleotide match')
     print(len(junction_exact_match), 'junction nucleotide match')
@@ -296,20 +565,50 @@ def receptor_integrate(cache_id):
 
     container_fields = [x.name for x in dataclasses.fields(container)]
 
-    # Write everything to JSONL
-    for container_field in container_fields:
-        write_jsonl(container, container_field, f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}/{container_field}.jsonl')
-
-    # Write everything to CSV
-    for container_field in container_fields:
-        container_slot = ak_schema_view.get_slot(container_field)
-        tname = container_slot.range
-        fname = tname + '.csv'
-        write_csv(container, container_field, f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}/{fname}')
+    if writer:
+        # everything has already been written
+        with metrics.stage('write stream'):
+            writer.close()
+    else:
+        # chains and receptors are kept as records until now
+        with metrics.stage('materialize records', sum(totals.values())):
+            materialize_records(container, stream_fields)
+
+        # Write everything to JSONL
+        for container_field in container_fields:
+            with metrics.stage('write jsonl', len(container[container_field])):
+                write_jsonl(container, container_field, f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}/{container_field}.jsonl')
+
+        # Write everything to CSV
+        for container_field in container_fields:
+            container_slot = ak_schema_view.get_slot(container_field)
+            tname = container_slot.range
+            fname = tname + '.csv'
+            with metrics.stage('write csv', len(container[container_field])):
+                write_csv(container, container_field, f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}/{fname}')
+
+        # Write everything to Parquet
+        if parquet:
+            for container_field in container_fields:
+                tname = ak_schema_view.get_slot(container_field).range
+                with metrics.stage('write parquet', len(container[container_field])):
+                    write_parquet(container, container_field, f'{parquet_dir}/{tname}.parquet')
 
     # assay relationships
     write_relationship_csv('Assay', assays, 'tcell_receptors', f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}/')
     write_relationship_csv('Assay', assays, 'tcell_chains', f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}/')
+    if parquet:
+        write_relationship_parquet('Assay', assays, 'tcell_receptors', f'{parquet_dir}/')
+        write_relationship_parquet('Assay', assays, 'tcell_chains', f'{parquet_dir}/')
+
+    output_dirs = [ f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}', f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}' ]
+    if parquet:
+        output_dirs.append(parquet_dir)
+    manifest.save(manifest_inputs, manifest_code, manifest_options, output_dirs)
+
+    for container_field in stream_fields:
+        metrics.count(container_field, totals[container_field])
+    metrics.save(f'{ADC_TRANSFORM_DATA}/adc_metrics/{study}/chain.json', 'rows')
 
 if __name__ == "__main__":
     receptor_integrate()
@@ -14,12 +14,37 @@ AIRRKB_IMPORT=${AIRRKB_LOAD}/adc/adc_tsv/${CACHE_ID}
 docker run -v ${AIRRKB_IMPORT}:/ak_data --network ak-db-network -it postgres:16 psql ${PG_AK_CONN} -c "DROP TABLE IF EXISTS tmp_table;"
 
 TABLE_NAMES=(Chain AlphaBetaTCR GammaDeltaTCR BCellReceptor Investigation StudyArm Participant Reference StudyEvent LifeEvent ImmuneExposure Specimen SequenceData Assay Investigation_assays AKDataSet Conclusion Investigation_participants Investigation_documents Investigation_conclusions Assay_tcell_receptors)
+# check the files before anything is loaded
+# the postgres image has no zstd, so zstd output cannot be loaded
+for tname in "${TABLE_NAMES[@]}"; do
+    path=${AIRRKB_IMPORT}/${tname}.csv
+    if [[ -f ${path}.zst ]]
+    then
+        echo "ERROR: ${path}.zst is zstd compressed, transform with AK_OUTPUT_COMPRESSION=gzip or none to load it."
+        exit 1
+    fi
+    if [[ -f ${path}.gz && -f ${path} ]]
+    then
+        echo "ERROR: both ${path} and ${path}.gz exist."
+        exit 1
+    fi
+done
+
 count=0
 for tname in "${TABLE_NAMES[@]}"; do
     file=${tname}.csv
     path=${AIRRKB_IMPORT}/${file}
+    # output may be gzip compressed, see AK_OUTPUT_COMPRESSION
+    if [[ -f ${path}.gz ]]
+    then
+        path=${path}.gz
+        headers=$(gzip -dc ${path} | head -n 1)
+        source="program 'gzip -dc /ak_data/${file}.gz'"
+    else
+        headers=$(head -n 1 ${path})
+        source="'/ak_data/${file}'"
+    fi
     echo $path
-    headers=$(head -n 1 ${path})
 
     if [[ $tname = "AlphaBetaTCR" ]]
     then
@@ -31,7 +56,7 @@ for tname in "${TABLE_NAMES[@]}"; do
     fi
 
     docker run -v ${AIRRKB_IMPORT}:/ak_data --network ak-db-network -it postgres:16 psql ${PG_AK_CONN} -c "CREATE TABLE tmp_table (LIKE "\"${tname}"\" INCLUDING DEFAULTS);"
-    docker run -v ${AIRRKB_IMPORT}:/ak_data --network ak-db-network -it postgres:16 psql ${PG_AK_CONN} -c "\copy tmp_table (${headers}) from '/ak_data/${file}' DELIMITER ',' CSV HEADER;"
+    docker run -v ${AIRRKB_IMPORT}:/ak_data --network ak-db-network -it postgres:16 psql ${PG_AK_CONN} -c "\copy tmp_table (${headers}) from ${source} DELIMITER ',' CSV HEADER;"
     docker run -v ${AIRRKB_IMPORT}:/ak_data --network ak-db-network -it postgres:16 psql ${PG_AK_CONN} -c "INSERT into "\"${tname}"\" SELECT * FROM tmp_table ON CONFLICT DO NOTHING;"
     docker run -v ${AIRRKB_IMPORT}:/ak_data --network ak-db-network -it postgres:16 psql ${PG_AK_CONN} -c "DROP TABLE tmp_table;"
 
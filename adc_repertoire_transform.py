@@ -2,33 +2,53 @@ import dataclasses
 import click
 import sys
 import os
-from linkml_runtime.utils.schemaview import SchemaView
 from ak_schema import AIRRKnowledgeCommons
 from ak_schema_utils import (
     cache_list,
     write_jsonl,
     write_csv,
     write_all_relationships,
+    check_env,
+    ak_schema_file,
+    ak_schema_view,
+    AK_OUTPUT_COMPRESSION,
+    AK_ID_MODE,
     ADC_IMPORT_DATA,
     ADC_TRANSFORM_DATA
 )
 from transform_airr_repertoires import transform_airr_repertoires
-
-ak_schema_view = SchemaView("ak-schema/project/linkml/ak_schema.yaml")
+from study_manifest import StudyManifest, code_version
+from run_metrics import RunMetrics
+from run_profile import profile_option
 
 
 @click.command()
 @click.argument('cache_id')
-def repertoire_transform(cache_id):
+@click.option('--force', is_flag=True, help='Transform the study even if its inputs and code are unchanged.')
+@profile_option(lambda cache_id, **kwargs: f'{ADC_TRANSFORM_DATA}/adc_profile/{cache_id}/repertoire')
+def repertoire_transform(cache_id, force):
     """Transform ADC repertoire metadata to AK objects."""
 
+    check_env('ADC_IMPORT_DATA', 'ADC_TRANSFORM_DATA')
+
     if cache_id not in cache_list:
         print(f"Given cache id: {cache_id} is not in the study list")
         sys.exit(1)
 
     study = cache_id
-    
-    container = transform_airr_repertoires(ADC_IMPORT_DATA + '/' + study + '/repertoires.airr.json', AIRRKnowledgeCommons())
+
+    # skip the study if nothing has changed since it was last transformed
+    manifest = StudyManifest(f'{ADC_TRANSFORM_DATA}/adc_manifest/{study}', 'repertoire')
+    manifest_inputs = [ ADC_IMPORT_DATA + '/' + study + '/repertoires.airr.json' ]
+    manifest_code = code_version('adc_repertoire_transform.py', ak_schema_file, ak_schema_view.version)
+    manifest_options = { 'compression': AK_OUTPUT_COMPRESSION, 'id_mode': AK_ID_MODE }
+    if not force and manifest.unchanged(manifest_inputs, manifest_code, manifest_options):
+        print(f'Study {study} is unchanged since its last repertoire transform, skipping (use --force to transform it again).')
+        return
+    manifest.invalidate()
+
+    metrics = RunMetrics('adc_repertoire_transform', study=study, compression=AK_OUTPUT_COMPRESSION)
+    container = transform_airr_repertoires(ADC_IMPORT_DATA + '/' + study + '/repertoires.airr.json', AIRRKnowledgeCommons(), study, metrics)
     
     # output data for just this study
     directory_name = f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}'
@@ -51,11 +71,20 @@ def repertoire_transform(cache_id):
             continue
         container_slot = ak_schema_view.get_slot(container_field)
         tname = container_slot.range
-        write_jsonl(container, container_field, f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}/{tname}.jsonl')
-        write_csv(container, container_field, f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}/{tname}.csv')
+        with metrics.stage('write jsonl', len(container[container_field])):
+            write_jsonl(container, container_field, f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}/{tname}.jsonl')
+        with metrics.stage('write csv', len(container[container_field])):
+            write_csv(container, container_field, f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}/{tname}.csv')
+        if len(container[container_field]) > 0:
+            metrics.count(container_field, len(container[container_field]))
 
     # CSV relationships
-    write_all_relationships(container, f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}/')
+    with metrics.stage('write relationships'):
+        write_all_relationships(container, f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}/')
+
+    manifest.save(manifest_inputs, manifest_code, manifest_options,
+                  [ f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}', f'{ADC_TRANSFORM_DATA}/adc_tsv/{study}' ])
+    metrics.save(f'{ADC_TRANSFORM_DATA}/adc_metrics/{study}/repertoire.json', 'repertoires')
 
 
 if __name__ == "__main__":
@@ -0,0 +1,141 @@
+#
+# Run the repertoire and chain transforms for many ADC studies
+# in one process pool, largest studies first.
+#
+
+import click
+import concurrent.futures
+import contextlib
+import glob
+import os
+import sys
+import traceback
+# ak_schema exports datetime.time, so import the timer by name
+from time import perf_counter
+
+from ak_schema_utils import *
+from adc_repertoire_transform import repertoire_transform
+from adc_chain_transform import receptor_integrate
+from run_profile import profile_kinds
+
+# study lists that can be given with --list
+study_lists = {
+    'all': cache_list,
+    'tcr': vdjserver_tcr_cache_list + ipa_tcr_cache_list,
+    'vdjserver_tcr': vdjserver_tcr_cache_list,
+    'vdjserver_ig': vdjserver_ig_cache_list,
+    'vdjserver_both': vdjserver_both_cache_list,
+    'ipa_tcr': ipa_tcr_cache_list,
+    'ipa_ig': ipa_ig_cache_list,
+    'ipa_both': ipa_both_cache_list,
+    'other': other_cache_list,
+    'test': test_cache_list,
+}
+
+
+def study_size(study):
+    """Total bytes of the study's rearrangement files, to estimate its run time."""
+    return sum([ os.path.getsize(f) for f in glob.glob(f'{ADC_IMPORT_DATA}/{study}/*.airr.tsv.gz') ])
+
+
+def transform_study(study, force, chain_options, log_dir, profile=None):
+    """Repertoire and chain transform for one study, output goes to its log file."""
+    times = { 'repertoire': None, 'chain': None }
+    error = None
+    log_file = f'{log_dir}/{study}.log'
+    with open(log_file, 'w') as log, contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            start = perf_counter()
+            repertoire_transform.callback(study, force=force, profile=profile)
+            times['repertoire'] = perf_counter() - start
+
+            start = perf_counter()
+            receptor_integrate.callback(study, force=force, profile=profile, **chain_options)
+            times['chain'] = perf_counter() - start
+        except SystemExit as e:
+            error = f'exit {e.code}'
+        except Exception as e:
+            traceback.print_exc()
+            error = repr(e)
+    return { 'study': study, 'times': times, 'error': error, 'log': log_file }
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return '-'
+    return f'{seconds:.1f}s'
+
+
+@click.command()
+@click.argument('cache_ids', nargs=-1)
+@click.option('--list', 'list_name', type=click.Choice(list(study_lists.keys())), default=None, help='Study list from ak_schema_utils, used when no cache ids are given.')
+@click.option('--workers', default=1, show_default=True, help='Number of studies to transform in parallel.')
+@click.option('--force', is_flag=True, help='Transform studies even if their inputs and code are unchanged.')
+@click.option('--stream', is_flag=True, help='Chain transform option, see adc_chain_transform.py.')
+@click.option('--columnar', is_flag=True, help='Chain transform option, see adc_chain_transform.py.')
+@click.option('--checkpoint', is_flag=True, help='Chain transform option, see adc_chain_transform.py.')
+@click.option('--parquet', is_flag=True, help='Chain transform option, see adc_chain_transform.py.')
+@click.option('--cell-index-dir', default=None, help='Chain transform option, see adc_chain_transform.py.')
+@click.option('--chain-workers', default=1, show_default=True, help='Repertoire processes per chain transform.')
+@click.option('--profile', type=click.Choice(profile_kinds), default=None, help='Profile each study transform, see run_profile.py.')
+def transform_all(cache_ids, list_name, workers, force, stream, columnar, checkpoint, parquet, cell_index_dir, chain_workers, profile):
+    """Transform ADC repertoires and rearrangements for many studies."""
+
+    check_env('ADC_IMPORT_DATA', 'ADC_TRANSFORM_DATA')
+
+    if len(cache_ids) == 0:
+        if list_name is None:
+            print('Give study cache ids or a --list.')
+            sys.exit(1)
+        cache_ids = study_lists[list_name]
+    for cache_id in cache_ids:
+        if cache_id not in cache_list:
+            print(f"Given cache id: {cache_id} is not in the study list")
+            sys.exit(1)
+
+    chain_options = {
+        'stream': stream,
+        'workers': chain_workers,
+        'columnar': columnar,
+        'cell_index_dir': cell_index_dir,
+        'checkpoint': checkpoint,
+        'parquet': parquet,
+    }
+    log_dir = f'{ADC_TRANSFORM_DATA}/adc_logs'
+    os.makedirs(log_dir, exist_ok=True)
+    os.makedirs(f'{ADC_TRANSFORM_DATA}/adc_jsonl', exist_ok=True)
+    os.makedirs(f'{ADC_TRANSFORM_DATA}/adc_tsv', exist_ok=True)
+
+    # longest processing time first, the pool takes studies in submission order
+    sizes = { study: study_size(study) for study in cache_ids }
+    studies = sorted(sizes.keys(), key=lambda s: sizes[s], reverse=True)
+    print(f'Transforming {len(studies)} studies with {workers} workers, logs in {log_dir}')
+
+    start = perf_counter()
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [ executor.submit(transform_study, study, force, chain_options, log_dir, profile) for study in studies ]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results[result['study']] = result
+            status = 'FAILED ' + result['error'] if result['error'] else 'done'
+            print(f"{len(results)}/{len(studies)} {result['study']}: {status}")
+    wall = perf_counter() - start
+
+    print()
+    print(f"{'study':40s} {'input MB':>10s} {'repertoire':>11s} {'chain':>11s}  status")
+    failed = 0
+    for study in studies:
+        result = results[study]
+        if result['error']:
+            failed += 1
+        print(f"{study:40s} {sizes[study] / 1e6:10.1f} {format_seconds(result['times']['repertoire']):>11s} {format_seconds(result['times']['chain']):>11s}  {result['error'] or 'ok'}")
+    total = sum([ t for r in results.values() for t in r['times'].values() if t is not None ])
+    print()
+    print(f'Wall time {format_seconds(wall)}, summed study time {format_seconds(total)}, {failed} failed')
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    transform_all()
@@ -3,48 +3,81 @@ import dataclasses
 import click
 import csv
 import json
-import airr
 import os
 import sys
 import gzip
 import hashlib
 import itertools
+import collections
+import functools
+import operator
+import concurrent.futures
 import uuid
-from dateutil import parser
 
-from linkml_runtime.utils.schemaview import SchemaView
 from linkml_runtime.linkml_model.meta import EnumDefinition, PermissibleValue, SchemaDefinition
 from linkml_runtime.dumpers import yaml_dumper, json_dumper, tsv_dumper
+from linkml_runtime.utils.enumerations import EnumDefinitionImpl
 from linkml_runtime.loaders import json_loader, yaml_loader
 
+# eager on purpose: the helpers build the schema classes and every script
+# imports ak_schema itself, see import_time_benchmark.py --after ak_schema
 from ak_schema import *
+from schema_facts import SchemaFacts
+from jsonl_merge import jsonl_key
+# ak_schema exports datetime.time, so import the timer by name
+from time import perf_counter
+
+# optional packages, imported when first needed, see check_zstd and check_parquet
+zstandard = None
+pyarrow = None
 
 # for access to linkml metadata for the AK schema
-ak_schema_view = SchemaView("ak-schema/project/linkml/ak_schema.yaml")
+# slot facts are cached, see schema_facts.py
+ak_schema_file = "ak-schema/project/linkml/ak_schema.yaml"
+ak_schema_view = SchemaFacts(ak_schema_file)
 
 # data import/export directories
 # set ak_data_dir from the environment variable AK_DATA_DIR if it exists
 ak_data_dir = os.environ.get('AK_DATA_DIR', '/ak_data')
 
+# these are checked when a command runs, see check_env
 ADC_IMPORT_DATA = os.environ.get('ADC_IMPORT_DATA')
-if not ADC_IMPORT_DATA:
-    print("ADC_IMPORT_DATA is not defined.")
-    sys.exit(1)
 ADC_TRANSFORM_DATA = os.environ.get('ADC_TRANSFORM_DATA')
-if not ADC_TRANSFORM_DATA:
-    print("ADC_TRANSFORM_DATA is not defined.")
-    sys.exit(1)
-
 IEDB_IMPORT_DATA = os.environ.get('IEDB_IMPORT_DATA')
-if not IEDB_IMPORT_DATA:
-    print("IEDB_IMPORT_DATA is not defined.")
-    
 IEDB_TRANSFORM_DATA = os.environ.get('IEDB_TRANSFORM_DATA')
-if not IEDB_TRANSFORM_DATA:
-    print("IEDB_TRANSFORM_DATA is not defined.")
 
 vdjbase_data_dir = ak_data_dir + '/vdjbase'
 
+# compression of the JSONL/CSV output files: none, gzip or zstd
+# the compression suffix (.gz or .zst) is added to the file names
+AK_OUTPUT_COMPRESSION = os.environ.get('AK_OUTPUT_COMPRESSION', 'none')
+AK_OUTPUT_COMPRESSION_LEVEL = os.environ.get('AK_OUTPUT_COMPRESSION_LEVEL') or None
+compression_suffix = { 'none': '', 'gzip': '.gz', 'zstd': '.zst' }
+compression_default_level = { 'gzip': 6, 'zstd': 3 }
+
+# AKC IDs made from a source key: deterministic, the same in every run,
+# or random, a new uuid4 each time, see akc_id
+AK_ID_MODE = os.environ.get('AK_ID_MODE', 'deterministic')
+id_modes = [ 'deterministic', 'random' ]
+
+def check_env(*names):
+    """Exit if any of the named environment variables is not set.
+
+    Commands call this when they start, so importing this module has no
+    requirements on the environment.
+    """
+    missing = [ name for name in names if not os.environ.get(name) ]
+    for name in missing:
+        print(f"{name} is not defined.")
+    if AK_OUTPUT_COMPRESSION not in compression_suffix:
+        print(f"Unknown AK_OUTPUT_COMPRESSION: {AK_OUTPUT_COMPRESSION}, should be one of {list(compression_suffix.keys())}")
+        missing.append('AK_OUTPUT_COMPRESSION')
+    if AK_ID_MODE not in id_modes:
+        print(f"Unknown AK_ID_MODE: {AK_ID_MODE}, should be one of {id_modes}")
+        missing.append('AK_ID_MODE')
+    if missing:
+        sys.exit(1)
+
 ak_load_dir = ak_data_dir + '/ak-data-load'
 
 # ADC study list
@@ -221,27 +254,123 @@ cache_list.extend(other_cache_list)
 #cache_list.extend(test_cache_list)
 
 
-curie_prefix_to_url = {curie.prefix: str(curie) for curie in globals().values() if isinstance(curie, CurieNamespace)}
-
-
-def akc_id():
-    """Returns a new AKC ID."""
+@functools.lru_cache(maxsize=None)
+def curie_prefixes():
+    """CURIE prefix to URL for the namespaces in ak_schema, built on first use."""
+    import ak_schema
+    return {curie.prefix: str(curie) for name, curie in vars(ak_schema).items() if not name.startswith('_') and isinstance(curie, CurieNamespace)}
+
+class CurieResolver:
+    """Finds the CURIE prefix of a URL.
+
+    The result is the same as trying each prefix in order with startswith,
+    also with http and https swapped, and taking the first that matches.
+    The URLs and their variants are kept in a character trie, so a URL is
+    walked once instead of compared with every prefix, and matches are
+    cached as the same few hundred URLs come up over and over.
+    """
+
+    def __init__(self, prefixes, cache_size=100000):
+        self.entries = list(prefixes.items())
+        self.trie = {}
+        for order, (prefix, url) in enumerate(self.entries):
+            for variant in [ url, url.replace("https", "http", 1), url.replace("http", "https", 1) ]:
+                node = self.trie
+                for c in variant:
+                    node = node.setdefault(c, {})
+                # None marks the end of a URL, with the entries it matches
+                # and whether the URL itself ends here rather than a variant
+                ends = node.setdefault(None, {})
+                ends[order] = ends.get(order, False) or variant == url
+        self.match = functools.lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, url, variants=True):
+        """(prefix, URL) of the first entry that url starts with, or None.
+
+        Without variants only the URLs themselves count, not the
+        http/https swapped ones.
+        """
+        best = None
+        node = self.trie
+        i = 0
+        while node is not None:
+            ends = node.get(None)
+            if ends is not None:
+                for order, exact in ends.items():
+                    if (variants or exact) and (best is None or order < best):
+                        best = order
+            if i == len(url) or best == 0:
+                break
+            node = node.get(url[i])
+            i += 1
+        if best is None:
+            return None
+        return self.entries[best]
+
+@functools.lru_cache(maxsize=None)
+def curie_resolver():
+    """CurieResolver for curie_prefixes(), built on first use."""
+    return CurieResolver(curie_prefixes())
+
+def __getattr__(name):
+    # curie_prefix_to_url used to be built at import
+    if name == 'curie_prefix_to_url':
+        return curie_prefixes()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def parallel_map(func, arg_list, workers):
+    """Call func(*args) for each args in a process pool, yielding results in order.
+
+    Only a few tasks are kept in flight beyond the number of workers, so
+    results that finish early do not pile up in memory.
+    """
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque()
+        for args in arg_list:
+            pending.append(executor.submit(func, *args))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+# namespace of the deterministic AKC IDs, do not change it
+akc_id_namespace = uuid.uuid5(uuid.NAMESPACE_URL, 'http://airr-knowledge.org/akc/')
+
+def akc_id(*key):
+    """Returns a new AKC ID.
+
+    The key names the source object, such as ('IEDB', assay_id, 'specimen'),
+    and must be unique among the objects a transform makes. The ID is then a
+    uuid5 of the key, so a transform makes the same IDs in every run and in
+    any worker process. Without a key, or when AK_ID_MODE is random, the ID
+    is a random uuid4.
+    """
+    if key and AK_ID_MODE == 'deterministic':
+        return 'AKC:' + str(uuid.uuid5(akc_id_namespace, json.dumps(key, default=str)))
     return 'AKC:' + str(uuid.uuid4())
 
 def url_to_curie(input, verbose=False):
     """Convert a URL to a CURIE."""
     if input is None:
         return input
-    for prefix, url in curie_prefix_to_url.items():
-        if (input.startswith(url) or
-                input.startswith(url.replace("https", "http", 1)) or
-                input.startswith(url.replace("http", "https", 1))):
-            return input.replace(url, prefix + ':')
+    match = curie_resolver().match(input)
+    if match is not None:
+        prefix, url = match
+        return input.replace(url, prefix + ':')
 
     if verbose:
         print(f"Cannot convert {input} to curie: URL prefix unknown")
     return input
 
+def url_to_curie_batch(urls):
+    """url_to_curie for a column of URLs, each distinct URL is converted once."""
+    curies = {}
+    for url in urls:
+        if url not in curies:
+            curies[url] = url_to_curie(url)
+    return [ curies[url] for url in urls ]
+
 def adc_ontology(field):
     if field is None:
         return None
@@ -251,13 +380,45 @@ def adc_ontology(field):
         else:
             return None
 
+# Bounded cache of sequence hashes, shared by seq_hash, seq_hash_id and
+# junction_aa_vj_hash. Bulk repertoires repeat the same sequences many times.
+# The keys are whole uppercased sequences, about 650 bytes an entry for a
+# 450 nt sequence, so the default of 65536 entries is about 40 MB. Each
+# worker process has its own cache, so the total is that times --workers,
+# and times the studies adc_transform_all runs at once. AK_HASH_CACHE_SIZE=0
+# turns the cache off.
+hash_cache_size = int(os.environ.get('AK_HASH_CACHE_SIZE', 65536))
+
+@functools.lru_cache(maxsize=hash_cache_size)
+def _sha256(value):
+    return hashlib.sha256(value.encode('ascii')).hexdigest()
+
+def hash_cache_info():
+    """Return the hits, misses and size of the sequence hash cache."""
+    return _sha256.cache_info()
+
+# Time this process has spent in the batch hash functions, and the number
+# of sequences they hashed, for the hash stage of the transform metrics.
+# Each batch is timed once, the single value hash functions are not timed.
+_hash_seconds = 0.0
+_hash_count = 0
+
+def hash_time():
+    """Seconds spent in the batch hash functions so far, and the number of sequences hashed."""
+    return (_hash_seconds, _hash_count)
+
+def add_hash_time(metrics, since):
+    """Add the batch hashing since hash_time() returned since to the hash stage of metrics, returns its seconds."""
+    seconds = _hash_seconds - since[0]
+    metrics.add_time('hash', seconds, _hash_count - since[1])
+    return seconds
+
 def seq_hash(sequence):
     # canonicalize it, uppercase
     seq = sequence.upper()
     # TODO: check alphabet?
     # hash implies exact sequence match, most stringent
-    h = hashlib.sha256(seq.encode('ascii')).hexdigest()
-    return h
+    return _sha256(seq)
 
 def seq_hash_id(species, sequence):
     if species is None:
@@ -273,35 +434,191 @@ def junction_aa_vj_hash(junction_aa, v, j):
     c = junction_aa.upper() + '|' + v.upper() + '|' + j.upper()
     # TODO: check alphabet, gene names?
     # hash implies exact sequence match, most stringent
-    h = hashlib.sha256(c.encode('ascii')).hexdigest()
-    return h
+    return _sha256(c)
+
+def seq_hash_batch(sequences):
+    """Hash a column of sequences, None stays None.
+
+    Each distinct sequence is hashed once, so repeated clonotypes cost a
+    single digest.
+    """
+    global _hash_seconds, _hash_count
+    start = perf_counter()
+    hashes = {}
+    for sequence in sequences:
+        if sequence is not None and sequence not in hashes:
+            hashes[sequence] = seq_hash(sequence)
+    _hash_seconds += perf_counter() - start
+    _hash_count += len(hashes)
+    return [ None if sequence is None else hashes[sequence] for sequence in sequences ]
+
+def seq_hash_id_batch(species, sequences):
+    """Hash IDs for a column of sequences, species is a column or a single value."""
+    global _hash_seconds, _hash_count
+    start = perf_counter()
+    if species is None or isinstance(species, str):
+        species = itertools.repeat(species)
+    keys = [ None if sequence is None else (sp, sequence) for sp, sequence in zip(species, sequences) ]
+    hashes = {}
+    for key in keys:
+        if key is not None and key not in hashes:
+            hashes[key] = seq_hash_id(key[0], key[1])
+    _hash_seconds += perf_counter() - start
+    _hash_count += len(hashes)
+    return [ None if key is None else hashes[key] for key in keys ]
+
+def junction_aa_vj_hash_batch(keys):
+    """junction_aa_vj_hash for a column of (junction_aa, v, j), None stays None."""
+    global _hash_seconds, _hash_count
+    start = perf_counter()
+    hashes = {}
+    for key in keys:
+        if key is not None and key not in hashes:
+            hashes[key] = junction_aa_vj_hash(key[0], key[1], key[2])
+    _hash_seconds += perf_counter() - start
+    _hash_count += len(hashes)
+    return [ None if key is None else hashes[key] for key in keys ]
+
+def adc_chain_hashes_batch(species, rows):
+    """The sequence hashes of a batch of ADC rows for make_chain_record_from_adc.
+
+    Returns (nt_hash_id, aa_hash, junction_aa_vj_allele_hash) for each row,
+    nt_hash_id is None for rows without a sequence.
+    """
+    nt_hash_ids = seq_hash_id_batch(species, [ row['sequence'] for row in rows ])
+    aa_hashes = seq_hash_batch([ row['sequence_aa'] for row in rows ])
+    vj_hashes = junction_aa_vj_hash_batch([ (row['junction_aa'], row['v_call'], row['j_call'])
+                                            if row['junction_aa'] and row['v_call'] and row['j_call'] else None
+                                            for row in rows ])
+    return list(zip(nt_hash_ids, aa_hashes, vj_hashes))
+
+class ChainRecord:
+    """Compact stand-in for an ADC Chain, used while transforming.
+
+    Building a linkml Chain runs its type coercion, which is expensive in
+    the per-row loop, so records are only turned into Chain objects with
+    to_linkml when they are written.
+    """
+    __slots__ = ('akc_id', 'species', 'aa_hash', 'junction_aa_vj_allele_hash', 'complete_vdj',
+                 'sequence', 'sequence_aa', 'locus', 'junction_aa', 'v_call', 'j_call')
+    cls = Chain
+
+    def __init__(self, akc_id, species, aa_hash, junction_aa_vj_allele_hash, complete_vdj,
+                 sequence, sequence_aa, locus, junction_aa, v_call, j_call):
+        self.akc_id = akc_id
+        self.species = species
+        self.aa_hash = aa_hash
+        self.junction_aa_vj_allele_hash = junction_aa_vj_allele_hash
+        self.complete_vdj = complete_vdj
+        self.sequence = sequence
+        self.sequence_aa = sequence_aa
+        self.locus = locus
+        self.junction_aa = junction_aa
+        self.v_call = v_call
+        self.j_call = j_call
+
+    def to_linkml(self):
+        return Chain(
+            self.akc_id,
+            species = self.species,
+            aa_hash = self.aa_hash,
+            junction_aa_vj_allele_hash = self.junction_aa_vj_allele_hash,
+            complete_vdj = self.complete_vdj,
+            sequence = self.sequence,
+            sequence_aa = self.sequence_aa,
+            locus = LocusEnum(self.locus),
+            junction_aa = self.junction_aa,
+            v_call = self.v_call,
+            j_call = self.j_call,
+        )
+
+class ObjectRecord:
+    """Compact stand-in for a receptor or complex, see ChainRecord."""
+    __slots__ = ('cls', 'akc_id', 'values')
+
+    def __init__(self, cls, akc_id, values):
+        self.cls = cls
+        self.akc_id = akc_id
+        self.values = values
+
+    def __getattr__(self, name):
+        # slots are not set yet while unpickling
+        if name in ObjectRecord.__slots__:
+            raise AttributeError(name)
+        try:
+            return self.values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def to_linkml(self):
+        return self.cls(self.akc_id, **self.values)
+
+def new_object(cls, identifier, record=False, **values):
+    """Create a linkml object, or an ObjectRecord for it if record is True."""
+    if record:
+        return ObjectRecord(cls, identifier, values)
+    return cls(identifier, **values)
+
+def object_class(obj):
+    """The linkml class of an object or record."""
+    if isinstance(obj, (ChainRecord, ObjectRecord)):
+        return obj.cls
+    return type(obj)
+
+def to_linkml(obj):
+    """Turn a record into its linkml object, linkml objects are returned as is."""
+    if isinstance(obj, (ChainRecord, ObjectRecord)):
+        return obj.to_linkml()
+    return obj
+
+def materialize_records(container, container_fields):
+    """Replace records in the container with linkml objects, before writing."""
+    for container_field in container_fields:
+        objs = container[container_field]
+        for key in objs:
+            objs[key] = to_linkml(objs[key])
 
 def make_chain_from_adc(species, obj):
+    chain = make_chain_record_from_adc(species, obj)
+    if chain is None:
+        return None
+    return chain.to_linkml()
+
+def make_chain_record_from_adc(species, obj, hashes=None):
     if obj['locus'] not in [ 'TRB', 'TRA', 'TRD', 'TRG', 'IGH', 'IGK', 'IGL' ]:
         print('unhandled locus:', obj['locus'])
         return None
 
-    # calculate exact match hashes
-    # exact nucleotide sequence match, most stringent
-    if obj['sequence'] is None:
-        nt_hash_id = akc_id()
+    if hashes is not None:
+        # already made for a batch of rows, see adc_chain_hashes_batch
+        nt_hash_id, aa_hash, junction_aa_vj_allele_hash = hashes
     else:
-        nt_hash_id = seq_hash_id(species, obj['sequence'])
+        # calculate exact match hashes
+        # exact nucleotide sequence match, most stringent
+        if obj['sequence'] is None:
+            nt_hash_id = None
+        else:
+            nt_hash_id = seq_hash_id(species, obj['sequence'])
 
-    # exact aa sequence match
-    if obj['sequence_aa'] is None:
-        aa_hash = None
-    else:
-        aa_hash = seq_hash(obj['sequence_aa'])
+        # exact aa sequence match
+        if obj['sequence_aa'] is None:
+            aa_hash = None
+        else:
+            aa_hash = seq_hash(obj['sequence_aa'])
 
-    # exact CDR3 aa sequence and V and J alleles
-    if obj['junction_aa'] and obj['v_call'] and obj['j_call']:
-        junction_aa_vj_allele_hash = junction_aa_vj_hash(obj['junction_aa'], obj['v_call'], obj['j_call'])
-    else:
-        junction_aa_vj_allele_hash = None
-    #junction_aa_vj_gene_hash = junction_aa_vj_hash(obj['junction_aa'], obj['v_gene'], obj['j_gene'])
+        # exact CDR3 aa sequence and V and J alleles
+        if obj['junction_aa'] and obj['v_call'] and obj['j_call']:
+            junction_aa_vj_allele_hash = junction_aa_vj_hash(obj['junction_aa'], obj['v_call'], obj['j_call'])
+        else:
+            junction_aa_vj_allele_hash = None
+        #junction_aa_vj_gene_hash = junction_aa_vj_hash(obj['junction_aa'], obj['v_gene'], obj['j_gene'])
+
+    if nt_hash_id is None:
+        # no sequence to hash, the ID comes from the other chain fields
+        nt_hash_id = akc_id('Chain', species, obj['sequence_aa'], obj['locus'], obj['junction_aa'],
+                            obj['v_call'], obj['j_call'], obj['complete_vdj'])
 
-    chain = Chain(
+    chain = ChainRecord(
         f'{nt_hash_id}',
         species = species,
         aa_hash = aa_hash,
@@ -310,7 +627,7 @@ def make_chain_from_adc(species, obj):
         complete_vdj = obj['complete_vdj'],
         sequence = obj['sequence'],
         sequence_aa = obj['sequence_aa'],
-        locus = LocusEnum(obj['locus']),
+        locus = obj['locus'],
         junction_aa = obj['junction_aa'],
         v_call = obj['v_call'],
         j_call = obj['j_call'],
@@ -325,6 +642,21 @@ chain_types = {
 }
 
 
+def iedb_chain_id(group_iri, chain_name, species, sequence_aa, locus, junction_aa, v_call, d_call, j_call, cdr1_aa, cdr2_aa, cdr3_aa):
+    """ID of an IEDB chain without a nucleotide sequence.
+
+    The receptor group IRI and chain name give each TCR row its own
+    chains, as random IDs did. The chain fields are in the key too, for
+    rows without a group IRI, so chains that differ in any field, such as
+    a CDR3 that is not a junction, are never merged.
+    """
+    if type(group_iri) is not str:
+        group_iri = None
+    if type(sequence_aa) is not str:
+        sequence_aa = None
+    return akc_id('IEDB', group_iri, chain_name, species, sequence_aa, locus, junction_aa, v_call, d_call, j_call,
+                  cdr1_aa, cdr2_aa, cdr3_aa)
+
 def safe_get_field(chain, fields, expected_type=str):
     for field in fields:
         if type(chain[field]) is expected_type:
@@ -352,7 +684,14 @@ def make_chain_from_iedb(row, chain_name):
     if type(chain['Nucleotide Sequence']) is str:
         nt_hash_id = seq_hash_id(species, chain['Nucleotide Sequence'])
     else: # None/nan
-        nt_hash_id = akc_id()
+        nt_hash_id = iedb_chain_id(row[('Receptor', 'Group IRI')], chain_name, species, chain['Protein Sequence'],
+                                   chain_types[chain['Type']], junction_aa,
+                                   safe_get_field(chain, ["Calculated V Gene", "Curated V Gene"]),
+                                   safe_get_field(chain, ["Calculated D Gene", "Curated D Gene"]),
+                                   safe_get_field(chain, ["Calculated J Gene", "Curated J Gene"]),
+                                   safe_get_field(chain, ["CDR1 Calculated", "CDR1 Curated"]),
+                                   safe_get_field(chain, ["CDR2 Calculated", "CDR2 Curated"]),
+                                   safe_get_field(chain, ["CDR3 Calculated", "CDR3 Curated"]))
 
     # exact aa sequence match
     if type(chain['Protein Sequence']) is str:
@@ -397,7 +736,90 @@ def make_chain_from_iedb(row, chain_name):
 
     return c
 
-def make_receptor(container, chains):
+def column_values(values):
+    """The values of a DataFrame column as a list, None for missing values.
+
+    Categorical columns are only turned into objects here, as they are read.
+    """
+    return values.astype(object).where(values.notna(), None).tolist()
+
+def first_of_type(columns, expected_type=str):
+    """safe_get_field for whole columns, the first value of the type in each row."""
+    values = []
+    for row in zip(*columns):
+        for value in row:
+            if type(value) is expected_type:
+                values.append(value)
+                break
+        else:
+            values.append(None)
+    return values
+
+def make_chains_from_iedb(tcr_df, chain_name):
+    '''Chains for a chain name ("Chain 1" or "Chain 2") of all rows of the IEDB
+    TCR export, the same as make_chain_from_iedb for each row.
+    Rows without a chain type get None.
+
+    The values are worked out a column at a time, so the two level column
+    index is looked up once per column instead of once per row and field.'''
+
+    df = tcr_df[chain_name]
+    types = column_values(df['Type'])
+    rows = [ i for i, t in enumerate(types) if t ]
+
+    def column(field):
+        values = column_values(df[field])
+        return [ values[i] for i in rows ]
+
+    species = url_to_curie_batch(column('Organism IRI'))
+    group_iris = column_values(tcr_df[('Receptor', 'Group IRI')])
+
+    # prefer Calculated columns to Curated columns
+    cdr3 = [ calculated or curated for calculated, curated in zip(column('CDR3 Calculated'), column('CDR3 Curated')) ]
+    junction_aa = [ c if c and c.startswith('C') and (c.endswith('F') or c.endswith('W')) else None for c in cdr3 ]
+    v_call = first_of_type([ column('Calculated V Gene'), column('Curated V Gene') ])
+    d_call = first_of_type([ column('Calculated D Gene'), column('Curated D Gene') ])
+    j_call = first_of_type([ column('Calculated J Gene'), column('Curated J Gene') ])
+    cdr1_aa = first_of_type([ column('CDR1 Calculated'), column('CDR1 Curated') ])
+    cdr2_aa = first_of_type([ column('CDR2 Calculated'), column('CDR2 Curated') ])
+    cdr3_aa = first_of_type([ column('CDR3 Calculated'), column('CDR3 Curated') ])
+
+    # exact match hashes, rows without a nucleotide sequence get an AKC ID
+    sequence = column('Nucleotide Sequence')
+    sequence_aa = column('Protein Sequence')
+    nt_hash_ids = seq_hash_id_batch(species, [ s if type(s) is str else None for s in sequence ])
+    aa_hashes = seq_hash_batch([ s if type(s) is str else None for s in sequence_aa ])
+    vj_hashes = [ junction_aa_vj_hash(junction, v, j) if junction and v and j else None
+                  for junction, v, j in zip(junction_aa, v_call, j_call) ]
+
+    chains = [ None ] * len(types)
+    for n, i in enumerate(rows):
+        nt_hash_id = nt_hash_ids[n]
+        if nt_hash_id is None:
+            nt_hash_id = iedb_chain_id(group_iris[i], chain_name, species[n], sequence_aa[n], chain_types[types[i]],
+                                       junction_aa[n], v_call[n], d_call[n], j_call[n], cdr1_aa[n], cdr2_aa[n], cdr3_aa[n])
+        c = Chain(
+            nt_hash_id,
+            species = species[n],
+            aa_hash = aa_hashes[n],
+            sequence = sequence[n],
+            sequence_aa = sequence_aa[n],
+            locus = chain_types[types[i]],
+            v_call = v_call[n],
+            d_call = d_call[n],
+            j_call = j_call[n],
+            junction_aa = junction_aa[n],
+            cdr1_aa = cdr1_aa[n],
+            cdr2_aa = cdr2_aa[n],
+            cdr3_aa = cdr3_aa[n],
+            # the CDR start and end positions are not set, safe_get_int_field
+            # returns None in make_chain_from_iedb
+        )
+        c['junction_aa_vj_allele_hash'] = vj_hashes[n]
+        chains[i] = c
+    return chains
+
+def make_receptor(container, chains, record=False):
 
     if len(chains) != 2:
         print('ERROR: make_receptor assumes only 2 chains.')
@@ -458,40 +880,40 @@ def make_receptor(container, chains):
     # hash order: alpha/beta, gamma/delta
     if tra_chain or trb_chain:
         if tra_chain is None:
-            receptor = AlphaBetaTCR(
-                "AKC_RECEPTOR:" + seq_hash(trb_chain.akc_id),
+            receptor = new_object(
+                AlphaBetaTCR, "AKC_RECEPTOR:" + seq_hash(trb_chain.akc_id), record,
                 trb_chain=trb_chain.akc_id
             )
             container.ab_tcell_receptors[receptor.akc_id] = receptor
         elif trb_chain is None:
-            receptor = AlphaBetaTCR(
-                "AKC_RECEPTOR:" + seq_hash(tra_chain.akc_id),
+            receptor = new_object(
+                AlphaBetaTCR, "AKC_RECEPTOR:" + seq_hash(tra_chain.akc_id), record,
                 tra_chain=tra_chain.akc_id
             )
             container.ab_tcell_receptors[receptor.akc_id] = receptor
         else:
-            receptor = AlphaBetaTCR(
-                "AKC_RECEPTOR:" + seq_hash(tra_chain.akc_id + trb_chain.akc_id),
+            receptor = new_object(
+                AlphaBetaTCR, "AKC_RECEPTOR:" + seq_hash(tra_chain.akc_id + trb_chain.akc_id), record,
                 tra_chain=tra_chain.akc_id,
                 trb_chain=trb_chain.akc_id
             )
             container.ab_tcell_receptors[receptor.akc_id] = receptor
     elif trg_chain or trd_chain:
         if trg_chain is None:
-            receptor = GammaDeltaTCR(
-                "AKC_RECEPTOR:" + seq_hash(trd_chain.akc_id),
+            receptor = new_object(
+                GammaDeltaTCR, "AKC_RECEPTOR:" + seq_hash(trd_chain.akc_id), record,
                 trd_chain=trd_chain.akc_id
             )
             container.gd_tcell_receptors[receptor.akc_id] = receptor
         elif trd_chain is None:
-            receptor = GammaDeltaTCR(
-                "AKC_RECEPTOR:" + seq_hash(trg_chain.akc_id),
+            receptor = new_object(
+                GammaDeltaTCR, "AKC_RECEPTOR:" + seq_hash(trg_chain.akc_id), record,
                 trg_chain=trg_chain.akc_id
             )
             container.gd_tcell_receptors[receptor.akc_id] = receptor
         else:
-            receptor = GammaDeltaTCR(
-                "AKC_RECEPTOR:" + seq_hash(trg_chain.akc_id + trd_chain.akc_id),
+            receptor = new_object(
+                GammaDeltaTCR, "AKC_RECEPTOR:" + seq_hash(trg_chain.akc_id + trd_chain.akc_id), record,
                 trg_chain=trg_chain.akc_id,
                 trd_chain=trd_chain.akc_id
             )
@@ -502,35 +924,35 @@ def make_receptor(container, chains):
     elif igh_chain or igk_chain or igl_chain:
         if igh_chain is None:
             if igl_chain is not None:
-                receptor = BCellReceptor(
-                    "AKC_RECEPTOR:" + seq_hash(igl_chain.akc_id),
+                receptor = new_object(
+                    BCellReceptor, "AKC_RECEPTOR:" + seq_hash(igl_chain.akc_id), record,
                     igl_chain=igl_chain.akc_id
                 )
                 container.bcell_receptors[receptor.akc_id] = receptor
             else:
-                receptor = BCellReceptor(
-                    "AKC_RECEPTOR:" + seq_hash(igk_chain.akc_id),
+                receptor = new_object(
+                    BCellReceptor, "AKC_RECEPTOR:" + seq_hash(igk_chain.akc_id), record,
                     igk_chain=igk_chain.akc_id
                 )
                 container.bcell_receptors[receptor.akc_id] = receptor
         else:
             if igl_chain is not None:
-                receptor = BCellReceptor(
-                    "AKC_RECEPTOR:" + seq_hash(igh_chain.akc_id + igl_chain.akc_id),
+                receptor = new_object(
+                    BCellReceptor, "AKC_RECEPTOR:" + seq_hash(igh_chain.akc_id + igl_chain.akc_id), record,
                     igh_chain=igh_chain.akc_id,
                     igl_chain=igl_chain.akc_id
                 )
                 container.bcell_receptors[receptor.akc_id] = receptor
             elif igk_chain is not None:
-                receptor = BCellReceptor(
-                    "AKC_RECEPTOR:" + seq_hash(igh_chain.akc_id + igk_chain.akc_id),
+                receptor = new_object(
+                    BCellReceptor, "AKC_RECEPTOR:" + seq_hash(igh_chain.akc_id + igk_chain.akc_id), record,
                     igh_chain=igh_chain.akc_id,
                     igk_chain=igk_chain.akc_id
                 )
                 container.bcell_receptors[receptor.akc_id] = receptor
             else:
-                receptor = BCellReceptor(
-                    "AKC_RECEPTOR:" + seq_hash(igh_chain.akc_id),
+                receptor = new_object(
+                    BCellReceptor, "AKC_RECEPTOR:" + seq_hash(igh_chain.akc_id), record,
                     igh_chain=igh_chain.akc_id
                 )
                 container.bcell_receptors[receptor.akc_id] = receptor
@@ -539,7 +961,7 @@ def make_receptor(container, chains):
 
     return receptor
 
-def make_complex(container, receptor, epitope, mhc):
+def make_complex(container, receptor, epitope, mhc, record=False):
     tcr_complex = None
     receptor_id = None
     if receptor:
@@ -551,10 +973,11 @@ def make_complex(container, receptor, epitope, mhc):
     if mhc:
         mhc_id = mhc.akc_id
     
-    if type(receptor) == AlphaBetaTCR:
-        tcr_complex = TCRpMHCComplex(akc_id(), tcr=receptor_id, epitope=epitope_id, mhc=mhc_id)
-    elif type(receptor) == GammaDeltaTCR:
-        tcr_complex = TCRpMHCComplex(akc_id(), tcr=receptor_id, epitope=epitope_id, mhc=mhc_id)
+    # the same receptor, epitope and MHC make the same complex
+    if object_class(receptor) == AlphaBetaTCR:
+        tcr_complex = new_object(TCRpMHCComplex, akc_id('TCRpMHCComplex', receptor_id, epitope_id, mhc_id), record, tcr=receptor_id, epitope=epitope_id, mhc=mhc_id)
+    elif object_class(receptor) == GammaDeltaTCR:
+        tcr_complex = new_object(TCRpMHCComplex, akc_id('TCRpMHCComplex', receptor_id, epitope_id, mhc_id), record, tcr=receptor_id, epitope=epitope_id, mhc=mhc_id)
 
     if tcr_complex:
         container.tcr_complex[tcr_complex.akc_id] = tcr_complex
@@ -586,10 +1009,14 @@ def check_three(chains):
         return [ 0, 0, 0, 1 ]
     return [ 0, 0, 0, 0]
 
+# AIRR TSV boolean values
+true_values = ['True', 'true', 'TRUE', 'T', 't', '1']
+false_values = ['False', 'false', 'FALSE', 'F', 'f', '0']
+
 def to_bool(value):
-    if value in ['True', 'true', 'TRUE', 'T', 't', '1']:
+    if value in true_values:
         return True
-    if value in ['False', 'false', 'FALSE', 'F', 'f', '0']:
+    if value in false_values:
         return False
     return None
 
@@ -601,60 +1028,273 @@ def to_int(value):
 def to_datetime(value):
     if value == '' or value is None:
         return None
+    from dateutil import parser
     return parser.isoparse(value)
 
+def jsonl_keys(filename, container_field, key_field='akc_id'):
+    """Identifiers of the objects in a JSONL file in file order, without decoding the objects."""
+    with open_input(filename) as f:
+        return [ jsonl_key(line, container_field, key_field) for line in f ]
+
+def jsonl_load_lines(filename, container_field, container_class, line_numbers):
+    """Decode the objects on the given lines of a JSONL file, line_numbers in increasing order."""
+    objs = []
+    if len(line_numbers) == 0:
+        return objs
+    wanted = iter(line_numbers)
+    n = next(wanted)
+    with open_input(filename) as f:
+        for i, line in enumerate(f):
+            if i == n:
+                objs.append(json_loader.load_any(json.loads(line)[container_field], container_class))
+                n = next(wanted, None)
+                if n is None:
+                    break
+    return objs
+
+def load_first_seen(container, container_field, container_class, files, key_field='akc_id', workers=1):
+    """Load JSONL files into the container, keeping the first object for each key.
+
+    Objects already in the container are kept. First only the keys are
+    read from all files, then only the lines with a key not seen in an
+    earlier file (or line) are decoded. With workers > 1, the files are
+    read in a process pool. Returns the number of duplicates per file.
+    """
+    def file_map(func, args):
+        if workers > 1:
+            return parallel_map(func, args, workers)
+        return (func(*a) for a in args)
+
+    objs = container[container_field]
+    seen = set(objs.keys())
+    line_numbers = []
+    duplicates = []
+    for keys in file_map(jsonl_keys, [ (f, container_field, key_field) for f in files ]):
+        lines = []
+        for i, key in enumerate(keys):
+            if key not in seen:
+                seen.add(key)
+                lines.append(i)
+        line_numbers.append(lines)
+        duplicates.append(len(keys) - len(lines))
+    seen = None
+
+    args = [ (f, container_field, container_class, lines) for f, lines in zip(files, line_numbers) ]
+    for loaded in file_map(jsonl_load_lines, args):
+        for y in loaded:
+            objs[getattr(y, key_field)] = y
+    return duplicates
+
 # load AKC json and put into provided container
-def load_akc_objects(container, container_field, container_class):
+def load_akc_objects(container, container_field, container_class, workers=1):
     container_slot = ak_schema_view.get_slot(container_field)
     tname = container_slot.range
-    for study in cache_list:
-        akc_file = f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}/{tname}.jsonl'
-        with open(akc_file, 'r') as f:
-            for line in f:
-                #print(line)
-                x = json.loads(line)
-                y = json_loader.load_any(x[container_field], container_class)
-                if container_field == 'references':
-                    if container[container_field].get(y.source_uri) is None:
-                        container[container_field][y.source_uri] = y
-                else:
-                    if container[container_field].get(y.akc_id) is None:
-                        container[container_field][y.akc_id] = y
+    files = [ f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}/{tname}.jsonl' for study in cache_list ]
+    if container_field == 'references':
+        load_first_seen(container, container_field, container_class, files, 'source_uri', workers)
+    else:
+        load_first_seen(container, container_field, container_class, files, 'akc_id', workers)
     
 # load up ADC objects from the transformed AKC json
-def load_adc_container(container):
+def load_adc_container(container, workers=1):
     # TODO: should just do a loop, but not sure how to get the class
-    load_akc_objects(container, 'investigations', Investigation)
-    load_akc_objects(container, 'references', Reference)
-    load_akc_objects(container, 'study_arms', StudyArm)
-    load_akc_objects(container, 'study_events', StudyEvent)
-    load_akc_objects(container, 'participants', Participant)
-    load_akc_objects(container, 'life_events', LifeEvent)
-    load_akc_objects(container, 'immune_exposures', ImmuneExposure)
-    load_akc_objects(container, 'specimens', Specimen)
-    #load_akc_objects(container, 'specimen_processings', CellIsolationProcessing)
-    load_akc_objects(container, 'assays', AIRRSequencingAssay)
-    load_akc_objects(container, 'sequence_data', AIRRSequencingData)
-
-def write_jsonl(container, container_field, outfile, exclude=None):
-    print(outfile)
-    with open(outfile, 'w') as f:
-        if type(container[container_field]) == list:
-            for obj in container[container_field]:
-                s = json.loads(json_dumper.dumps(obj))
-                doc = {}
-                doc[container_field] = s
-                f.write(json.dumps(doc))
-                f.write('\n')
+    load_akc_objects(container, 'investigations', Investigation, workers)
+    load_akc_objects(container, 'references', Reference, workers)
+    load_akc_objects(container, 'study_arms', StudyArm, workers)
+    load_akc_objects(container, 'study_events', StudyEvent, workers)
+    load_akc_objects(container, 'participants', Participant, workers)
+    load_akc_objects(container, 'life_events', LifeEvent, workers)
+    load_akc_objects(container, 'immune_exposures', ImmuneExposure, workers)
+    load_akc_objects(container, 'specimens', Specimen, workers)
+    #load_akc_objects(container, 'specimen_processings', CellIsolationProcessing, workers)
+    load_akc_objects(container, 'assays', AIRRSequencingAssay, workers)
+    load_akc_objects(container, 'sequence_data', AIRRSequencingData, workers)
+
+def output_filename(filename, compression=None):
+    """The file name with the suffix of the output compression added."""
+    if compression is None:
+        compression = AK_OUTPUT_COMPRESSION
+    return filename + compression_suffix[compression]
+
+def open_output(filename, compression=None, level=None):
+    """Open an output text file, compressing it with gzip or zstd.
+
+    filename should already have its suffix, see output_filename. The
+    versions of the file with the other suffixes, left by runs with another
+    compression, are removed so they are not read instead of this one.
+    """
+    if compression is None:
+        compression = AK_OUTPUT_COMPRESSION
+    remove_other_outputs(filename, compression)
+    if compression == 'none':
+        return open(filename, 'w', buffering=1 << 20)
+    if level is None:
+        level = AK_OUTPUT_COMPRESSION_LEVEL
+    if level is None:
+        level = compression_default_level[compression]
+    level = int(level)
+    if compression == 'gzip':
+        return gzip.open(filename, 'wt', compresslevel=level)
+    check_zstd()
+    return zstandard.open(filename, 'wt', cctx=zstandard.ZstdCompressor(level=level))
+
+def check_zstd():
+    """Import zstandard for zstd files, exits if it is not installed."""
+    global zstandard
+    if zstandard is None:
+        try:
+            import zstandard
+        except ImportError:
+            print("ERROR: zstd compression needs the zstandard package.")
+            sys.exit(1)
+
+def remove_other_outputs(filename, compression):
+    """Remove the versions of an output file with the other compression suffixes."""
+    suffix = compression_suffix[compression]
+    if not filename.endswith(suffix):
+        return
+    base = filename[:len(filename) - len(suffix)]
+    for other in compression_suffix.values():
+        if other != suffix and os.path.exists(base + other):
+            os.remove(base + other)
+
+def input_filename(filename):
+    """The file name, or its .gz or .zst version, exits if more than one exists."""
+    found = [ filename + suffix for suffix in compression_suffix.values() if os.path.exists(filename + suffix) ]
+    if len(found) > 1:
+        print(f"ERROR: more than one version of {filename} exists: {found}")
+        sys.exit(1)
+    if found:
+        return found[0]
+    return filename
+
+def open_input(filename):
+    """Open a text file for reading, decompressing gzip or zstd files.
+
+    The file, or its .gz or .zst version, is used, see input_filename,
+    and the compression is detected from the first bytes.
+    """
+    filename = input_filename(filename)
+    with open(filename, 'rb') as f:
+        magic = f.read(4)
+    if magic[:2] == b'\x1f\x8b':
+        return gzip.open(filename, 'rt')
+    if magic == b'\x28\xb5\x2f\xfd':
+        check_zstd()
+        return zstandard.open(filename, 'rt')
+    return open(filename, 'r')
+
+def jsonl_dumper_line(container_field, obj):
+    """Serialize one object as a JSONL line through json_dumper."""
+    s = json.loads(json_dumper.dumps(obj))
+    doc = {}
+    doc[container_field] = s
+    return json.dumps(doc) + '\n'
+
+# value types that json_dumper passes through unchanged
+jsonl_plain_types = (str, int, float, bool)
+
+# per value shape, whether the direct encoder matches json_dumper, checked
+# on the first object of each shape
+jsonl_direct_shapes = {}
+
+def jsonl_plain_dict(obj):
+    """Fields of an object as plain JSON values in a single pass.
+
+    Drops empty values and puts @type last like json_dumper. Returns the
+    document and its shape: the class and, for each field that is set, its
+    name, type, whether it is empty or false, and for lists the types of
+    their items. Returns None, None when a value needs the full json_dumper
+    treatment (nested objects, dates, decimals, ...).
+    """
+    doc = {}
+    shape = [ type(obj) ]
+    for name, value in obj.__dict__.items():
+        if value is None:
+            continue
+        if name.startswith('_'):
+            return None, None
+        t = type(value)
+        if t in jsonl_plain_types:
+            doc[name] = value
+            shape.append((name, t, not value))
+        elif isinstance(value, str):
+            doc[name] = str(value)
+            shape.append((name, t, not value))
+        elif isinstance(value, EnumDefinitionImpl):
+            doc[name] = value.code.text
+            shape.append((name, t))
+        elif t == list:
+            item_types = frozenset([ type(v) for v in value ])
+            shape.append((name, t, item_types))
+            if len(value) == 0:
+                continue
+            for item_type in item_types:
+                if item_type not in jsonl_plain_types:
+                    return None, None
+            doc[name] = value
         else:
-            for key in container[container_field]:
-                s = json.loads(json_dumper.dumps(container[container_field][key]))
-                doc = {}
-                doc[container_field] = s
-                f.write(json.dumps(doc))
-                f.write('\n')
-
-def write_csv(container, container_field, outfile):
+            return None, None
+    doc['@type'] = type(obj).__name__
+    return doc, tuple(shape)
+
+def jsonl_line(container_field, obj):
+    """Serialize one object as a JSONL line wrapped by its container field.
+
+    The direct encoder is used for objects of a shape whose first object
+    serialized the same as with json_dumper, see jsonl_plain_dict.
+    """
+    doc, shape = jsonl_plain_dict(obj)
+    if doc is None:
+        return jsonl_dumper_line(container_field, obj)
+    line = json.dumps({ container_field: doc }) + '\n'
+    direct = jsonl_direct_shapes.get(shape)
+    if direct is None:
+        direct = line == jsonl_dumper_line(container_field, obj)
+        jsonl_direct_shapes[shape] = direct
+    if direct:
+        return line
+    return jsonl_dumper_line(container_field, obj)
+
+def write_jsonl(container, container_field, outfile, exclude=None, compression=None, level=None):
+    outfile = output_filename(outfile, compression)
+    print(outfile)
+    if type(container[container_field]) == list:
+        objs = container[container_field]
+    else:
+        objs = container[container_field].values()
+    with open_output(outfile, compression, level) as f:
+        for obj in objs:
+            f.write(jsonl_line(container_field, obj))
+
+class CSVWriterPlan:
+    """CSV columns of a class, looked up in the schema once.
+
+    Multivalued slots are left out, they go in relationship files.
+    """
+
+    def __init__(self, cls):
+        fieldnames = [x.name for x in dataclasses.fields(cls)]
+        self.multivalued = set([ n for n in fieldnames if ak_schema_view.get_slot(n).multivalued == True ])
+        self.columns = [ n for n in fieldnames if n not in self.multivalued ]
+        self.getter = operator.attrgetter(*self.columns)
+
+    def row(self, obj):
+        """The CSV row of an object as a tuple."""
+        if len(self.columns) == 1:
+            return (self.getter(obj),)
+        return self.getter(obj)
+
+@functools.lru_cache(maxsize=None)
+def csv_writer_plan(cls):
+    return CSVWriterPlan(cls)
+
+def csv_fieldnames(obj):
+    """CSV columns for an object, multivalued slots go in relationship files."""
+    return csv_writer_plan(type(obj)).columns
+
+def write_csv(container, container_field, outfile, compression=None, level=None):
+    outfile = output_filename(outfile, compression)
     if type(container[container_field]) == list:
         rows = container[container_field]
     else:
@@ -663,27 +1303,19 @@ def write_csv(container, container_field, outfile):
         print(f"Skipping empty data for {container_field}")
         return
     print(f"Saving {container_field} into CSV file: {outfile}")
-    with open(outfile, 'w') as f:
-        fieldnames = [x.name for x in dataclasses.fields(rows[0])]
-#        print(fieldnames)
-#        [ print(ak_schema_view.get_slot(n)) for n in fieldnames ]
-        flatnames = [ n for n in fieldnames if ak_schema_view.get_slot(n).multivalued != True ]
-        #print(fieldnames)
-        #print(flatnames)
-        for fn in flatnames:
-            fn_slot = ak_schema_view.get_slot(fn)
-            #print(fn_slot)
-        w = csv.DictWriter(f, flatnames, lineterminator='\n', extrasaction='ignore')
-        w.writeheader()
-        for row in rows:
-            w.writerow(row.__dict__)
+    plan = csv_writer_plan(type(rows[0]))
+    with open_output(outfile, compression, level) as f:
+        w = csv.writer(f, lineterminator='\n')
+        w.writerow(plan.columns)
+        for i in range(0, len(rows), 10000):
+            w.writerows([ plan.row(row) for row in rows[i:i + 10000] ])
 
 # CSV relationships
 # we convert to lowercase because mixed case with SQL is a hassle
-def write_relationship_csv(class_name, class_obj, range_name, outpath, is_foreign=False):
-    outfile = f'{outpath}{class_name}_{range_name}.csv'
+def write_relationship_csv(class_name, class_obj, range_name, outpath, is_foreign=False, compression=None, level=None):
+    outfile = output_filename(f'{outpath}{class_name}_{range_name}.csv', compression)
     print(f"Saving relationship into CSV file: {outfile}")
-    with open(outfile, 'w') as f:
+    with open_output(outfile, compression, level) as f:
         if is_foreign:
             flatnames = [ class_name.lower() + '_akc_id', range_name.lower() + '_source_uri' ]
         else:
@@ -710,6 +1342,248 @@ def write_all_relationships(container, outpath):
     #write_relationship_csv('Assay', container.assays, 'tcell_receptors', outpath)
     #write_relationship_csv('Assay', container.assays, 'tcell_chains', outpath)
 
+# Parquet
+# rows are sorted on these columns so the row group statistics let readers skip data
+parquet_sort_columns = { 'chains': ['locus', 'v_call', 'junction_aa'] }
+parquet_row_group_size = 100000
+
+def check_parquet():
+    """Import pyarrow for Parquet output, exits if it is not installed."""
+    global pyarrow
+    if pyarrow is None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            print("ERROR: Parquet output needs the pyarrow package.")
+            sys.exit(1)
+
+def parquet_slot_type(slot):
+    """Arrow type for a linkml slot, anything not numeric or boolean is a string."""
+    t = pyarrow.string()
+    if slot.range in ak_schema_view.all_types():
+        ancestors = ak_schema_view.type_ancestors(slot.range)
+        if 'boolean' in ancestors:
+            t = pyarrow.bool_()
+        elif 'integer' in ancestors:
+            t = pyarrow.int64()
+        elif 'float' in ancestors or 'double' in ancestors or 'decimal' in ancestors:
+            t = pyarrow.float64()
+    if slot.multivalued:
+        t = pyarrow.list_(t)
+    return t
+
+def parquet_value(value, t):
+    if value is None:
+        return None
+    if pyarrow.types.is_list(t):
+        return [ parquet_value(v, t.value_type) for v in value ]
+    if pyarrow.types.is_boolean(t):
+        return bool(value)
+    if pyarrow.types.is_integer(t):
+        return int(value)
+    if pyarrow.types.is_floating(t):
+        return float(value)
+    if isinstance(value, EnumDefinitionImpl):
+        return value.code.text
+    return str(value)
+
+class ParquetWriterPlan:
+    """Arrow schema of a class, typed from its linkml slots once."""
+
+    def __init__(self, cls):
+        check_parquet()
+        self.columns = [x.name for x in dataclasses.fields(cls)]
+        self.schema = pyarrow.schema([ pyarrow.field(n, parquet_slot_type(ak_schema_view.induced_slot(n, cls.class_name)))
+                                       for n in self.columns ])
+
+    def table(self, rows, sort_columns=None):
+        data = {}
+        for field in self.schema:
+            data[field.name] = [ parquet_value(getattr(row, field.name), field.type) for row in rows ]
+        if sort_columns:
+            # nulls last
+            keys = [ data[n] for n in sort_columns ]
+            order = sorted(range(len(rows)), key=lambda i: [ (k[i] is None, k[i] or '') for k in keys ])
+            for n in data:
+                data[n] = [ data[n][i] for i in order ]
+        return pyarrow.Table.from_pydict(data, schema=self.schema)
+
+@functools.lru_cache(maxsize=None)
+def parquet_writer_plan(cls):
+    return ParquetWriterPlan(cls)
+
+def write_parquet(container, container_field, outfile):
+    check_parquet()
+    if type(container[container_field]) == list:
+        rows = container[container_field]
+    else:
+        rows = list(container[container_field].values())
+    if len(rows) < 1:
+        print(f"Skipping empty data for {container_field}")
+        return
+    print(f"Saving {container_field} into Parquet file: {outfile}")
+    plan = parquet_writer_plan(type(rows[0]))
+    table = plan.table(rows, parquet_sort_columns.get(container_field))
+    pyarrow.parquet.write_table(table, outfile, compression='zstd', row_group_size=parquet_row_group_size)
+
+def write_relationship_parquet(class_name, class_obj, range_name, outpath, is_foreign=False):
+    check_parquet()
+    outfile = f'{outpath}{class_name}_{range_name}.parquet'
+    print(f"Saving relationship into Parquet file: {outfile}")
+    if is_foreign:
+        flatnames = [ class_name.lower() + '_akc_id', range_name.lower() + '_source_uri' ]
+    else:
+        flatnames = [ class_name.lower() + '_akc_id', range_name.lower() + '_akc_id' ]
+    data = { flatnames[0]: [], flatnames[1]: [] }
+    for i_id in class_obj:
+        i = class_obj[i_id]
+        if hasattr(i, range_name):
+            for p in i[range_name]:
+                data[flatnames[0]].append(i.akc_id)
+                data[flatnames[1]].append(str(p))
+    schema = pyarrow.schema([ pyarrow.field(n, pyarrow.string()) for n in flatnames ])
+    pyarrow.parquet.write_table(pyarrow.Table.from_pydict(data, schema=schema), outfile, compression='zstd')
+
+
+class ParquetRowGroupWriter:
+    """Write objects to a Parquet file one row group at a time.
+
+    Each row group is sorted like write_parquet. The file is created when
+    the first row group is written, so no file is made for no objects.
+    """
+
+    def __init__(self, container_field, outfile):
+        check_parquet()
+        self.container_field = container_field
+        self.outfile = outfile
+        self.rows = []
+        self.writer = None
+
+    def write(self, obj):
+        self.rows.append(obj)
+        if len(self.rows) >= parquet_row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        plan = parquet_writer_plan(type(self.rows[0]))
+        if self.writer is None:
+            print(f"Streaming {self.container_field} into Parquet file: {self.outfile}")
+            self.writer = pyarrow.parquet.ParquetWriter(self.outfile, plan.schema, compression='zstd')
+        table = plan.table(self.rows, parquet_sort_columns.get(self.container_field))
+        self.writer.write_table(table, row_group_size=parquet_row_group_size)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class StreamingContainerWriter:
+    """Write container objects to JSONL/CSV as soon as they are first seen.
+
+    Objects are moved out of the container on each flush, so the container
+    stays small. Duplicates are dropped using a compact set of key digests,
+    the first object seen for a key is the one written. File names follow
+    the chain transform: {container_field}.jsonl and {range}.csv.
+
+    With a parquet_dir, objects are also written to {range}.parquet, one
+    row group at a time, each row group sorted like write_parquet.
+    """
+
+    def __init__(self, container, jsonl_dir, csv_dir, parquet_dir=None):
+        self.container_fields = [x.name for x in dataclasses.fields(container)]
+        self.jsonl_dir = jsonl_dir
+        self.csv_dir = csv_dir
+        self.parquet_dir = parquet_dir
+        self.parquet_writers = {}
+        self.jsonl_files = {}
+        self.csv_files = {}
+        self.csv_writers = {}
+        self.seen = {}
+        self.counts = {}
+        for container_field in self.container_fields:
+            self.seen[container_field] = set()
+            self.counts[container_field] = 0
+
+    def count(self, container_field):
+        return self.counts[container_field]
+
+    def _open(self, container_field, obj):
+        jsonl_file = output_filename(f'{self.jsonl_dir}/{container_field}.jsonl')
+        print(jsonl_file)
+        self.jsonl_files[container_field] = open_output(jsonl_file)
+
+        tname = ak_schema_view.get_slot(container_field).range
+        csv_file = output_filename(f'{self.csv_dir}/{tname}.csv')
+        print(f"Streaming {container_field} into CSV file: {csv_file}")
+        f = open_output(csv_file)
+        plan = csv_writer_plan(type(obj))
+        w = csv.writer(f, lineterminator='\n')
+        w.writerow(plan.columns)
+        self.csv_files[container_field] = f
+        self.csv_writers[container_field] = (w, plan)
+
+    def write(self, container_field, key, obj):
+        """Write the object unless its key has been written before."""
+        if key is not None:
+            digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+            if digest in self.seen[container_field]:
+                return False
+            self.seen[container_field].add(digest)
+        obj = to_linkml(obj)
+        if self.jsonl_files.get(container_field) is None:
+            self._open(container_field, obj)
+        self.jsonl_files[container_field].write(jsonl_line(container_field, obj))
+        w, plan = self.csv_writers[container_field]
+        w.writerow(plan.row(obj))
+        if self.parquet_dir:
+            if self.parquet_writers.get(container_field) is None:
+                tname = ak_schema_view.get_slot(container_field).range
+                self.parquet_writers[container_field] = ParquetRowGroupWriter(container_field, f'{self.parquet_dir}/{tname}.parquet')
+            self.parquet_writers[container_field].write(obj)
+        self.counts[container_field] += 1
+        return True
+
+    def flush(self, container, container_fields=None):
+        """Move objects out of the container and into the output files."""
+        if container_fields is None:
+            container_fields = self.container_fields
+        for container_field in container_fields:
+            objs = container[container_field]
+            if len(objs) == 0:
+                continue
+            if type(objs) == list:
+                for obj in objs:
+                    self.write(container_field, None, obj)
+                objs.clear()
+            else:
+                for key in objs:
+                    self.write(container_field, key, objs[key])
+                objs.clear()
+
+    def close(self):
+        # match write_jsonl, which creates a file even if there is no data,
+        # and write_csv, which skips empty data
+        for container_field in self.container_fields:
+            if self.jsonl_files.get(container_field) is None:
+                jsonl_file = output_filename(f'{self.jsonl_dir}/{container_field}.jsonl')
+                print(jsonl_file)
+                open_output(jsonl_file).close()
+            else:
+                self.jsonl_files[container_field].close()
+                self.csv_files[container_field].close()
+            if self.parquet_writers.get(container_field) is not None:
+                self.parquet_writers[container_field].close()
+        self.jsonl_files = {}
+        self.csv_files = {}
+        self.csv_writers = {}
+        self.parquet_writers = {}
+
 
 def load_chains(filename):
     return None
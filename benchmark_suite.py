@@ -0,0 +1,277 @@
+#
+# Benchmarks of the chain and IEDB transforms and of the output writers
+#
+# Input data is made with synthetic_data.py in the work directory, once
+# per scale. Each benchmark runs in a new process, so the peak RSS that is
+# reported is its own, and the transforms are imported only after the
+# data directories are set in the environment.
+#
+# python3 benchmark_suite.py --scales 10k,1M,10M
+#
+
+import click
+import concurrent.futures
+import contextlib
+import datetime
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import random
+from time import perf_counter
+
+import synthetic_data
+
+benchmarks = [ 'make_chain_from_adc', 'make_receptor', 'receptor_integrate', 'convert', 'write_jsonl', 'write_jsonl_dumper', 'write_csv' ]
+
+# the ADC study of each scale
+benchmark_study = 'synthetic_benchmark'
+
+
+def parse_scale(scale):
+    """Number of rows for a scale like 10000, 10k or 1M."""
+    scale = scale.strip()
+    multiplier = { 'k': 1000, 'm': 1000000 }.get(scale[-1:].lower())
+    if multiplier:
+        return int(float(scale[:-1]) * multiplier)
+    return int(scale)
+
+
+def prepare_data(work_dir, rows, kind, repertoires):
+    """Write the synthetic input for a scale, unless it is already there."""
+    data_dir = f'{work_dir}/data_{kind}_{rows}'
+    if os.path.exists(f'{data_dir}/complete'):
+        return data_dir
+    print(f'Generating {rows} rows of {kind} data in {data_dir}')
+    start = perf_counter()
+    shutil.rmtree(data_dir, ignore_errors=True)
+    rng = random.Random(1)
+    chains = synthetic_data.ChainGenerator(rng)
+    synthetic_data.write_adc_study(f'{data_dir}/adc_import', f'{data_dir}/adc_transform', benchmark_study, kind,
+                                   repertoires, max(1, rows // repertoires), rng, chains)
+    synthetic_data.write_iedb(f'{data_dir}/iedb', rows, 20, rng, chains)
+    open(f'{data_dir}/complete', 'w').close()
+    print(f'Generated in {perf_counter() - start:.1f}s')
+    return data_dir
+
+
+def adc_rows(data_dir):
+    """The filtered rearrangement rows of the study, by repertoire, as the chain transform reads them."""
+    import airr
+    from adc_chain_transform import read_rearrangements, repertoire_filename
+    data = airr.read_airr(f'{data_dir}/adc_import/{benchmark_study}/repertoires.airr.json')
+    for rep in data['Repertoire']:
+        counts = { 'rows': 0 }
+        species = rep['subject']['species']['id']
+        yield species, read_rearrangements(repertoire_filename(benchmark_study, rep), counts)
+
+
+def bench_make_chain_from_adc(data_dir, out_dir, options):
+    from ak_schema_utils import make_chain_from_adc
+    seconds = 0.0
+    items = 0
+    for species, rows in adc_rows(data_dir):
+        for row in rows:
+            start = perf_counter()
+            make_chain_from_adc(species, row)
+            seconds += perf_counter() - start
+            items += 1
+    return seconds, items
+
+
+def bench_make_receptor(data_dir, out_dir, options):
+    from ak_schema import AIRRKnowledgeCommons
+    from ak_schema_utils import make_chain_record_from_adc, make_receptor
+    container = AIRRKnowledgeCommons()
+    seconds = 0.0
+    items = 0
+    for species, rows in adc_rows(data_dir):
+        # the chains of a cell are next to each other in the synthetic files
+        pending = None
+        for row in rows:
+            chain = make_chain_record_from_adc(species, row)
+            if row['cell_id'] is None:
+                chains = [ chain, None ]
+            elif pending is not None and pending[0] == row['cell_id']:
+                chains = [ pending[1], chain ]
+                pending = None
+            else:
+                pending = (row['cell_id'], chain)
+                continue
+            start = perf_counter()
+            make_receptor(container, chains, record=True)
+            seconds += perf_counter() - start
+            items += 1
+    return seconds, items
+
+
+def bench_receptor_integrate(data_dir, out_dir, options):
+    import ak_schema_utils
+    from adc_chain_transform import receptor_integrate
+    ak_schema_utils.cache_list.append(benchmark_study)
+    for d in [ 'adc_jsonl', 'adc_tsv' ]:
+        os.makedirs(f'{out_dir}/{d}/{benchmark_study}', exist_ok=True)
+    shutil.copy(f'{data_dir}/adc_transform/adc_jsonl/{benchmark_study}/Assay.jsonl', f'{out_dir}/adc_jsonl/{benchmark_study}/Assay.jsonl')
+    start = perf_counter()
+    receptor_integrate.callback(benchmark_study, stream=options['stream'], workers=options['workers'], columnar=False,
+                                cell_index_dir=None, checkpoint=False, parquet=False, force=True)
+    seconds = perf_counter() - start
+    with open(f'{out_dir}/adc_metrics/{benchmark_study}/chain.json') as f:
+        items = json.load(f)['counters']['rows']
+    return seconds, items
+
+
+def bench_convert(data_dir, out_dir, options):
+    from iedb_transform import convert
+    for d in [ 'iedb_jsonl', 'iedb_tsv' ]:
+        os.makedirs(f'{out_dir}/{d}', exist_ok=True)
+    start = perf_counter()
+    convert.callback(f'{data_dir}/iedb/tcell_full_v3.tsv', f'{data_dir}/iedb/tcr_full_v3.tsv', None, False)
+    seconds = perf_counter() - start
+    with open(f'{out_dir}/iedb_metrics/convert.json') as f:
+        items = json.load(f)['counters']['tcr rows']
+    return seconds, items
+
+
+def chain_container(data_dir):
+    from ak_schema import AIRRKnowledgeCommons
+    from ak_schema_utils import make_chain_from_adc
+    container = AIRRKnowledgeCommons()
+    for species, rows in adc_rows(data_dir):
+        for row in rows:
+            chain = make_chain_from_adc(species, row)
+            container.chains[chain.akc_id] = chain
+    return container
+
+def bench_write_jsonl(data_dir, out_dir, options):
+    from ak_schema_utils import write_jsonl
+    container = chain_container(data_dir)
+    start = perf_counter()
+    write_jsonl(container, 'chains', f'{out_dir}/chains.jsonl')
+    return perf_counter() - start, len(container.chains)
+
+
+def bench_write_jsonl_dumper(data_dir, out_dir, options):
+    """write_jsonl through json_dumper for every object, the baseline of the direct encoder."""
+    from ak_schema_utils import jsonl_dumper_line
+    container = chain_container(data_dir)
+    start = perf_counter()
+    with open(f'{out_dir}/chains.jsonl', 'w') as f:
+        for obj in container.chains.values():
+            f.write(jsonl_dumper_line('chains', obj))
+    return perf_counter() - start, len(container.chains)
+
+
+def bench_write_csv(data_dir, out_dir, options):
+    from ak_schema_utils import write_csv
+    container = chain_container(data_dir)
+    start = perf_counter()
+    write_csv(container, 'chains', f'{out_dir}/Chain.csv')
+    return perf_counter() - start, len(container.chains)
+
+
+def run_benchmark(name, rows, data_dir, out_dir, options):
+    """Run one benchmark, in its own process."""
+    os.environ['ADC_IMPORT_DATA'] = f'{data_dir}/adc_import'
+    os.environ['ADC_TRANSFORM_DATA'] = out_dir
+    os.environ['IEDB_TRANSFORM_DATA'] = out_dir
+    from run_metrics import peak_rss_mb
+
+    os.makedirs(out_dir, exist_ok=True)
+    error = None
+    seconds = None
+    items = None
+    with open(f'{out_dir}/{name}.log', 'w') as log, contextlib.redirect_stdout(log):
+        try:
+            seconds, items = globals()['bench_' + name](data_dir, out_dir, options)
+        except Exception as e:
+            import traceback
+            traceback.print_exc(file=log)
+            error = repr(e)
+    result = {
+        'benchmark': name,
+        'rows': rows,
+        'items': items,
+        'seconds': round(seconds, 3) if seconds is not None else None,
+        'items_per_second': round(items / seconds, 1) if seconds else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'error': error,
+    }
+    return result
+
+
+def git_revision():
+    try:
+        p = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                           cwd=os.path.dirname(os.path.abspath(__file__)))
+        if p.returncode == 0:
+            return p.stdout.strip()
+    except OSError:
+        pass
+    return None
+
+
+@click.command()
+@click.option('--scales', default='10k', show_default=True, help='Comma separated row counts, like 10k,1M,10M.')
+@click.option('--benchmark', 'selected', multiple=True, type=click.Choice(benchmarks), help='Benchmark to run, can be repeated, default is all.')
+@click.option('--work-dir', default='benchmark_data', show_default=True, help='Directory for the generated data and the outputs.')
+@click.option('--study-kind', default='paired', show_default=True, type=click.Choice(synthetic_data.study_kinds), help='Kind of ADC study to generate.')
+@click.option('--repertoires', default=4, show_default=True, help='Repertoires in the ADC study.')
+@click.option('--stream', is_flag=True, help='Run receptor_integrate with --stream.')
+@click.option('--workers', default=1, show_default=True, help='Workers for receptor_integrate.')
+@click.option('--output', default=None, help='Results JSON file, default is benchmark_results.json in the work directory.')
+def benchmark(scales, selected, work_dir, study_kind, repertoires, stream, workers, output):
+    """Measure throughput and peak memory of the transforms on synthetic data."""
+    if not selected:
+        selected = benchmarks
+    if output is None:
+        output = f'{work_dir}/benchmark_results.json'
+    options = { 'stream': stream, 'workers': workers }
+
+    results = []
+    # a new process for each benchmark, nothing inherited from this one
+    context = multiprocessing.get_context('spawn')
+    for scale in scales.split(','):
+        rows = parse_scale(scale)
+        data_dir = prepare_data(work_dir, rows, study_kind, repertoires)
+        for name in selected:
+            out_dir = f'{work_dir}/out_{name}_{rows}'
+            shutil.rmtree(out_dir, ignore_errors=True)
+            print(f'Running {name} on {rows} rows')
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_benchmark, name, rows, data_dir, out_dir, options).result()
+            results.append(result)
+            if result['error']:
+                print(f"  FAILED {result['error']}, see {out_dir}/{name}.log")
+            else:
+                print(f"  {result['seconds']}s, {result['items_per_second']} items/s, peak RSS {result['peak_rss_mb']['self']} MB")
+
+    print()
+    print(f"{'benchmark':24s} {'rows':>10s} {'items':>10s} {'seconds':>10s} {'items/s':>12s} {'RSS MB':>10s}")
+    for r in results:
+        if r['error']:
+            print(f"{r['benchmark']:24s} {r['rows']:10d} {'failed':>10s}")
+            continue
+        print(f"{r['benchmark']:24s} {r['rows']:10d} {r['items']:10d} {r['seconds']:10.2f} {r['items_per_second']:12.1f} {r['peak_rss_mb']['self']:10.1f}")
+
+    report = {
+        'host': socket.gethostname(),
+        'python': sys.version.split()[0],
+        'revision': git_revision(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'options': { 'study_kind': study_kind, 'repertoires': repertoires, 'stream': stream, 'workers': workers },
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results saved to {output}')
+    if any([ r['error'] for r in results ]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    benchmark()
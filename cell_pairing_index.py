@@ -0,0 +1,75 @@
+import os
+import sqlite3
+import tempfile
+import itertools
+from collections import namedtuple
+
+# the parts of a chain that make_receptor needs to pair it
+ChainRef = namedtuple('ChainRef', ['akc_id', 'locus'])
+
+
+class CellPairingIndex:
+    """Chains grouped by cell_id, kept on disk in a SQLite file.
+
+    For IPA studies the chains of a cell are split across repertoires, so
+    they can only be paired once the whole study has been read. Only
+    (akc_id, locus) is stored per chain, and cells are read back in
+    cell_id order, with chains in the order they were added. The file is
+    removed by close, or at the end of a with block.
+    """
+
+    def __init__(self, directory=None, batch_size=10000):
+        fd, self.filename = tempfile.mkstemp(prefix='ak_cell_index_', suffix='.sqlite', dir=directory)
+        os.close(fd)
+        self.db = sqlite3.connect(self.filename)
+        # scratch data, no need for durability
+        self.db.execute('PRAGMA journal_mode = OFF')
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.execute('CREATE TABLE cell_chains (cell_id TEXT, seq INTEGER, akc_id TEXT, locus TEXT)')
+        self.batch_size = batch_size
+        self.pending = []
+        self.seq = 0
+        self.indexed = False
+
+    def add(self, cell_id, chain):
+        self.pending.append((cell_id, self.seq, chain.akc_id, str(chain.locus)))
+        self.seq += 1
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            self.db.executemany('INSERT INTO cell_chains VALUES (?, ?, ?, ?)', self.pending)
+            self.pending = []
+
+    def _index(self):
+        self._flush()
+        if not self.indexed:
+            self.db.execute('CREATE INDEX cell_chains_idx ON cell_chains (cell_id, seq)')
+            self.db.commit()
+            self.indexed = True
+
+    def __len__(self):
+        self._index()
+        return self.db.execute('SELECT COUNT(DISTINCT cell_id) FROM cell_chains').fetchone()[0]
+
+    def cells(self):
+        """Yield (cell_id, [ChainRef, ...]) in sorted cell_id order."""
+        self._index()
+        cursor = self.db.execute('SELECT cell_id, akc_id, locus FROM cell_chains ORDER BY cell_id, seq')
+        for cell_id, rows in itertools.groupby(cursor, key=lambda r: r[0]):
+            yield cell_id, [ ChainRef(r[1], r[2]) for r in rows ]
+
+    def close(self):
+        """Close and remove the index file, it can be called more than once."""
+        self.db.close()
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -7,26 +7,30 @@ import dataclasses
 import click
 import csv
 import json
+import numpy as np
 import pandas as pd
+import os
 import sys
 
-from linkml_runtime.utils.schemaview import SchemaView
-
 from linkml_runtime.linkml_model.meta import EnumDefinition, PermissibleValue, SchemaDefinition
 from linkml_runtime.dumpers import yaml_dumper, json_dumper, tsv_dumper
 from ak_schema import *
 from ak_schema_utils import *
+from run_metrics import RunMetrics
+from run_profile import profile_option
+# ak_schema exports datetime.time, so import the timer by name
+from time import perf_counter
 
 # todo the other thing is that it's putting in ontology labels instead of IDs, this should be a simple fix, use the field with ontology URI and then there's function that James wrote to convert it to ontology curie
 
-ak_schema_view = SchemaView("ak-schema/project/linkml/ak_schema.yaml")
 
 
-def id(input):  # todo same as ak_schema_utils??
-    """Convert a URL to an ID."""
-    for prefix, url in curie_prefix_to_url.items():
-        if input.startswith(url):
-            return input.replace(url, '')
+def id(input):
+    """Convert a URL to an ID, with the same prefixes as url_to_curie."""
+    match = curie_resolver().match(input, variants=False)
+    if match is not None:
+        prefix, url = match
+        return input.replace(url, '')
     return input
 
 def safe_get_assay_ids_per_tcr(tcr_df):
@@ -34,33 +38,170 @@ def safe_get_assay_ids_per_tcr(tcr_df):
     return tcr_df[("Assay", "IEDB IDs")].astype(str).str.split(', ')
 
 
-def get_tcr_df_for_assay(tcr_df, assay_id):
-    # Assay IDs are stored in a comma-separated list.
-    # This function splits that list, and checks for each tcr (row in tcr_df)
-    # if ANY of the reported assay ids match the assay_id of interest
-    assay_ids_per_tcr = safe_get_assay_ids_per_tcr(tcr_df)
-    tcr_df_for_assay = tcr_df[assay_ids_per_tcr.apply(lambda x: isinstance(x, list) and assay_id in x)]
+def assay_receptor_index(receptor_df):
+    """Index of (assay_id, row) pairs from the receptors of an IEDB export.
+
+    Assay IDs are stored in a comma-separated list for each receptor. The
+    lists are split once and exploded into a frame with one pair per assay
+    ID and receptor, the assay_id as an integer and row as the position of
+    the receptor in receptor_df, in row order. The TCR export uses it for
+    the assay filter and the assay to receptor maps, and so can other
+    receptor exports with the same ("Assay", "IEDB IDs") column.
+    """
+    index = pd.DataFrame({
+        'assay_id': safe_get_assay_ids_per_tcr(receptor_df).to_numpy(),
+        'row': range(len(receptor_df)),
+    }).explode('assay_id', ignore_index=True)
+    index['assay_id'] = index['assay_id'].str.strip().astype('int64')
+    index['row'] = index['row'].astype('int64')
+    return index
+
+
+def assay_ids_from_iris(iris):
+    """Integer assay IDs from a column of assay IRIs, NaN for anything else."""
+    return pd.to_numeric(iris.str.rsplit("/", n=1).str[-1], errors='coerce')
+
+
+def get_tcr_df_for_assay(tcr_df, assay_id, index):
+    # rows in tcr_df where ANY of the reported assay ids match the assay_id of interest
+    rows = index['row'][index['assay_id'] == int(assay_id)].unique()
+    tcr_df_for_assay = tcr_df.iloc[rows]
 
     return tcr_df_for_assay
 
 
-def read_double_header_df(path):
-    df = pd.read_csv(path, header=[0, 1], sep="\t", low_memory=False)
-    df = df.where(pd.notnull(df), None)
+# The columns of the exports that convert uses, and how they are read:
+# str for text, category for text with few distinct values, int for numbers.
+# Missing text is None, as convert expects, missing numbers are NaN.
+# Category columns stay categoricals in the frames, read them out with
+# column_values or objects_frame to get None for missing values.
+tcell_columns = {
+    ('Reference', 'IEDB IRI'): 'category',
+    ('Reference', 'PMID'): 'int',
+    ('Reference', 'Title'): 'category',
+    ('Reference', 'Authors'): 'category',
+    ('Reference', 'Journal'): 'category',
+    ('Reference', 'Date'): 'int',
+    ('Assay ID', 'IEDB IRI'): 'str',
+    ('Epitope', 'Name'): 'category',
+    ('Epitope', 'Molecule Parent IRI'): 'category',
+    ('Epitope', 'Source Organism IRI'): 'category',
+    ('1st in vivo Process', 'Process Type'): 'category',
+    ('1st in vivo Process', 'Disease IRI'): 'category',
+    ('1st in vivo Process', 'Disease Stage'): 'category',
+    ('1st immunogen', 'Source Organism IRI'): 'category',
+    ('Host', 'IRI'): 'category',
+    ('Host', 'Sex'): 'category',
+    ('Effector Cell', 'Source Tissue IRI'): 'category',
+    ('Assay', 'IRI'): 'category',
+    ('Assay', 'Qualitative Measurement'): 'category',
+    ('Assay', 'Location of Assay Data in Reference'): 'category',
+}
+
+tcr_columns = {
+    ('Receptor', 'Group IRI'): 'str',
+    ('Assay', 'IEDB IDs'): 'str',
+    ('Receptor', 'Type'): 'category',
+}
+for chain_name in [ 'Chain 1', 'Chain 2' ]:
+    tcr_columns.update({
+        (chain_name, 'Type'): 'category',
+        (chain_name, 'Organism IRI'): 'category',
+        (chain_name, 'Nucleotide Sequence'): 'str',
+        (chain_name, 'Protein Sequence'): 'str',
+        (chain_name, 'Calculated V Gene'): 'category',
+        (chain_name, 'Curated V Gene'): 'category',
+        (chain_name, 'Calculated D Gene'): 'category',
+        (chain_name, 'Curated D Gene'): 'category',
+        (chain_name, 'Calculated J Gene'): 'category',
+        (chain_name, 'Curated J Gene'): 'category',
+        (chain_name, 'CDR1 Calculated'): 'category',
+        (chain_name, 'CDR1 Curated'): 'category',
+        (chain_name, 'CDR2 Calculated'): 'category',
+        (chain_name, 'CDR2 Curated'): 'category',
+        (chain_name, 'CDR3 Calculated'): 'str',
+        (chain_name, 'CDR3 Curated'): 'str',
+    })
+
+
+# values read as missing, the same as the pandas read_csv defaults
+iedb_na_values = [ '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                   '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null' ]
+
+
+def read_double_header(path):
+    with open(path, newline='') as f:
+        reader = csv.reader(f, delimiter='\t')
+        return list(zip(next(reader), next(reader)))
+
+
+def read_double_header_df(path, columns):
+    """Read the given (group, field) columns of an IEDB export.
+
+    The export has a two line header. Only the columns that are used are
+    parsed, with pyarrow if it is installed. Repeated values are read as
+    categoricals and kept that way, str columns have None for missing
+    values.
+    """
+    header = read_double_header(path)
+    missing = [ c for c in columns if c not in header ]
+    if missing:
+        print(f"ERROR: {path} is missing the columns {missing}")
+        sys.exit(1)
+    # first occurrence of each column, in file order
+    positions = sorted(set([ header.index(c) for c in columns ]))
+
+    try:
+        import pyarrow
+        import pyarrow.csv
+    except ImportError:
+        pyarrow = None
+    if pyarrow is not None:
+        arrow_types = { 'str': pyarrow.string(), 'category': pyarrow.dictionary(pyarrow.int32(), pyarrow.string()), 'int': pyarrow.int64() }
+        table = pyarrow.csv.read_csv(path,
+            read_options=pyarrow.csv.ReadOptions(skip_rows=2, column_names=[ str(i) for i in range(len(header)) ]),
+            parse_options=pyarrow.csv.ParseOptions(delimiter='\t'),
+            convert_options=pyarrow.csv.ConvertOptions(
+                include_columns=[ str(i) for i in positions ],
+                column_types={ str(i): arrow_types[columns[header[i]]] for i in positions },
+                null_values=iedb_na_values, strings_can_be_null=True))
+        df = table.to_pandas()
+        del table
+    else:
+        pandas_types = { 'str': object, 'category': 'category', 'int': None }
+        dtype = { i: pandas_types[columns[header[i]]] for i in positions if pandas_types[columns[header[i]]] is not None }
+        df = pd.read_csv(path, sep="\t", header=None, skiprows=2, usecols=positions, dtype=dtype, low_memory=False,
+                         na_values=iedb_na_values, keep_default_na=False)
+    df.columns = pd.MultiIndex.from_tuples([ header[i] for i in positions ])
+
+    # None for missing text, column by column
+    for c in df.columns:
+        if columns[c] == 'str':
+            df[c] = df[c].where(df[c].notna(), None)
 
     return df
 
 
-def get_assay_ids_with_tcrs(tcr_df):
-    # nested list of all assay_ids per TCR,
-    assays_ids_per_tcr = safe_get_assay_ids_per_tcr(tcr_df).tolist()
+def objects_frame(df):
+    """A copy of df with the categorical columns as objects, None for missing values.
+
+    For rows that are read one at a time, after they have been filtered.
+    """
+    df = df.copy()
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype):
+            values = df[c].astype(object)
+            df[c] = values.where(values.notna(), None)
+    return df
 
-    # flat sorted list of all assay IDs of interest
-    return sorted(set([x.strip() for sublist in assays_ids_per_tcr for x in sublist]), key=int)
 
-def get_assay_df_rows_with_tcrs(assay_df, tcr_df):
-    assay_ids_of_interest = get_assay_ids_with_tcrs(tcr_df)
-    assay_ids_from_iri = assay_df["Assay ID"]["IEDB IRI"].str.rsplit("/", n=1).str[-1]
+def get_assay_ids_with_tcrs(index):
+    # sorted array of all assay IDs of interest
+    return np.sort(index['assay_id'].unique())
+
+def get_assay_df_rows_with_tcrs(assay_df, index):
+    assay_ids_of_interest = get_assay_ids_with_tcrs(index)
+    assay_ids_from_iri = assay_ids_from_iris(assay_df["Assay ID"]["IEDB IRI"])
 
     return assay_df[assay_ids_from_iri.isin(assay_ids_of_interest)].reset_index(drop=True)
 
@@ -71,16 +212,31 @@ def sex_to_curie(field):
 @click.argument('tcell_path')
 @click.argument('tcr_path')
 @click.argument('yaml_path')
-def convert(tcell_path, tcr_path, yaml_path):
+@click.option('--parquet', is_flag=True, help='Also write Parquet files, needs pyarrow.')
+@profile_option(lambda **kwargs: f'{IEDB_TRANSFORM_DATA}/iedb_profile/convert')
+def convert(tcell_path, tcr_path, yaml_path, parquet):
     """Convert an input TCell and TCR TSV file to YAML."""
 
+    check_env('IEDB_TRANSFORM_DATA')
+
+    if parquet:
+        check_parquet()
+
+    metrics = RunMetrics('iedb_transform', tcell_path=tcell_path, tcr_path=tcr_path, parquet=parquet, compression=AK_OUTPUT_COMPRESSION)
+
     print("Reading TCR export data files")
-    tcr_df = read_double_header_df(tcr_path)
-    assay_df = read_double_header_df(tcell_path)
+    with metrics.stage('read'):
+        tcr_df = read_double_header_df(tcr_path, tcr_columns)
+        assay_df = read_double_header_df(tcell_path, tcell_columns)
+    metrics.count('tcr rows', len(tcr_df))
+    metrics.count('tcell rows', len(assay_df))
 
     # many assays have no associated receptor data.
     # For now, subset assay table to include only assays with receptors
-    assay_df = get_assay_df_rows_with_tcrs(assay_df, tcr_df)
+    with metrics.stage('filter', len(assay_df)):
+        tcr_index = assay_receptor_index(tcr_df)
+        assay_df = get_assay_df_rows_with_tcrs(assay_df, tcr_index)
+    metrics.count('assays with TCRs', len(assay_df))
 
 
     # singleton container, initially empty
@@ -91,46 +247,49 @@ def convert(tcell_path, tcr_path, yaml_path):
     print('Processing receptors')
     assay_to_tcr = {}
     assay_to_chain = {}
-    for tcr_idx, tcr_row in tcr_df.iterrows():
-        #print(tcr_row)
-        tcr_curie = url_to_curie(
-            tcr_row['Receptor']['Group IRI'])  # todo tcr_curie doesn't seem to be stored anywhere?
-        assay_ids = str(tcr_row[("Assay", "IEDB IDs")]).split(', ')
-        chain_1 = None
-        chain_2 = None
-        if tcr_row[('Chain 1', 'Type')]:
-            chain_1 = make_chain_from_iedb(tcr_row, 'Chain 1')
+    start = perf_counter()
+    hash_start = hash_time()
+    # chains are built a column at a time, then the rows are walked as tuples
+    # todo tcr_curie from ('Receptor', 'Group IRI') doesn't seem to be stored anywhere?
+    chains_1 = make_chains_from_iedb(tcr_df, 'Chain 1')
+    chains_2 = make_chains_from_iedb(tcr_df, 'Chain 2')
+    tcrs = []
+    for receptor_type, chain_1, chain_2 in zip(column_values(tcr_df[('Receptor', 'Type')]), chains_1, chains_2):
+        tcr = None
+        if chain_1:
             container.chains[chain_1.akc_id] = chain_1
-            for aid in assay_ids:
-                if assay_to_chain.get(aid) is None:
-                    assay_to_chain[aid] = [ chain_1.akc_id ]
-                else:
-                    assay_to_chain[aid].append(chain_1.akc_id)
             #chains.append(chain_1)
-        if tcr_row[('Chain 2', 'Type')]:
-            chain_2 = make_chain_from_iedb(tcr_row, 'Chain 2')
+        if chain_2:
             container.chains[chain_2.akc_id] = chain_2
-            for aid in assay_ids:
-                if assay_to_chain.get(aid) is None:
-                    assay_to_chain[aid] = [ chain_2.akc_id ]
-                else:
-                    assay_to_chain[aid].append(chain_2.akc_id)
             #chains.append(chain_2)
 
         if chain_1 or chain_2:
             tcr = make_receptor(container, [chain_1, chain_2])
             if not tcr:
-                print(f"Unknown TCR type {tcr_row['Receptor']['Type']}")
-            else:
-                for aid in assay_ids:
-                    if assay_to_tcr.get(aid) is None:
-                        assay_to_tcr[aid] = [ tcr ]
-                    else:
-                        assay_to_tcr[aid].append(tcr)
-                    #tcell_receptors.append(tcr)
+                print(f"Unknown TCR type {receptor_type}")
         else:
-            print(f"No TCR chains available {tcr_row['Receptor']['Type']}")
+            print(f"No TCR chains available {receptor_type}")
+        tcrs.append(tcr)
+
+    # chains and receptors by integer assay ID, in receptor row order
+    for aid, row in zip(tcr_index['assay_id'].tolist(), tcr_index['row'].tolist()):
+        for chain in [ chains_1[row], chains_2[row] ]:
+            if chain:
+                if assay_to_chain.get(aid) is None:
+                    assay_to_chain[aid] = [ chain.akc_id ]
+                else:
+                    assay_to_chain[aid].append(chain.akc_id)
+        if tcrs[row]:
+            if assay_to_tcr.get(aid) is None:
+                assay_to_tcr[aid] = [ tcrs[row] ]
+            else:
+                assay_to_tcr[aid].append(tcrs[row])
+            #tcell_receptors.append(tcr)
+
 
+    # the batch sequence hashes of the chains are timed in the hash stage
+    hashed = add_hash_time(metrics, hash_start)
+    metrics.add_time('build chains and receptors', perf_counter() - start - hashed, len(tcr_df))
 
     #print(assay_to_tcr)
     print(f"{len(assay_to_tcr)} assay to TCR map entries")
@@ -155,14 +314,18 @@ def convert(tcell_path, tcr_path, yaml_path):
     current_reference = None
 
     print('Processing Tcell assays')
-    for assay_idx, assay_row in assay_df.iterrows():
+    start = perf_counter()
+    for assay_idx, assay_row in objects_frame(assay_df).iterrows():
         # todo deal with fields that can have multiple values (e.g. see assay_df["1st in vivo Process"]["Disease Stage"].unique()
 
         # todo clean up the way references are dealt with
+        assay_id = assay_row['Assay ID']['IEDB IRI'].split('/')[-1]
+
         if current_reference != assay_row['Reference']['PMID']:
             current_reference = assay_row['Reference']['PMID']
+            # a reference can come up again later in the file, as a new investigation
             investigation = Investigation(
-                akc_id(),
+                akc_id('IEDB', 'investigation', current_reference, assay_id),
                 name=assay_row['Reference']['Title'],
                 description=None
             )
@@ -183,22 +346,20 @@ def convert(tcell_path, tcr_path, yaml_path):
             container.references[reference.source_uri] = reference
             investigation.documents.append(reference.source_uri)
 
-        assay_id = assay_row['Assay ID']['IEDB IRI'].split('/')[-1]
-
         arm = StudyArm(
-            akc_id(),
+            akc_id('IEDB', assay_id, 'study arm'),
             name=f'arm 1 of {assay_id}',
             description=f'study arm for assay {assay_id}',
             investigation=investigation.akc_id
         )
         study_event = StudyEvent(
-            akc_id(),  # todo fill in name/description of this study event??
+            akc_id('IEDB', assay_id, 'study event'),  # todo fill in name/description of this study event??
             name=f'',
             description=f'',
             study_arms=[arm.akc_id]
         )
         participant = Participant(
-            akc_id(),
+            akc_id('IEDB', assay_id, 'participant'),
             name=f'participant 1 of {assay_id}',
             description=f'study participant for assay {assay_id}',
             species=url_to_curie(assay_row['Host']['IRI']),
@@ -210,7 +371,7 @@ def convert(tcell_path, tcr_path, yaml_path):
         )
         investigation.participants.append(participant.akc_id)
         life_event_1 = LifeEvent(
-            akc_id(),
+            akc_id('IEDB', assay_id, 'immune exposure event'),
             name=f'1st in vivo immune exposure event of assay {assay_id}',
             description=f'participant 1 of assay {assay_id} participated in this 1st in vivo immune exposure event',
             participant=participant.akc_id,
@@ -224,7 +385,7 @@ def convert(tcell_path, tcr_path, yaml_path):
             time_unit=None
         )
         life_event_2 = LifeEvent(
-            akc_id(),
+            akc_id('IEDB', assay_id, 'specimen collection event'),
             name=f'specimen collection event of assay {assay_id}',
             description=f'specimen 1 was collected from participant 1 of assay {assay_id} in this event',
             participant=participant.akc_id,
@@ -237,7 +398,7 @@ def convert(tcell_path, tcr_path, yaml_path):
             time_unit=None
         )
         immune_exposure = ImmuneExposure(
-            akc_id(),
+            akc_id('IEDB', assay_id, 'immune exposure'),
             name=f'details of 1st in vivo immune exposure event of assay {assay_id}',
             description=f'participant 1 of assay {assay_id} participated in this 1st in vivo immune exposure event, with these details',
             t0_event=life_event_1.akc_id,
@@ -249,14 +410,14 @@ def convert(tcell_path, tcr_path, yaml_path):
         )
         # assessment
         specimen = Specimen(
-            akc_id(),
+            akc_id('IEDB', assay_id, 'specimen'),
             name=f'specimen 1 of assay {assay_id}',
             description=f'specimen 1 from participant 1 of assay {assay_id}',
             life_event=life_event_2.akc_id,
             tissue=url_to_curie(assay_row['Effector Cell']['Source Tissue IRI'])
         )
         epitope = PeptidicEpitope(
-            akc_id(),
+            akc_id('IEDB', assay_id, 'epitope'),
             # curie(row['Epitope']['IEDB IRI']), # should store as ForeignObject
             sequence_aa=assay_row['Epitope']['Name'],
             source_protein=url_to_curie(assay_row['Epitope']['Molecule Parent IRI']),
@@ -269,14 +430,14 @@ def convert(tcell_path, tcr_path, yaml_path):
         tcell_receptors = []
 
         # get all tcrs
-        tcell_receptors = assay_to_tcr.get(assay_id)
+        tcell_receptors = assay_to_tcr.get(int(assay_id))
         if tcell_receptors is None:
             tcell_receptors = []
-        tcell_chains = assay_to_chain.get(assay_id)
+        tcell_chains = assay_to_chain.get(int(assay_id))
         if tcell_chains is None:
             tcell_chains = []
 
-#        for tcr_idx, tcr_row in get_tcr_df_for_assay(tcr_df, assay_id).iterrows():
+#        for tcr_idx, tcr_row in get_tcr_df_for_assay(tcr_df, assay_id, tcr_index).iterrows():
 #            tcr_curie = url_to_curie(
 #                tcr_row['Receptor']['Group IRI'])  # todo tcr_curie doesn't seem to be stored anywhere?
 #            chain_1 = None
@@ -299,7 +460,7 @@ def convert(tcell_path, tcr_path, yaml_path):
 #                # print("missing two chains")
 
         assay = TCellReceptorEpitopeBindingAssay(
-            akc_id(),
+            akc_id('IEDB', assay_id, 'assay'),
             name=f'assay {assay_id}',
             description=f'assay {assay_id} has specified input specimen 1',
             specimen=specimen.akc_id,
@@ -313,11 +474,11 @@ def convert(tcell_path, tcr_path, yaml_path):
         )
         investigation.assays.append(assay.akc_id)
         dataset = AKDataSet(
-            akc_id(),
+            akc_id('IEDB', assay_id, 'dataset'),
             data_items=assay.akc_id
         )
         conclusion = Conclusion(
-            akc_id(),
+            akc_id('IEDB', assay_id, 'conclusion'),
             name=f'conclusion 1 about assay {assay_id}',
             description=f'conclusion 1 about investigation {ref_id} was drawn from dataset 1 of assay {assay_id}',
             investigations=investigation.akc_id,
@@ -355,6 +516,8 @@ def convert(tcell_path, tcr_path, yaml_path):
         #if assay_idx == 1000:
         #    break
 
+    metrics.add_time('build assays', perf_counter() - start, row_cnt)
+
     # Write outputs
     container_fields = [x.name for x in dataclasses.fields(container)]
 
@@ -364,13 +527,29 @@ def convert(tcell_path, tcr_path, yaml_path):
     for container_field in container_fields:
         container_slot = ak_schema_view.get_slot(container_field)
         tname = container_slot.range
-        write_jsonl(container, container_field, f'{IEDB_TRANSFORM_DATA}/iedb_jsonl/{tname}.jsonl')
-        write_csv(container, container_field, f'{IEDB_TRANSFORM_DATA}/iedb_tsv/{tname}.csv')
+        with metrics.stage('write jsonl', len(container[container_field])):
+            write_jsonl(container, container_field, f'{IEDB_TRANSFORM_DATA}/iedb_jsonl/{tname}.jsonl')
+        with metrics.stage('write csv', len(container[container_field])):
+            write_csv(container, container_field, f'{IEDB_TRANSFORM_DATA}/iedb_tsv/{tname}.csv')
 
     # CSV relationships
-    write_all_relationships(container, f'{IEDB_TRANSFORM_DATA}/iedb_tsv/')
-    # assay relationships
-    write_relationship_csv('Assay', container.assays, 'tcell_receptors', f'{IEDB_TRANSFORM_DATA}/iedb_tsv/')
+    with metrics.stage('write relationships'):
+        write_all_relationships(container, f'{IEDB_TRANSFORM_DATA}/iedb_tsv/')
+        # assay relationships
+        write_relationship_csv('Assay', container.assays, 'tcell_receptors', f'{IEDB_TRANSFORM_DATA}/iedb_tsv/')
+
+    # Parquet, multivalued slots such as the relationships above are list columns
+    if parquet:
+        os.makedirs(f'{IEDB_TRANSFORM_DATA}/iedb_parquet', exist_ok=True)
+        for container_field in container_fields:
+            tname = ak_schema_view.get_slot(container_field).range
+            with metrics.stage('write parquet', len(container[container_field])):
+                write_parquet(container, container_field, f'{IEDB_TRANSFORM_DATA}/iedb_parquet/{tname}.parquet')
+
+    for container_field in container_fields:
+        if len(container[container_field]) > 0:
+            metrics.count(container_field, len(container[container_field]))
+    metrics.save(f'{IEDB_TRANSFORM_DATA}/iedb_metrics/convert.json', 'tcr rows')
 
 
 if __name__ == "__main__":
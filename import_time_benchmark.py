@@ -0,0 +1,89 @@
+#
+# Import time benchmark for ak_schema_utils
+#
+# Uses python -X importtime to measure the import, without the data
+# directory environment variables set, and fails if a module that should
+# be imported lazily shows up, or if the import takes too long.
+#
+# ak_schema itself stays an eager import of ak_schema_utils, its classes
+# are built by the helpers and every script imports it anyway. With
+# --after ak_schema, the schema and linkml_runtime are imported first and
+# only the cost that ak_schema_utils adds on top is measured.
+#
+
+import click
+import os
+import subprocess
+import sys
+
+# heavy modules that ak_schema_utils only imports when they are needed
+lazy_modules = ['airr', 'pandas', 'pyarrow', 'zstandard', 'dateutil']
+
+# environment variables that must not be needed to import
+env_names = ['ADC_IMPORT_DATA', 'ADC_TRANSFORM_DATA', 'IEDB_IMPORT_DATA', 'IEDB_TRANSFORM_DATA']
+
+
+def import_times(module, after=None):
+    """Run one import with -X importtime, returns {module: (self us, cumulative us)} in import order.
+
+    Modules imported by after are imported first and are not in the times.
+    """
+    env = { k: v for k, v in os.environ.items() if k not in env_names }
+    code = f'import {module}'
+    if after:
+        code = f'import {after}; ' + code
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                       env=env, capture_output=True, text=True)
+    if p.returncode != 0:
+        print(p.stdout)
+        print(p.stderr)
+        print(f'ERROR: import {module} failed')
+        sys.exit(1)
+    times = {}
+    for line in p.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        fields = line[len('import time:'):].split('|')
+        times[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    if after:
+        # drop the modules of the first import
+        names = list(times)
+        times = { name: times[name] for name in names[names.index(after) + 1:] }
+    return times
+
+
+@click.command()
+@click.option('--module', default='ak_schema_utils', show_default=True, help='Module to import.')
+@click.option('--repeat', default=5, show_default=True, help='Number of runs, the fastest is reported.')
+@click.option('--top', default=15, show_default=True, help='Number of slowest imports to list.')
+@click.option('--max-ms', default=None, type=float, help='Fail if the import takes longer than this.')
+@click.option('--after', default=None, help='Import this module first and measure only what the module adds, like ak_schema.')
+def benchmark(module, repeat, top, max_ms, after):
+    """Measure the import time of a module and check for eager heavy imports."""
+    runs = [ import_times(module, after) for i in range(repeat) ]
+    best = min(runs, key=lambda t: t[module][1])
+    total_ms = best[module][1] / 1000
+
+    print(f'import {module}' + (f' after {after}' if after else '') + f': {total_ms:.1f} ms (best of {repeat}, all runs: ' +
+          ', '.join([ f'{t[module][1] / 1000:.1f}' for t in runs ]) + ' ms)')
+    print()
+    print(f'Slowest imports by cumulative time:')
+    for name, (self_us, cumulative_us) in sorted(best.items(), key=lambda x: x[1][1], reverse=True)[:top]:
+        print(f'{cumulative_us / 1000:10.1f} ms {self_us / 1000:10.1f} ms self  {name}')
+
+    failed = False
+    eager = [ name for name in best if name.split('.')[0] in lazy_modules ]
+    if eager:
+        print()
+        print('ERROR: imported at import time, should be lazy: ' + ', '.join(sorted(set([ n.split('.')[0] for n in eager ]))))
+        failed = True
+    if max_ms is not None and total_ms > max_ms:
+        print()
+        print(f'ERROR: import took {total_ms:.1f} ms, more than {max_ms} ms')
+        failed = True
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    benchmark()
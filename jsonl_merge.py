@@ -0,0 +1,136 @@
+import os
+import re
+import json
+import heapq
+import functools
+import tempfile
+
+
+@functools.lru_cache(maxsize=None)
+def jsonl_key_pattern(container_field, key_field):
+    # the identifier is the first slot of an object, and the lines are
+    # written by json.dumps with its default separators
+    return re.compile('{"%s": {"%s": "([^"\\\\]*)"' % (re.escape(container_field), re.escape(key_field)))
+
+def jsonl_key(line, container_field, key_field='akc_id'):
+    """The identifier of the object on a JSONL line.
+
+    Read with a regular expression from the start of the line, so the
+    object is not decoded. Lines that do not match, like identifiers with
+    escapes, are decoded as JSON.
+    """
+    m = jsonl_key_pattern(container_field, key_field).match(line)
+    if m is not None:
+        return m.group(1)
+    return json.loads(line)[container_field][key_field]
+
+
+class SortedJSONL:
+    """Lines of a JSONL file in identifier order.
+
+    Files that are already sorted are read straight through. Otherwise
+    they are sorted externally: runs of at most run_size lines are sorted
+    in memory and spilled to temporary files, which are merged when the
+    lines are read. Either way only about run_size lines are in memory.
+    """
+
+    def __init__(self, filename, container_field, open_input, tmp_dir=None, run_size=1000000, key_field='akc_id'):
+        self.filename = filename
+        self.container_field = container_field
+        self.open_input = open_input
+        self.tmp_dir = tmp_dir
+        self.run_size = run_size
+        self.key_field = key_field
+        self.run_files = []
+
+    def is_sorted(self):
+        last = None
+        with self.open_input(self.filename) as f:
+            for line in f:
+                key = jsonl_key(line, self.container_field, self.key_field)
+                if last is not None and key < last:
+                    return False
+                last = key
+        return True
+
+    def _write_run(self, run):
+        run.sort(key=lambda r: r[0])
+        fd, run_file = tempfile.mkstemp(prefix='ak_merge_run_', suffix='.tsv', dir=self.tmp_dir)
+        # json.dumps escapes tabs and newlines, so key<TAB>line is safe
+        with os.fdopen(fd, 'w') as f:
+            for key, line in run:
+                f.write(key + '\t' + line)
+        self.run_files.append(run_file)
+
+    def _read_run(self, run_file):
+        with open(run_file, 'r') as f:
+            for line in f:
+                key, line = line.split('\t', 1)
+                yield key, line
+
+    def _read_file(self):
+        with self.open_input(self.filename) as f:
+            for line in f:
+                if not line.endswith('\n'):
+                    line += '\n'
+                yield jsonl_key(line, self.container_field, self.key_field), line
+
+    def __iter__(self):
+        """Yield (key, line) in key order, lines with the same key keep their file order."""
+        if self.is_sorted():
+            yield from self._read_file()
+            return
+        run = []
+        for key, line in self._read_file():
+            run.append((key, line))
+            if len(run) >= self.run_size:
+                self._write_run(run)
+                run = []
+        if len(self.run_files) == 0:
+            # fits in one run
+            run.sort(key=lambda r: r[0])
+            yield from run
+            return
+        if run:
+            self._write_run(run)
+        run = None
+        try:
+            # heapq.merge is stable, so equal keys come from earlier runs first
+            yield from heapq.merge(*[ self._read_run(f) for f in self.run_files ], key=lambda r: r[0])
+        finally:
+            self.close()
+
+    def close(self):
+        for run_file in self.run_files:
+            try:
+                os.remove(run_file)
+            except FileNotFoundError:
+                pass
+        self.run_files = []
+
+
+def merge_sorted(sources):
+    """k-way merge of sorted (key, line) iterators, first source wins a key.
+
+    sources is a list of (source name, iterator). Yields (key, line) for
+    the first line of each key, in key order, and counts the lines that
+    were dropped as duplicates per source in the returned dict, which is
+    complete once the merge is exhausted.
+    """
+    def tagged(i, it):
+        for key, line in it:
+            yield key, i, line
+
+    duplicates = { name: 0 for name, it in sources }
+
+    def merged():
+        last = None
+        # the source index breaks ties, so earlier sources are kept
+        for key, i, line in heapq.merge(*[ tagged(i, it) for i, (name, it) in enumerate(sources) ]):
+            if key == last:
+                duplicates[sources[i][0]] += 1
+                continue
+            last = key
+            yield key, line
+
+    return merged(), duplicates
@@ -11,130 +11,181 @@ import hashlib
 import itertools
 import uuid
 
-from linkml_runtime.utils.schemaview import SchemaView
 from linkml_runtime.linkml_model.meta import EnumDefinition, PermissibleValue, SchemaDefinition
 from linkml_runtime.dumpers import yaml_dumper, json_dumper, tsv_dumper
 from linkml_runtime.loaders import json_loader
 
 from ak_schema import *
 from ak_schema_utils import *
-
-container = AIRRKnowledgeCommons()
-
-# output data for just this study
-directory_name = f'{ak_load_dir}'
-try:
-    os.mkdir(directory_name)
-except FileExistsError:
-    pass
-
-# ADC data
-dup_cnt = 0
-for study in cache_list:
-    directory_name = f'{adc_data_dir}/adc_jsonl/{study}'
-    chain_file = f'{directory_name}/chains.jsonl'
-    print(chain_file)
-    with open(chain_file, 'r') as f:
-        for line in f:
-            #print(line)
-            x = json.loads(line)
-            y = json_loader.load_any(x['chains'], Chain)
-            #print(y)
-            if container.chains.get(y.akc_id) is None:
-                container.chains[y.akc_id] = y
-            else:
-                dup_cnt += 1
-            #break
-    print(len(container.chains))
-    print(dup_cnt)
-
-    receptor_file = f'{directory_name}/ab_tcell_receptors.jsonl'
-    print(receptor_file)
-    with open(receptor_file, 'r') as f:
-        for line in f:
-            x = json.loads(line)
-            y = json_loader.load_any(x['ab_tcell_receptors'], AlphaBetaTCR)
-            #print(y)
-            if container.ab_tcell_receptors.get(y.akc_id) is None:
-                container.ab_tcell_receptors[y.akc_id] = y
-            else:
-                dup_cnt += 1
-    print(len(container.ab_tcell_receptors))
-
-    receptor_file = f'{directory_name}/gd_tcell_receptors.jsonl'
-    print(receptor_file)
-    with open(receptor_file, 'r') as f:
-        for line in f:
-            x = json.loads(line)
-            y = json_loader.load_any(x['gd_tcell_receptors'], GammaDeltaTCR)
-            #print(y)
-            if container.gd_tcell_receptors.get(y.akc_id) is None:
-                container.gd_tcell_receptors[y.akc_id] = y
-            else:
-                dup_cnt += 1
-    print(len(container.gd_tcell_receptors))
-
-    receptor_file = f'{directory_name}/bcell_receptors.jsonl'
-    print(receptor_file)
-    with open(receptor_file, 'r') as f:
-        for line in f:
-            x = json.loads(line)
-            y = json_loader.load_any(x['bcell_receptors'], BCellReceptor)
-            #print(y)
-            if container.bcell_receptors.get(y.akc_id) is None:
-                container.bcell_receptors[y.akc_id] = y
-            else:
-                dup_cnt += 1
-    print(len(container.bcell_receptors))
-
-# IEDB data
-directory_name = f'{iedb_data_dir}/iedb_jsonl'
-chain_file = f'{directory_name}/Chain.jsonl'
-print(chain_file)
-with open(chain_file, 'r') as f:
-    for line in f:
-        x = json.loads(line)
-        y = json_loader.load_any(x['chains'], Chain)
-
-        if container.chains.get(y.akc_id) is None:
-            container.chains[y.akc_id] = y
-        else:
-            dup_cnt += 1
-
-print(len(container.chains))
-
-receptor_file = f'{directory_name}/AlphaBetaTCR.jsonl'
-print(receptor_file)
-with open(receptor_file, 'r') as f:
-    for line in f:
-        x = json.loads(line)
-        y = json_loader.load_any(x['ab_tcell_receptors'], AlphaBetaTCR)
-        #print(y)
-        if container.ab_tcell_receptors.get(y.akc_id) is None:
-            container.ab_tcell_receptors[y.akc_id] = y
-        else:
-            dup_cnt += 1
-
-receptor_file = f'{directory_name}/GammaDeltaTCR.jsonl'
-print(receptor_file)
-with open(receptor_file, 'r') as f:
-    for line in f:
-        x = json.loads(line)
-        y = json_loader.load_any(x['gd_tcell_receptors'], GammaDeltaTCR)
-        #print(y)
-        if container.gd_tcell_receptors.get(y.akc_id) is None:
-            container.gd_tcell_receptors[y.akc_id] = y
-        else:
-            dup_cnt += 1
-
-# Write everything to JSONL
-#write_jsonl(container, 'chains', f'{ak_load_dir}/Chain.jsonl')
-write_jsonl(container, 'ab_tcell_receptors', f'{ak_load_dir}/AlphaBetaTCR.jsonl')
-write_jsonl(container, 'gd_tcell_receptors', f'{ak_load_dir}/GammaDeltaTCR.jsonl')
-write_jsonl(container, 'bcell_receptors', f'{ak_load_dir}/BCellReceptor.jsonl')
-
-# Write everything to CSV
-write_csv(container, 'chains', f'{ak_load_dir}/Chain.csv')
-write_csv(container, 'ab_tcell_receptors', f'{ak_load_dir}/AlphaBetaTCR.csv')
-write_csv(container, 'gd_tcell_receptors', f'{ak_load_dir}/GammaDeltaTCR.csv')
-write_csv(container, 'bcell_receptors', f'{ak_load_dir}/BCellReceptor.csv')
+from jsonl_merge import SortedJSONL, merge_sorted
+from run_metrics import RunMetrics
+# ak_schema exports datetime.time, so import the timer by name
+from time import perf_counter
+
+# container field, class and load file name of the merged objects,
+# and whether the merged JSONL is written
+merge_fields = [
+    ('chains', Chain, 'Chain', False),
+    ('ab_tcell_receptors', AlphaBetaTCR, 'AlphaBetaTCR', True),
+    ('gd_tcell_receptors', GammaDeltaTCR, 'GammaDeltaTCR', True),
+    ('bcell_receptors', BCellReceptor, 'BCellReceptor', True),
+]
+
+def merge_sources(container_field, tname):
+    """(source, JSONL file) in the order that decides which duplicate is kept."""
+    sources = [ (study, f'{ADC_TRANSFORM_DATA}/adc_jsonl/{study}/{container_field}.jsonl') for study in cache_list ]
+    if container_field != 'bcell_receptors':
+        sources.append(('IEDB', f'{IEDB_TRANSFORM_DATA}/iedb_jsonl/{tname}.jsonl'))
+    return sources
+
+def merge_stream(container_field, cls, tname, write_jsonl_file, parquet, tmp_dir, run_size, metrics):
+    """Merge one kind of object with a k-way merge of the sources sorted by akc_id.
+
+    Only one line per source, plus one sort run while a source is sorted,
+    is in memory. Returns the duplicate count of each source.
+    """
+    sources = []
+    for source, filename in merge_sources(container_field, tname):
+        print(filename)
+        sources.append((source, SortedJSONL(filename, container_field, open_input, tmp_dir, run_size)))
+    lines, duplicates = merge_sorted(sources)
+
+    jsonl_file = None
+    if write_jsonl_file:
+        outfile = output_filename(f'{ak_load_dir}/{tname}.jsonl')
+        print(outfile)
+        jsonl_file = open_output(outfile)
+    csv_file = None
+    parquet_writer = None
+    if parquet:
+        parquet_writer = ParquetRowGroupWriter(container_field, f'{ak_load_dir}/{tname}.parquet')
+    cnt = 0
+    decode_seconds = 0.0
+    write_seconds = 0.0
+    for akc_id, line in lines:
+        start = perf_counter()
+        obj = json_loader.load_any(json.loads(line)[container_field], cls)
+        decoded = perf_counter()
+        decode_seconds += decoded - start
+        if jsonl_file is not None:
+            jsonl_file.write(jsonl_line(container_field, obj))
+        if csv_file is None:
+            outfile = output_filename(f'{ak_load_dir}/{tname}.csv')
+            print(f"Streaming {container_field} into CSV file: {outfile}")
+            csv_file = open_output(outfile)
+            plan = csv_writer_plan(cls)
+            w = csv.writer(csv_file, lineterminator='\n')
+            w.writerow(plan.columns)
+        w.writerow(plan.row(obj))
+        if parquet_writer is not None:
+            parquet_writer.write(obj)
+        write_seconds += perf_counter() - decoded
+        cnt += 1
+
+    if jsonl_file is not None:
+        jsonl_file.close()
+    if csv_file is None:
+        print(f"Skipping empty data for {container_field}")
+    else:
+        csv_file.close()
+    if parquet_writer is not None:
+        parquet_writer.close()
+    print(f'{cnt} {container_field}, {sum(duplicates.values())} duplicates')
+    metrics.add_time('decode', decode_seconds, cnt)
+    metrics.add_time('write', write_seconds, cnt)
+    metrics.count('rows', cnt + sum(duplicates.values()))
+    metrics.count('duplicates', sum(duplicates.values()))
+    metrics.count(container_field, cnt)
+    return duplicates
+
+def print_duplicates(duplicates):
+    """Table of duplicate counts, by source and container field."""
+    print()
+    print(f"{'source':40s}" + ''.join([ f' {f:>18s}' for f in duplicates ]))
+    sources = []
+    for container_field in duplicates:
+        sources += [ s for s in duplicates[container_field] if s not in sources ]
+    for source in sources:
+        print(f'{source:40s}' + ''.join([ f' {duplicates[f].get(source, "-"):>18}' for f in duplicates ]))
+    print(f"{'total':40s}" + ''.join([ f' {sum(duplicates[f].values()):>18}' for f in duplicates ]))
+
+@click.command()
+@click.option('--parquet', is_flag=True, help='Also write Parquet files, needs pyarrow.')
+@click.option('--stream', is_flag=True, help='Merge with a k-way merge of the sources sorted by akc_id, in bounded memory.')
+@click.option('--run-size', default=1000000, show_default=True, help='Lines per sort run when a source is not sorted, with --stream.')
+@click.option('--tmp-dir', default=None, help='Directory for sort runs, default is the system temp directory.')
+@click.option('--workers', default=1, show_default=True, help='Processes reading the source files, without --stream.')
+def merge_chain(parquet, stream, run_size, tmp_dir, workers):
+    """Merge ADC and IEDB chains and receptors into the DB load directory."""
+
+    check_env('ADC_TRANSFORM_DATA', 'IEDB_TRANSFORM_DATA')
+
+    if parquet:
+        check_parquet()
+
+    metrics = RunMetrics('merge_chain', stream=stream, workers=workers, parquet=parquet, compression=AK_OUTPUT_COMPRESSION)
+
+    if stream:
+        try:
+            os.mkdir(ak_load_dir)
+        except FileExistsError:
+            pass
+        duplicates = {}
+        for container_field, cls, tname, write_jsonl_file in merge_fields:
+            with metrics.stage('merge ' + container_field):
+                duplicates[container_field] = merge_stream(container_field, cls, tname, write_jsonl_file, parquet, tmp_dir, run_size, metrics)
+
+        print_duplicates(duplicates)
+        metrics.save(f'{ak_load_dir}/metrics/merge_chain.json', 'rows')
+        return
+
+    container = AIRRKnowledgeCommons()
+
+    # output data for just this study
+    directory_name = f'{ak_load_dir}'
+    try:
+        os.mkdir(directory_name)
+    except FileExistsError:
+        pass
+
+    # ADC data, then IEDB data
+    duplicates = {}
+    for container_field, cls, tname, write_jsonl_file in merge_fields:
+        sources = merge_sources(container_field, tname)
+        for source, filename in sources:
+            print(filename)
+        with metrics.stage('read'):
+            dup_cnt = load_first_seen(container, container_field, cls, [ f for s, f in sources ], workers=workers)
+        duplicates[container_field] = { s: n for (s, f), n in zip(sources, dup_cnt) }
+        print(f'{len(container[container_field])} {container_field}, {sum(dup_cnt)} duplicates')
+        metrics.count('rows', len(container[container_field]) + sum(dup_cnt))
+        metrics.count('duplicates', sum(dup_cnt))
+        metrics.count(container_field, len(container[container_field]))
+
+    # Write everything to JSONL
+    with metrics.stage('write jsonl'):
+        #write_jsonl(container, 'chains', f'{ak_load_dir}/Chain.jsonl')
+        write_jsonl(container, 'ab_tcell_receptors', f'{ak_load_dir}/AlphaBetaTCR.jsonl')
+        write_jsonl(container, 'gd_tcell_receptors', f'{ak_load_dir}/GammaDeltaTCR.jsonl')
+        write_jsonl(container, 'bcell_receptors', f'{ak_load_dir}/BCellReceptor.jsonl')
+
+    # Write everything to CSV
+    with metrics.stage('write csv'):
+        write_csv(container, 'chains', f'{ak_load_dir}/Chain.csv')
+        write_csv(container, 'ab_tcell_receptors', f'{ak_load_dir}/AlphaBetaTCR.csv')
+        write_csv(container, 'gd_tcell_receptors', f'{ak_load_dir}/GammaDeltaTCR.csv')
+        write_csv(container, 'bcell_receptors', f'{ak_load_dir}/BCellReceptor.csv')
+
+    # Write everything to Parquet
+    if parquet:
+        with metrics.stage('write parquet'):
+            write_parquet(container, 'chains', f'{ak_load_dir}/Chain.parquet')
+            write_parquet(container, 'ab_tcell_receptors', f'{ak_load_dir}/AlphaBetaTCR.parquet')
+            write_parquet(container, 'gd_tcell_receptors', f'{ak_load_dir}/GammaDeltaTCR.parquet')
+            write_parquet(container, 'bcell_receptors', f'{ak_load_dir}/BCellReceptor.parquet')
+
+    print_duplicates(duplicates)
+    metrics.save(f'{ak_load_dir}/metrics/merge_chain.json', 'rows')
+
+if __name__ == "__main__":
+    merge_chain()
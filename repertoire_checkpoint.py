@@ -0,0 +1,86 @@
+import os
+import gzip
+import json
+import pickle
+import hashlib
+
+# bump when the shard contents change, old shards are then ignored
+checkpoint_version = 4
+
+
+def file_sha256(filename, block_size=1 << 20):
+    """SHA-256 of a file's contents."""
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_fingerprint(filename, with_hash=True):
+    """Size, mtime and optionally the hash of a file."""
+    st = os.stat(filename)
+    fp = { 'size': st.st_size, 'mtime_ns': st.st_mtime_ns }
+    if with_hash:
+        fp['sha256'] = file_sha256(filename)
+    return fp
+
+
+def metadata_sha256(metadata):
+    """SHA-256 of JSON-like metadata, independent of the key order."""
+    doc = json.dumps(metadata, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(doc.encode('utf-8')).hexdigest()
+
+
+class RepertoireCheckpoint:
+    """Per-repertoire shards of a study transform, saved as they finish.
+
+    Each repertoire gets a pickled result shard and a small JSON manifest
+    recording the size, mtime and hash of its input file, and the settings
+    the shard was made with, such as the code version and the options that
+    change the output. A shard is only reused when both match. The
+    manifest is written last, so an interrupted save is never reused.
+    """
+
+    def __init__(self, directory, settings):
+        self.directory = directory
+        self.settings = settings
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, repertoire_id):
+        return (f'{self.directory}/{repertoire_id}.json', f'{self.directory}/{repertoire_id}.pkl.gz')
+
+    def load(self, repertoire_id, input_file):
+        """Return the saved result if the input file is unchanged, else None."""
+        manifest_file, shard_file = self._paths(repertoire_id)
+        if not os.path.exists(manifest_file) or not os.path.exists(shard_file):
+            return None
+        with open(manifest_file, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != checkpoint_version:
+            return None
+        if manifest['settings'] != self.settings:
+            return None
+        # cheap checks first, only hash when size and mtime match
+        fp = file_fingerprint(input_file, with_hash=False)
+        if manifest['input']['size'] != fp['size'] or manifest['input']['mtime_ns'] != fp['mtime_ns']:
+            return None
+        if manifest['input']['sha256'] != file_sha256(input_file):
+            return None
+        with gzip.open(shard_file, 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, repertoire_id, input_file, result):
+        manifest_file, shard_file = self._paths(repertoire_id)
+        manifest = {
+            'version': checkpoint_version,
+            'repertoire_id': repertoire_id,
+            'settings': self.settings,
+            'input': file_fingerprint(input_file),
+        }
+        with gzip.open(shard_file + '.tmp', 'wb', compresslevel=1) as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(shard_file + '.tmp', shard_file)
+        with open(manifest_file + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_file + '.tmp', manifest_file)
@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import socket
+import resource
+import datetime
+import contextlib
+from time import perf_counter
+
+# bump when the metrics file layout changes
+metrics_version = 1
+
+# functions called with the stage name each time a stage of this process
+# finishes, the profiler uses them for its memory snapshots
+stage_listeners = []
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its finished child processes, in MB."""
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return { 'self': round(rss / 1e6, 1), 'children': round(children / 1e6, 1) }
+
+
+class RunMetrics:
+    """Named stage timers and counters for one transform run.
+
+    A stage adds up wall time and the number of items it handled, so its
+    throughput can be reported. Counters are plain named totals. Worker
+    processes keep their own metrics and send back state(), which the
+    main process adds in with merge(), so stage times from workers are
+    summed over the workers.
+    """
+
+    def __init__(self, name, **info):
+        self.name = name
+        self.info = info
+        self.started = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+        self.start = perf_counter()
+        self.stages = {}
+        self.counters = {}
+
+    def _add(self, name, seconds, items, calls):
+        stage = self.stages.setdefault(name, { 'seconds': 0.0, 'calls': 0, 'items': 0 })
+        stage['seconds'] += seconds
+        stage['calls'] += calls
+        stage['items'] += items
+
+    def add_time(self, name, seconds, items=0, calls=1):
+        self._add(name, seconds, items, calls)
+        for listener in stage_listeners:
+            listener(name)
+
+    @contextlib.contextmanager
+    def stage(self, name, items=0):
+        """Time a block of code, items is the number of rows or objects it handles."""
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, perf_counter() - start, items)
+
+    def timed(self, name, iterable):
+        """Iterate, timing how long the iterable takes to produce its items."""
+        seconds = 0.0
+        items = 0
+        it = iter(iterable)
+        try:
+            while True:
+                start = perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    seconds += perf_counter() - start
+                    break
+                seconds += perf_counter() - start
+                items += 1
+                yield item
+        finally:
+            self.add_time(name, seconds, items)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def state(self):
+        """Stage and counter totals, picklable, for merge()."""
+        return { 'stages': self.stages, 'counters': self.counters }
+
+    def merge(self, state):
+        if state is None:
+            return
+        for name, stage in state['stages'].items():
+            self._add(name, stage['seconds'], stage['items'], stage['calls'])
+        for name, n in state['counters'].items():
+            self.count(name, n)
+
+    def to_dict(self, rows_counter=None):
+        wall = perf_counter() - self.start
+        stages = {}
+        for name, stage in self.stages.items():
+            stages[name] = dict(stage)
+            stages[name]['seconds'] = round(stage['seconds'], 3)
+            if stage['items'] and stage['seconds'] > 0:
+                stages[name]['items_per_second'] = round(stage['items'] / stage['seconds'], 1)
+        metrics = {
+            'version': metrics_version,
+            'name': self.name,
+            'info': self.info,
+            'host': socket.gethostname(),
+            'started': self.started,
+            'wall_seconds': round(wall, 3),
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': stages,
+            'counters': self.counters,
+        }
+        if rows_counter is not None and wall > 0:
+            metrics['rows_per_second'] = round(self.counters.get(rows_counter, 0) / wall, 1)
+        return metrics
+
+    def report(self, rows_counter=None):
+        """Print the stage table and return the metrics."""
+        metrics = self.to_dict(rows_counter)
+        print()
+        print(f"{'stage':24s} {'seconds':>10s} {'items':>12s} {'items/s':>12s}")
+        for name, stage in metrics['stages'].items():
+            rate = stage.get('items_per_second')
+            print(f"{name:24s} {stage['seconds']:10.2f} {stage['items']:12d} {rate if rate is not None else '-':>12}")
+        for name, n in metrics['counters'].items():
+            print(f'{name:24s} {n:>10}')
+        rows_per_second = metrics.get('rows_per_second')
+        print(f"wall {metrics['wall_seconds']:.2f}s" +
+              (f', {rows_per_second} {rows_counter}/s' if rows_per_second is not None else '') +
+              f", peak RSS {metrics['peak_rss_mb']['self']} MB (workers {metrics['peak_rss_mb']['children']} MB)")
+        return metrics
+
+    def save(self, filename, rows_counter=None):
+        """Print the report and write the metrics as JSON."""
+        metrics = self.report(rows_counter)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(metrics, f, indent=2)
+        os.replace(filename + '.tmp', filename)
+        print(f'Metrics saved to {filename}')
+        return metrics
@@ -0,0 +1,197 @@
+#
+# Profiling of the transform commands
+#
+# The commands take --profile cprofile, sampling or tracemalloc, and write
+# the profile next to their outputs, one per study:
+#
+#   cprofile     {base}.pstats, for python3 -m pstats or snakeviz
+#   sampling     {base}.folded, collapsed stacks for flamegraph.pl or speedscope
+#   tracemalloc  {base}.tracemalloc.txt, top allocations at each stage boundary
+#
+# Only the main process is profiled, not the --workers processes.
+#
+
+import os
+import sys
+import click
+import cProfile
+import pstats
+import functools
+import inspect
+import threading
+import collections
+import tracemalloc
+from time import perf_counter
+
+import run_metrics
+
+profile_kinds = [ 'cprofile', 'sampling', 'tracemalloc' ]
+
+
+class CProfileCapture:
+    """Deterministic profile of every function call, saved as pstats."""
+
+    suffix = '.pstats'
+
+    def start(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def save(self, filename):
+        self.profile.dump_stats(filename)
+        stats = pstats.Stats(self.profile)
+        stats.sort_stats('cumulative').print_stats(25)
+
+
+class SamplingCapture:
+    """Samples the stack of the main thread from a background thread.
+
+    Stacks are counted in the collapsed format, one line of
+    root;...;leaf count per distinct stack, that flamegraph tools read.
+    The cost is a stack walk per interval, not per call, so timings are
+    much closer to an unprofiled run than with cProfile.
+    """
+
+    suffix = '.folded'
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+
+    def start(self):
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self.thread_id = threading.get_ident()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='sampling profiler', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[';'.join(stack)] += 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        print(f'{self.samples} samples of {len(self.stacks)} distinct stacks')
+
+
+class TracemallocCapture:
+    """Top allocations by source line at the stage boundaries of the run.
+
+    A snapshot is taken when a RunMetrics stage finishes, for the first
+    finish of each stage and then at most every min_interval seconds, as
+    some stages finish once per repertoire. One more is taken at the end.
+    """
+
+    suffix = '.tracemalloc.txt'
+
+    def __init__(self, top=15, frames=1, min_interval=10.0):
+        self.top = top
+        self.frames = frames
+        self.min_interval = min_interval
+
+    def start(self):
+        self.snapshots = []
+        self.seen = set()
+        self.last = None
+        tracemalloc.start(self.frames)
+        run_metrics.stage_listeners.append(self.stage_finished)
+
+    def stage_finished(self, name):
+        if name in self.seen and perf_counter() - self.last < self.min_interval:
+            return
+        self.seen.add(name)
+        self.snapshot('after ' + name)
+
+    def snapshot(self, label):
+        current, peak = tracemalloc.get_traced_memory()
+        # tracemalloc's own bookkeeping is not interesting
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ])
+        self.snapshots.append((label, current, peak, snapshot.statistics('lineno')[:self.top]))
+        self.last = perf_counter()
+
+    def stop(self):
+        run_metrics.stage_listeners.remove(self.stage_finished)
+        self.snapshot('end')
+        tracemalloc.stop()
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            for label, current, peak, stats in self.snapshots:
+                f.write(f'{label}: current {current / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB\n')
+                for stat in stats:
+                    frame = stat.traceback[0]
+                    f.write(f'  {stat.size / 1e6:10.2f} MB {stat.count:10d} blocks  {frame.filename}:{frame.lineno}\n')
+                f.write('\n')
+        peak = self.snapshots[-1][2]
+        print(f'{len(self.snapshots)} memory snapshots, peak traced {peak / 1e6:.1f} MB')
+
+
+captures = {
+    'cprofile': CProfileCapture,
+    'sampling': SamplingCapture,
+    'tracemalloc': TracemallocCapture,
+}
+
+
+def profile_option(artifact):
+    """Add --profile to a click command.
+
+    artifact is called with the command's arguments by name and returns
+    the file name of the profile without its suffix, after the command has
+    run, so it can use directories that the command checks or creates.
+    The command's callback keeps working without the option, and its
+    arguments can be given by position or by name.
+    """
+    def decorator(f):
+        signature = inspect.signature(f)
+
+        @click.option('--profile', type=click.Choice(profile_kinds), default=None,
+                      help='Profile the run and save the profile with the outputs of the study.')
+        @functools.wraps(f)
+        def command(*args, profile=None, **kwargs):
+            if profile is None:
+                return f(*args, **kwargs)
+            arguments = signature.bind(*args, **kwargs).arguments
+            if arguments.get('workers', 1) > 1:
+                print('Only the main process is profiled, not the workers.')
+            capture = captures[profile]()
+            capture.start()
+            failed = False
+            try:
+                return f(*args, **kwargs)
+            except SystemExit as e:
+                # a command that exits with an error, like for a missing
+                # environment variable, may not have an output directory
+                failed = bool(e.code)
+                raise
+            finally:
+                capture.stop()
+                if not failed:
+                    filename = artifact(**arguments) + capture.suffix
+                    os.makedirs(os.path.dirname(filename), exist_ok=True)
+                    capture.save(filename)
+                    print(f'Profile saved to {filename}')
+        return command
+    return decorator
@@ -0,0 +1,152 @@
+#
+# Precomputed slot facts from the AK schema
+#
+# The transforms only need a few facts from the schema (slot range and
+# multivalued, type ancestors, the schema version). Resolving the schema
+# with SchemaView takes seconds, so the facts are saved in a small JSON
+# file keyed by the hash of the schema files. If the cache is missing or
+# stale, the facts come from SchemaView and the cache is rebuilt.
+#
+# Build the cache with: python3 schema_facts.py
+#
+
+import click
+import glob
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+# bump when the cached facts change
+facts_version = 1
+
+default_schema_file = 'ak-schema/project/linkml/ak_schema.yaml'
+default_facts_file = os.environ.get('AK_SCHEMA_FACTS', 'ak_schema_facts.json')
+
+# the parts of a linkml SlotDefinition that the transforms use
+SlotFacts = namedtuple('SlotFacts', ['name', 'range', 'multivalued'])
+
+
+def schema_hash(schema_file):
+    """SHA-256 over the schema file and the other schema files it may import."""
+    h = hashlib.sha256()
+    schema_dir = os.path.dirname(schema_file)
+    for filename in sorted(set(glob.glob(f'{schema_dir}/*.yaml') + [schema_file])):
+        h.update(os.path.basename(filename).encode('utf-8'))
+        with open(filename, 'rb') as f:
+            h.update(hashlib.sha256(f.read()).digest())
+    return h.hexdigest()
+
+
+def build_schema_facts(schema_view):
+    def slot_facts(s):
+        return [ s.range, bool(s.multivalued) ]
+
+    facts = {
+        'version': schema_view.schema.version,
+        'slots': {},
+        'induced_slots': {},
+        'types': {},
+    }
+    for name in schema_view.all_slots():
+        facts['slots'][name] = slot_facts(schema_view.get_slot(name))
+    for class_name in schema_view.all_classes():
+        facts['induced_slots'][class_name] = {}
+        for name in schema_view.class_slots(class_name):
+            facts['induced_slots'][class_name][name] = slot_facts(schema_view.induced_slot(name, class_name))
+    for type_name in schema_view.all_types():
+        facts['types'][type_name] = schema_view.type_ancestors(type_name)
+    return facts
+
+
+class SchemaFacts:
+    """Stand-in for the SchemaView calls made by the transforms.
+
+    get_slot, induced_slot, all_types and type_ancestors answer from the
+    cached facts. Anything else goes to a SchemaView, created on first use.
+    """
+
+    def __init__(self, schema_file=default_schema_file, facts_file=default_facts_file):
+        self.schema_file = schema_file
+        self.facts_file = facts_file
+        self._facts = None
+        self._schema_view = None
+
+    @property
+    def schema_view(self):
+        if self._schema_view is None:
+            from linkml_runtime.utils.schemaview import SchemaView
+            self._schema_view = SchemaView(self.schema_file)
+        return self._schema_view
+
+    @property
+    def facts(self):
+        if self._facts is None:
+            key = schema_hash(self.schema_file)
+            try:
+                with open(self.facts_file, 'r') as f:
+                    cached = json.load(f)
+                if cached.get('facts_version') == facts_version and cached.get('schema_sha256') == key:
+                    self._facts = cached
+            except (OSError, ValueError):
+                pass
+            if self._facts is None:
+                self._facts = self.build(key)
+        return self._facts
+
+    def build(self, key=None):
+        """Compute the facts with SchemaView and save them, if possible."""
+        if key is None:
+            key = schema_hash(self.schema_file)
+        facts = build_schema_facts(self.schema_view)
+        facts['facts_version'] = facts_version
+        facts['schema_sha256'] = key
+        try:
+            with open(self.facts_file + '.tmp', 'w') as f:
+                json.dump(facts, f)
+            os.replace(self.facts_file + '.tmp', self.facts_file)
+        except OSError as e:
+            print(f'Could not save schema facts to {self.facts_file}: {e}')
+        return facts
+
+    @property
+    def version(self):
+        return self.facts['version']
+
+    def get_slot(self, slot_name):
+        f = self.facts['slots'].get(slot_name)
+        if f is None:
+            return None
+        return SlotFacts(slot_name, f[0], f[1])
+
+    def induced_slot(self, slot_name, class_name):
+        f = self.facts['induced_slots'].get(class_name, {}).get(slot_name)
+        if f is None:
+            # not a slot of the class, let SchemaView report it
+            return self.schema_view.induced_slot(slot_name, class_name)
+        return SlotFacts(slot_name, f[0], f[1])
+
+    def all_types(self):
+        return self.facts['types']
+
+    def type_ancestors(self, type_name):
+        return self.facts['types'][type_name]
+
+    def __getattr__(self, name):
+        # everything else needs the full SchemaView
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.schema_view, name)
+
+
+@click.command()
+@click.option('--schema-file', default=default_schema_file, show_default=True, help='AK schema YAML file.')
+@click.option('--facts-file', default=default_facts_file, show_default=True, help='Schema facts cache file to write.')
+def build(schema_file, facts_file):
+    """Build the schema facts cache."""
+    facts = SchemaFacts(schema_file, facts_file).build()
+    print(f"Saved {len(facts['slots'])} slots, {len(facts['induced_slots'])} classes and {len(facts['types'])} types to {facts_file}")
+
+
+if __name__ == "__main__":
+    build()
@@ -0,0 +1,127 @@
+import os
+import ast
+import json
+import time
+
+from repertoire_checkpoint import file_sha256
+
+# bump when the manifest contents change, old manifests are then ignored
+manifest_version = 1
+
+
+def local_imports(code_file, code_dir=None):
+    """The source file and the local modules it imports, directly or not, sorted.
+
+    Imports are read from the source, including those inside functions, so
+    the list does not depend on what else the running process imported.
+    """
+    if code_dir is None:
+        code_dir = os.path.dirname(os.path.abspath(__file__))
+    found = set()
+    pending = [ code_file ]
+    while pending:
+        code_file = pending.pop()
+        if code_file in found:
+            continue
+        found.add(code_file)
+        with open(os.path.join(code_dir, code_file), 'r') as f:
+            tree = ast.parse(f.read(), filename=code_file)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [ alias.name for alias in node.names ]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                names = [ node.module ]
+            else:
+                continue
+            for name in names:
+                module_file = name.split('.')[0] + '.py'
+                if os.path.exists(os.path.join(code_dir, module_file)):
+                    pending.append(module_file)
+    return sorted(found)
+
+
+def code_version(code_file, schema_file, schema_version):
+    """Hashes of a transform's source file, the local modules it imports, and the schema."""
+    code_dir = os.path.dirname(os.path.abspath(__file__))
+    code = { 'files': {}, 'schema': { 'version': schema_version, 'sha256': file_sha256(schema_file) } }
+    for module_file in local_imports(code_file, code_dir):
+        code['files'][module_file] = file_sha256(os.path.join(code_dir, module_file))
+    return code
+
+
+class StudyManifest:
+    """What a study transform's output was made from.
+
+    Saved when a transform of the study finishes: the inputs, the code and
+    schema version, the options that change the output, and the output
+    files. A later run can skip the study if all of these are unchanged.
+    Inputs with the same size and mtime are taken as unchanged, otherwise
+    their hash is compared, so only a change of content forces a rerun.
+    """
+
+    def __init__(self, directory, stage):
+        self.directory = directory
+        self.filename = f'{directory}/{stage}.json'
+        self.started_ns = time.time_ns()
+
+    def _load(self):
+        if not os.path.exists(self.filename):
+            return None
+        with open(self.filename, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('version') != manifest_version:
+            return None
+        return manifest
+
+    def unchanged(self, inputs, code, options):
+        """True if the saved manifest matches and its outputs still exist."""
+        manifest = self._load()
+        if manifest is None:
+            return False
+        if manifest['code'] != code or manifest['options'] != options:
+            return False
+        if sorted(manifest['inputs'].keys()) != sorted(inputs):
+            return False
+        for input_file in inputs:
+            if not os.path.exists(input_file):
+                return False
+            saved = manifest['inputs'][input_file]
+            st = os.stat(input_file)
+            if st.st_size != saved['size']:
+                return False
+            if st.st_mtime_ns != saved['mtime_ns'] and file_sha256(input_file) != saved['sha256']:
+                return False
+        for output_file in manifest['outputs']:
+            if not os.path.exists(output_file) or os.path.getsize(output_file) != manifest['outputs'][output_file]:
+                return False
+        return True
+
+    def invalidate(self):
+        """Remove the saved manifest, so an interrupted run is never skipped."""
+        try:
+            os.remove(self.filename)
+        except FileNotFoundError:
+            pass
+
+    def save(self, inputs, code, options, output_dirs):
+        """Save the manifest, outputs are the files written since this run started."""
+        os.makedirs(self.directory, exist_ok=True)
+        manifest = {
+            'version': manifest_version,
+            'inputs': {},
+            'code': code,
+            'options': options,
+            'outputs': {},
+        }
+        for input_file in inputs:
+            st = os.stat(input_file)
+            manifest['inputs'][input_file] = { 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': file_sha256(input_file) }
+        # allow for coarse file system timestamps
+        since_ns = self.started_ns - 2 * 10**9
+        for output_dir in output_dirs:
+            for entry in sorted(os.scandir(output_dir), key=lambda e: e.name):
+                if entry.is_file() and entry.stat().st_mtime_ns >= since_ns:
+                    manifest['outputs'][entry.path] = entry.stat().st_size
+        with open(self.filename + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(self.filename + '.tmp', self.filename)
@@ -0,0 +1,304 @@
+#
+# Synthetic ADC and IEDB input data, for benchmarks
+#
+# ADC: a study directory like the ADC download, with repertoires.airr.json
+# and one gzipped AIRR rearrangement TSV per repertoire, plus the
+# Assay.jsonl that the repertoire transform would have written. Studies
+# can be bulk, single-cell with paired chains within each repertoire, or
+# IPA style, where the chains of a cell are in different repertoires.
+#
+# IEDB: tcell_full_v3.tsv and tcr_full_v3.tsv with the two header rows of
+# the IEDB export, and the columns that iedb_transform.py reads.
+#
+
+import click
+import csv
+import gzip
+import json
+import os
+import random
+
+# AIRR rearrangement columns, the chain fields and a few others
+adc_columns = [ 'sequence_id', 'sequence', 'sequence_aa', 'rev_comp', 'productive', 'complete_vdj', 'locus',
+                'v_call', 'd_call', 'j_call', 'junction', 'junction_aa', 'duplicate_count', 'cell_id', 'repertoire_id' ]
+
+study_kinds = [ 'bulk', 'paired', 'ipa' ]
+
+loci = {
+    'TRA': ('TRAV', 'TRAJ', 2),
+    'TRB': ('TRBV', 'TRBJ', 2),
+    'TRG': ('TRGV', 'TRGJ', 2),
+    'TRD': ('TRDV', 'TRDJ', 2),
+    'IGH': ('IGHV', 'IGHJ', 1),
+    'IGK': ('IGKV', 'IGKJ', 1),
+    'IGL': ('IGLV', 'IGLJ', 1),
+}
+# receptor chain pairs of single cells
+cell_pairs = [ ('TRA', 'TRB'), ('TRA', 'TRB'), ('TRA', 'TRB'), ('TRG', 'TRD'), ('IGH', 'IGK'), ('IGH', 'IGL') ]
+bulk_loci = [ 'TRB', 'TRB', 'TRA', 'TRG', 'TRD', 'IGH', 'IGK', 'IGL' ]
+
+amino_acids = 'ACDEFGHIKLMNPQRSTVWY'
+nt_table = bytes.maketrans(bytes(range(256)), bytes([ b'ACGT'[i % 4] for i in range(256) ]))
+aa_table = bytes.maketrans(bytes(range(256)), bytes([ amino_acids.encode('ascii')[i % 20] for i in range(256) ]))
+
+
+def random_nt(rng, length):
+    return rng.randbytes(length).translate(nt_table).decode('ascii')
+
+def random_aa(rng, length):
+    return rng.randbytes(length).translate(aa_table).decode('ascii')
+
+
+class ChainGenerator:
+    """Random but plausible chains, with a share of repeated clonotypes."""
+
+    def __init__(self, rng, sequence_length=300, clone_fraction=0.2, pool_size=10000):
+        self.rng = rng
+        self.sequence_length = sequence_length
+        self.clone_fraction = clone_fraction
+        self.pool_size = pool_size
+        self.pool = {}
+
+    def new_chain(self, locus):
+        rng = self.rng
+        v_prefix, j_prefix, n = loci[locus]
+        junction_aa = 'C' + random_aa(rng, rng.randint(8, 16)) + rng.choice('FW')
+        v_call = f'{v_prefix}{rng.randint(1, 40)}-{rng.randint(1, 3)}*0{rng.randint(1, n)}'
+        j_call = f'{j_prefix}{rng.randint(1, 12)}*01'
+        d_call = ''
+        if locus in ['TRB', 'TRD', 'IGH']:
+            d_call = f'{locus}D{rng.randint(1, 2)}*01'
+        sequence = random_nt(rng, self.sequence_length)
+        return {
+            'sequence': sequence,
+            'sequence_aa': random_aa(rng, self.sequence_length // 3),
+            'locus': locus,
+            'v_call': v_call,
+            'd_call': d_call,
+            'j_call': j_call,
+            'junction': random_nt(rng, 3 * len(junction_aa)),
+            'junction_aa': junction_aa,
+        }
+
+    def chain(self, locus):
+        """A new chain, or with clone_fraction probability one seen before."""
+        pool = self.pool.setdefault(locus, [])
+        if pool and self.rng.random() < self.clone_fraction:
+            return self.rng.choice(pool)
+        c = self.new_chain(locus)
+        if len(pool) < self.pool_size:
+            pool.append(c)
+        else:
+            pool[self.rng.randrange(self.pool_size)] = c
+        return c
+
+
+def adc_row(rng, chains, sequence_id, repertoire_id, locus, cell_id='', productive_fraction=0.9):
+    c = chains.chain(locus)
+    productive = rng.random() < productive_fraction
+    return [ sequence_id, c['sequence'], c['sequence_aa'], 'F', 'T' if productive else 'F', rng.choice(['T', 'F']), locus,
+             c['v_call'], c['d_call'], c['j_call'], c['junction'], c['junction_aa'], str(rng.randint(1, 20)), cell_id, repertoire_id ]
+
+
+def write_adc_study(directory, transform_dir, study, kind, repertoires, rows, rng, chains):
+    """Write one study, rows is the number of rearrangements per repertoire."""
+    study_dir = f'{directory}/{study}'
+    os.makedirs(study_dir, exist_ok=True)
+    os.makedirs(f'{transform_dir}/adc_jsonl/{study}', exist_ok=True)
+
+    keywords = [ 'contains_tr' ]
+    if kind in [ 'paired', 'ipa' ]:
+        keywords.append('contains_paired_chain')
+    info = { 'title': f'Synthetic {kind} study {study}' }
+    if kind == 'ipa':
+        # iReceptor Plus studies have Info within Info
+        info['Info'] = { 'title': 'iReceptor Plus' }
+
+    reps = []
+    assay_lines = []
+    for r in range(repertoires):
+        repertoire_id = f'{study}_rep{r}'
+        reps.append({
+            'repertoire_id': repertoire_id,
+            'study': { 'study_id': study, 'study_title': info['title'], 'keywords_study': keywords },
+            'subject': { 'subject_id': f'{study}_subject{r}', 'species': { 'id': 'NCBITAXON:9606', 'label': 'Homo sapiens' } },
+            'sample': [ { 'sample_id': f'{study}_sample{r}' } ],
+            'data_processing': [ { 'data_processing_id': f'{study}_dp{r}' } ],
+        })
+        assay_lines.append(json.dumps({ 'assays': { 'akc_id': f'AKC:{study}_assay{r}', 'repertoire_id': repertoire_id, '@type': 'AIRRSequencingAssay' } }))
+
+        with gzip.open(f'{study_dir}/{repertoire_id}.airr.tsv.gz', 'wt', compresslevel=1) as f:
+            w = csv.writer(f, delimiter='\t', lineterminator='\n')
+            w.writerow(adc_columns)
+            batch = []
+            i = 0
+            while i < rows:
+                if kind == 'bulk':
+                    batch.append(adc_row(rng, chains, f'seq{i}', repertoire_id, rng.choice(bulk_loci)))
+                    i += 1
+                elif kind == 'paired':
+                    # both chains of a cell in this repertoire
+                    pair = rng.choice(cell_pairs)
+                    cell_id = f'{repertoire_id}_cell{i}'
+                    for locus in pair:
+                        batch.append(adc_row(rng, chains, f'seq{i}', repertoire_id, locus, cell_id))
+                        i += 1
+                else:
+                    # IPA: each pair of repertoires shares its cells, one
+                    # has the alpha and the other the beta chain of a cell
+                    pair = cell_pairs[0]
+                    cell_id = f'{study}_cell{r // 2}_{i}'
+                    batch.append(adc_row(rng, chains, f'seq{i}', repertoire_id, pair[r % 2], cell_id))
+                    i += 1
+                if len(batch) >= 10000:
+                    w.writerows(batch)
+                    batch = []
+            w.writerows(batch)
+
+    with open(f'{study_dir}/repertoires.airr.json', 'w') as f:
+        json.dump({ 'Info': info, 'Repertoire': reps }, f, indent=2)
+    with open(f'{transform_dir}/adc_jsonl/{study}/Assay.jsonl', 'w') as f:
+        for line in assay_lines:
+            f.write(line + '\n')
+
+
+# IEDB columns, (category, field)
+iedb_chain_fields = [ 'Type', 'Organism IRI', 'Nucleotide Sequence', 'Protein Sequence',
+                      'Calculated V Gene', 'Curated V Gene', 'Calculated D Gene', 'Curated D Gene',
+                      'Calculated J Gene', 'Curated J Gene',
+                      'CDR1 Calculated', 'CDR1 Curated', 'CDR2 Calculated', 'CDR2 Curated', 'CDR3 Calculated', 'CDR3 Curated',
+                      'CDR1 Start Calculated', 'CDR1 Start Curated', 'CDR1 End Calculated', 'CDR1 End Curated',
+                      'CDR2 Start Calculated', 'CDR2 Start Curated', 'CDR2 End Calculated', 'CDR2 End Curated',
+                      'CDR3 Start Calculated', 'CDR3 Start Curated', 'CDR3 End Calculated', 'CDR3 End Curated' ]
+iedb_tcr_columns = ( [ ('Receptor', 'Group IRI'), ('Receptor', 'Type'), ('Assay', 'IEDB IDs') ] +
+                     [ ('Chain 1', f) for f in iedb_chain_fields ] + [ ('Chain 2', f) for f in iedb_chain_fields ] )
+iedb_tcell_columns = [
+    ('Reference', 'IEDB IRI'), ('Reference', 'PMID'), ('Reference', 'Title'), ('Reference', 'Authors'),
+    ('Reference', 'Journal'), ('Reference', 'Date'),
+    ('Assay ID', 'IEDB IRI'),
+    ('Epitope', 'Name'), ('Epitope', 'Molecule Parent IRI'), ('Epitope', 'Source Organism IRI'),
+    ('1st in vivo Process', 'Process Type'), ('1st in vivo Process', 'Disease IRI'), ('1st in vivo Process', 'Disease Stage'),
+    ('1st immunogen', 'Source Organism IRI'),
+    ('Host', 'IRI'), ('Host', 'Sex'),
+    ('Effector Cell', 'Source Tissue IRI'),
+    ('Assay', 'IRI'), ('Assay', 'Qualitative Measurement'), ('Assay', 'Location of Assay Data in Reference'),
+]
+iedb_chain_types = { 'TRA': 'alpha', 'TRB': 'beta', 'TRG': 'gamma', 'TRD': 'delta' }
+
+
+def iedb_chain(rng, chains, locus, complete=0.7):
+    """IEDB chain columns, with some curated-only and missing values like the export."""
+    c = chains.chain(locus)
+    calculated = rng.random() < complete
+    cdr3 = c['junction_aa']
+    values = {
+        'Type': iedb_chain_types[locus],
+        'Organism IRI': 'http://purl.obolibrary.org/obo/NCBITaxon_9606',
+        'Nucleotide Sequence': c['sequence'] if rng.random() < 0.5 else '',
+        'Protein Sequence': c['sequence_aa'] if calculated else '',
+        'Calculated V Gene': c['v_call'].split('*')[0] if calculated else '',
+        'Curated V Gene': c['v_call'].split('*')[0],
+        'Calculated D Gene': '',
+        'Curated D Gene': c['d_call'].split('*')[0],
+        'Calculated J Gene': c['j_call'].split('*')[0] if calculated else '',
+        'Curated J Gene': c['j_call'].split('*')[0],
+        'CDR1 Calculated': random_aa(rng, 6) if calculated else '',
+        'CDR1 Curated': '',
+        'CDR2 Calculated': random_aa(rng, 6) if calculated else '',
+        'CDR2 Curated': '',
+        'CDR3 Calculated': cdr3 if calculated else '',
+        'CDR3 Curated': cdr3,
+    }
+    for cdr, start in [ ('CDR1', 27), ('CDR2', 56), ('CDR3', 105) ]:
+        values[f'{cdr} Start Calculated'] = str(start) if calculated else ''
+        values[f'{cdr} End Calculated'] = str(start + 10) if calculated else ''
+        values[f'{cdr} Start Curated'] = ''
+        values[f'{cdr} End Curated'] = ''
+    return [ values[f] for f in iedb_chain_fields ]
+
+
+def write_iedb(directory, tcrs, assays_per_reference, rng, chains):
+    """Write tcell_full_v3.tsv and tcr_full_v3.tsv, tcrs is the number of TCR rows."""
+    os.makedirs(directory, exist_ok=True)
+    # about one assay per two receptors, some receptors are in several assays
+    n_assays = max(1, tcrs // 2)
+
+    with open(f'{directory}/tcr_full_v3.tsv', 'w') as f:
+        w = csv.writer(f, delimiter='\t', lineterminator='\n')
+        w.writerow([ c[0] for c in iedb_tcr_columns ])
+        w.writerow([ c[1] for c in iedb_tcr_columns ])
+        batch = []
+        for i in range(tcrs):
+            pair = ('TRA', 'TRB') if rng.random() < 0.95 else ('TRG', 'TRD')
+            chain_1 = iedb_chain(rng, chains, pair[0])
+            chain_2 = iedb_chain(rng, chains, pair[1])
+            if rng.random() < 0.1:
+                # single chain receptors
+                chain_2 = [ '' ] * len(iedb_chain_fields)
+            assay_ids = sorted(set([ str(1000 + rng.randrange(n_assays)) for a in range(rng.choice([1, 1, 1, 2, 3])) ]), key=int)
+            receptor_type = 'alpha beta' if pair[0] == 'TRA' else 'gamma delta'
+            batch.append([ f'http://www.iedb.org/receptor/{5000 + i}', receptor_type, ', '.join(assay_ids) ] + chain_1 + chain_2)
+            if len(batch) >= 10000:
+                w.writerows(batch)
+                batch = []
+        w.writerows(batch)
+
+    with open(f'{directory}/tcell_full_v3.tsv', 'w') as f:
+        w = csv.writer(f, delimiter='\t', lineterminator='\n')
+        w.writerow([ c[0] for c in iedb_tcell_columns ])
+        w.writerow([ c[1] for c in iedb_tcell_columns ])
+        batch = []
+        for i in range(n_assays):
+            reference = i // assays_per_reference
+            epitope = random_aa(rng, rng.randint(8, 11))
+            batch.append([
+                f'http://www.iedb.org/reference/{100000 + reference}', str(30000000 + reference), f'Synthetic reference {reference}',
+                'Author A; Author B; Author C', 'J Synthetic Immunol', str(2000 + reference % 25),
+                f'http://www.iedb.org/assay/{1000 + i}',
+                epitope, 'http://www.ncbi.nlm.nih.gov/protein/P0DTC2.1', 'http://purl.obolibrary.org/obo/NCBITaxon_2697049',
+                rng.choice(['Occurrence of infectious disease', 'Administration in vivo', '']),
+                rng.choice(['http://purl.obolibrary.org/obo/DOID_0080600', '']), rng.choice(['Acute', 'Chronic', '']),
+                'http://purl.obolibrary.org/obo/NCBITaxon_2697049',
+                'http://purl.obolibrary.org/obo/NCBITaxon_9606', rng.choice(['M', 'F', '']),
+                'http://purl.obolibrary.org/obo/UBERON_0000178',
+                'http://purl.obolibrary.org/obo/OBI_0001604', rng.choice(['Positive', 'Positive-High', 'Negative']), 'Figure 1',
+            ])
+            if len(batch) >= 10000:
+                w.writerows(batch)
+                batch = []
+        w.writerows(batch)
+
+
+@click.command()
+@click.argument('output_dir')
+@click.option('--studies', default='bulk,paired,ipa', show_default=True, help='Comma separated kinds of ADC studies to write, one study each: ' + ', '.join(study_kinds) + '.')
+@click.option('--repertoires', default=4, show_default=True, help='Repertoires per ADC study.')
+@click.option('--rows', default=10000, show_default=True, help='Rearrangements per ADC study, split over its repertoires.')
+@click.option('--iedb-tcrs', default=10000, show_default=True, help='Rows of the IEDB TCR file, 0 to skip IEDB.')
+@click.option('--assays-per-reference', default=20, show_default=True, help='IEDB assays per reference.')
+@click.option('--sequence-length', default=300, show_default=True, help='Length of the rearrangement nucleotide sequences.')
+@click.option('--clone-fraction', default=0.2, show_default=True, help='Share of chains that repeat an earlier clonotype.')
+@click.option('--seed', default=1, show_default=True, help='Random seed, the same seed gives the same files.')
+def generate(output_dir, studies, repertoires, rows, iedb_tcrs, assays_per_reference, sequence_length, clone_fraction, seed):
+    """Write synthetic ADC and IEDB input files.
+
+    ADC studies go in OUTPUT_DIR/adc_import/{study} and their Assay.jsonl
+    in OUTPUT_DIR/adc_transform/adc_jsonl/{study}, so they can be used as
+    ADC_IMPORT_DATA and ADC_TRANSFORM_DATA. IEDB files go in OUTPUT_DIR/iedb.
+    """
+    rng = random.Random(seed)
+    chains = ChainGenerator(rng, sequence_length, clone_fraction)
+    for kind in [ k for k in studies.split(',') if k ]:
+        if kind not in study_kinds:
+            raise click.BadParameter(f'unknown study kind {kind}', param_hint='--studies')
+        study = f'synthetic_{kind}'
+        print(f'Writing {kind} study {study} with {repertoires} repertoires and {rows} rows')
+        write_adc_study(f'{output_dir}/adc_import', f'{output_dir}/adc_transform', study, kind,
+                        repertoires, max(1, rows // repertoires), rng, chains)
+    if iedb_tcrs > 0:
+        print(f'Writing IEDB files with {iedb_tcrs} TCR rows')
+        write_iedb(f'{output_dir}/iedb', iedb_tcrs, assays_per_reference, rng, chains)
+
+
+if __name__ == "__main__":
+    generate()
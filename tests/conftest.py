@@ -0,0 +1,72 @@
+#
+# Tests run from the repository directory, with ak_schema.py generated
+# (make ak_schema.py) and the ak-schema submodule checked out.
+#
+# The data directories are read when ak_schema_utils is imported, so they
+# are set here, to a temporary directory, before any test imports it.
+#
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+
+import pytest
+
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir)
+
+data_dir = tempfile.mkdtemp(prefix='ak_tests_')
+os.environ['AK_DATA_DIR'] = data_dir
+os.environ['ADC_IMPORT_DATA'] = f'{data_dir}/adc_import'
+os.environ['ADC_TRANSFORM_DATA'] = f'{data_dir}/adc_transform'
+os.environ['IEDB_IMPORT_DATA'] = f'{data_dir}/iedb_import'
+os.environ['IEDB_TRANSFORM_DATA'] = f'{data_dir}/iedb_transform'
+os.environ['AK_OUTPUT_COMPRESSION'] = 'none'
+os.environ['AK_ID_MODE'] = 'deterministic'
+
+
+@pytest.fixture(autouse=True)
+def repo_cwd(monkeypatch):
+    # the schema and its facts file are found relative to the repository
+    monkeypatch.chdir(repo_dir)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def synthetic_study(study, kind):
+    """Write a small synthetic ADC study to the test data directories."""
+    import synthetic_data
+
+    rng = random.Random(1)
+    chains = synthetic_data.ChainGenerator(rng, pool_size=100)
+    synthetic_data.write_adc_study(os.environ['ADC_IMPORT_DATA'], os.environ['ADC_TRANSFORM_DATA'], study, kind,
+                                   2, 200, rng, chains)
+    os.makedirs(f"{os.environ['ADC_TRANSFORM_DATA']}/adc_tsv/{study}", exist_ok=True)
+
+
+@pytest.fixture(scope='session')
+def adc_study():
+    """A small paired synthetic ADC study in the test data directories, returns its cache id."""
+    import ak_schema_utils
+
+    study = 'synthetic_test'
+    synthetic_study(study, 'paired')
+    ak_schema_utils.cache_list.append(study)
+    yield study
+    ak_schema_utils.cache_list.remove(study)
+
+
+@pytest.fixture(scope='session')
+def ipa_study():
+    """A small IPA style synthetic ADC study, the chains of a cell are in different repertoires."""
+    import ak_schema_utils
+
+    study = 'synthetic_ipa_test'
+    synthetic_study(study, 'ipa')
+    ak_schema_utils.cache_list.append(study)
+    yield study
+    ak_schema_utils.cache_list.remove(study)
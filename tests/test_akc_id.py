@@ -0,0 +1,49 @@
+import pandas as pd
+
+import ak_schema_utils
+from ak_schema_utils import akc_id, make_chain_from_iedb, make_chains_from_iedb
+
+
+def iedb_tcr_df(cdr3s, group_iris):
+    """IEDB TCR rows with one alpha chain each, without a nucleotide sequence, that differ only in CDR3."""
+    rows = []
+    for cdr3, group_iri in zip(cdr3s, group_iris):
+        chain = {
+            'Type': 'alpha', 'Organism IRI': 'http://purl.obolibrary.org/obo/NCBITaxon_9606',
+            'Nucleotide Sequence': None, 'Protein Sequence': None,
+            'Calculated V Gene': 'TRAV1', 'Curated V Gene': None, 'Calculated D Gene': None, 'Curated D Gene': None,
+            'Calculated J Gene': 'TRAJ1', 'Curated J Gene': None,
+            'CDR1 Calculated': None, 'CDR1 Curated': None, 'CDR2 Calculated': None, 'CDR2 Curated': None,
+            'CDR3 Calculated': cdr3, 'CDR3 Curated': None,
+        }
+        for cdr in [ 'CDR1', 'CDR2', 'CDR3' ]:
+            for position in [ 'Start', 'End' ]:
+                for source in [ 'Calculated', 'Curated' ]:
+                    chain[f'{cdr} {position} {source}'] = None
+        row = { ('Receptor', 'Group IRI'): group_iri, ('Receptor', 'Type'): 'alphabeta', ('Assay', 'IEDB IDs'): '1' }
+        row.update({ ('Chain 1', k): v for k, v in chain.items() })
+        row.update({ ('Chain 2', k): None for k in chain })
+        rows.append(row)
+    return pd.DataFrame(rows, columns=pd.MultiIndex.from_tuples(list(rows[0].keys())))
+
+
+def test_akc_id_deterministic():
+    assert akc_id('IEDB', 1, 'assay') == akc_id('IEDB', 1, 'assay')
+    assert akc_id('IEDB', 1, 'assay') != akc_id('IEDB', 2, 'assay')
+    assert akc_id() != akc_id()
+
+
+def test_akc_id_random_mode(monkeypatch):
+    monkeypatch.setattr(ak_schema_utils, 'AK_ID_MODE', 'random')
+    assert akc_id('IEDB', 1, 'assay') != akc_id('IEDB', 1, 'assay')
+
+
+def test_iedb_chains_differing_in_cdr3():
+    # neither CDR3 is a C...F/W junction, so junction_aa is not set
+    for group_iris in [ [ 'http://www.iedb.org/receptor/1', 'http://www.iedb.org/receptor/2' ], [ None, None ] ]:
+        df = iedb_tcr_df([ 'ASSLGQ', 'ASSLGE' ], group_iris)
+        chains = make_chains_from_iedb(df, 'Chain 1')
+        assert chains[0].akc_id != chains[1].akc_id
+        assert chains[0].akc_id == make_chains_from_iedb(df, 'Chain 1')[0].akc_id
+        for i, (index, row) in enumerate(df.iterrows()):
+            assert make_chain_from_iedb(row, 'Chain 1').akc_id == chains[i].akc_id
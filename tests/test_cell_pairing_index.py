@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+import adc_chain_transform
+from cell_pairing_index import ChainRef, CellPairingIndex
+
+
+def test_cells_in_cell_id_order(tmp_path):
+    with CellPairingIndex(str(tmp_path), batch_size=2) as cell_index:
+        cell_index.add('cell2', ChainRef('AKC_HASH:3', 'TRA'))
+        cell_index.add('cell1', ChainRef('AKC_HASH:1', 'TRB'))
+        cell_index.add('cell1', ChainRef('AKC_HASH:2', 'TRA'))
+        assert len(cell_index) == 2
+        assert list(cell_index.cells()) == [
+            ('cell1', [ ChainRef('AKC_HASH:1', 'TRB'), ChainRef('AKC_HASH:2', 'TRA') ]),
+            ('cell2', [ ChainRef('AKC_HASH:3', 'TRA') ]),
+        ]
+    assert os.listdir(tmp_path) == []
+
+
+def test_index_removed_on_error(tmp_path):
+    with pytest.raises(RuntimeError):
+        with CellPairingIndex(str(tmp_path)) as cell_index:
+            cell_index.add('cell1', ChainRef('AKC_HASH:1', 'TRB'))
+            raise RuntimeError('failed')
+    assert os.listdir(tmp_path) == []
+
+
+def test_transform_failure_removes_index(ipa_study, tmp_path, monkeypatch):
+    def failing_repertoire(*args, **kwargs):
+        raise RuntimeError('failed repertoire')
+
+    monkeypatch.setattr(adc_chain_transform, 'process_repertoire', failing_repertoire)
+    with pytest.raises(RuntimeError):
+        adc_chain_transform.receptor_integrate.callback(ipa_study, False, 1, False, str(tmp_path), False, False, True)
+    assert os.listdir(tmp_path) == []
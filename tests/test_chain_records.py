@@ -0,0 +1,159 @@
+import os
+
+import pytest
+
+from ak_schema import AIRRKnowledgeCommons, AlphaBetaTCR, GammaDeltaTCR, Chain, LocusEnum
+from ak_schema_utils import (
+    make_chain_record_from_adc,
+    seq_hash,
+    seq_hash_id,
+    junction_aa_vj_hash,
+    make_receptor,
+    make_complex,
+    materialize_records,
+    object_class,
+    write_jsonl,
+    write_csv,
+)
+from cell_pairing_index import ChainRef, CellPairingIndex
+
+container_fields = [ 'chains', 'ab_tcell_receptors', 'gd_tcell_receptors', 'bcell_receptors', 'tcr_complex' ]
+
+
+def study_rows(study):
+    """Rows of the synthetic study as the chain transform reads them."""
+    import airr
+    from adc_chain_transform import read_rearrangements, repertoire_filename
+    from ak_schema_utils import ADC_IMPORT_DATA
+
+    data = airr.read_airr(f'{ADC_IMPORT_DATA}/{study}/repertoires.airr.json')
+    for rep in data['Repertoire']:
+        counts = { 'rows': 0 }
+        yield from read_rearrangements(repertoire_filename(study, rep), counts)
+
+
+def linkml_chain(species, row):
+    """The Chain of a row, built directly like make_chain_from_adc did before chain records."""
+    if row['sequence'] is None:
+        # rows without a sequence get their ID from the other fields
+        nt_hash_id = make_chain_record_from_adc(species, row).akc_id
+    else:
+        nt_hash_id = seq_hash_id(species, row['sequence'])
+    aa_hash = None if row['sequence_aa'] is None else seq_hash(row['sequence_aa'])
+    vj_hash = None
+    if row['junction_aa'] and row['v_call'] and row['j_call']:
+        vj_hash = junction_aa_vj_hash(row['junction_aa'], row['v_call'], row['j_call'])
+    return Chain(
+        nt_hash_id,
+        species = species,
+        aa_hash = aa_hash,
+        junction_aa_vj_allele_hash = vj_hash,
+        complete_vdj = row['complete_vdj'],
+        sequence = row['sequence'],
+        sequence_aa = row['sequence_aa'],
+        locus = LocusEnum(row['locus']),
+        junction_aa = row['junction_aa'],
+        v_call = row['v_call'],
+        j_call = row['j_call'],
+    )
+
+
+def build(rows, record):
+    """Chains, receptors and complexes of the rows, one receptor per chain, as records or linkml objects."""
+    container = AIRRKnowledgeCommons()
+    for row in rows:
+        if record:
+            chain = make_chain_record_from_adc('NCBITAXON:9606', row)
+        else:
+            chain = linkml_chain('NCBITAXON:9606', row)
+        container.chains[chain.akc_id] = chain
+        receptor = make_receptor(container, [ chain, None ], record=record)
+        if object_class(receptor) in [ AlphaBetaTCR, GammaDeltaTCR ]:
+            make_complex(container, receptor, None, None, record=record)
+    if record:
+        materialize_records(container, container_fields)
+    return container
+
+
+def build_paired(rows, record, study_level):
+    """Chains, and receptors and complexes of the cells with two chains, as records or linkml objects.
+
+    The record path pairs ChainRefs with pair_cells, within the study or,
+    for IPA studies, through a CellPairingIndex. The object path pairs the
+    Chain objects directly, in the same cell order.
+    """
+    from adc_chain_transform import pair_cells
+
+    container = AIRRKnowledgeCommons()
+    cells = {}
+    for row in rows:
+        if record:
+            chain = make_chain_record_from_adc('NCBITAXON:9606', row)
+            cell_chain = ChainRef(chain.akc_id, str(chain.locus))
+        else:
+            chain = linkml_chain('NCBITAXON:9606', row)
+            cell_chain = chain
+        container.chains[chain.akc_id] = chain
+        cells.setdefault(row['cell_id'], []).append(cell_chain)
+
+    if record:
+        if study_level:
+            cell_index = CellPairingIndex()
+            try:
+                for cell_id, cell_chains in cells.items():
+                    for chain_ref in cell_chains:
+                        cell_index.add(cell_id, chain_ref)
+                pair_cells(container, cell_index.cells(), set())
+            finally:
+                cell_index.close()
+        else:
+            pair_cells(container, cells.items(), set())
+        materialize_records(container, container_fields)
+    else:
+        # the cell index gives the cells in cell_id order
+        items = sorted(cells.items()) if study_level else cells.items()
+        for cell_id, cell_chains in items:
+            if len(cell_chains) == 2:
+                receptor = make_receptor(container, cell_chains)
+                make_complex(container, receptor, None, None)
+    return container
+
+
+def written(container, directory):
+    """Bytes of the JSONL and CSV files of the container."""
+    os.makedirs(directory)
+    files = {}
+    for container_field in container_fields:
+        write_jsonl(container, container_field, f'{directory}/{container_field}.jsonl')
+        write_csv(container, container_field, f'{directory}/{container_field}.csv')
+        for suffix in [ '.jsonl', '.csv' ]:
+            # write_csv skips empty containers
+            if os.path.exists(f'{directory}/{container_field}{suffix}'):
+                with open(f'{directory}/{container_field}{suffix}', 'rb') as f:
+                    files[container_field + suffix] = f.read()
+    return files
+
+
+def test_records_write_the_same_bytes(adc_study, tmp_path):
+    rows = list(study_rows(adc_study))
+    assert len(rows) > 0
+
+    from_records = written(build(rows, record=True), f'{tmp_path}/records')
+    from_objects = written(build(rows, record=False), f'{tmp_path}/objects')
+    assert len(from_records['chains.jsonl']) > 0
+    assert from_records.keys() == from_objects.keys()
+    for name in from_objects:
+        assert from_records[name] == from_objects[name], name
+
+
+@pytest.mark.parametrize('study_level', [ False, True ], ids=[ 'within repertoire', 'study level' ])
+def test_paired_records_write_the_same_bytes(adc_study, ipa_study, tmp_path, study_level):
+    rows = list(study_rows(ipa_study if study_level else adc_study))
+
+    from_records = written(build_paired(rows, record=True, study_level=study_level), f'{tmp_path}/records')
+    from_objects = written(build_paired(rows, record=False, study_level=study_level), f'{tmp_path}/objects')
+    paired = [ line for line in from_objects['ab_tcell_receptors.jsonl'].splitlines() if b'tra_chain' in line and b'trb_chain' in line ]
+    assert len(paired) > 0
+    assert from_records.keys() == from_objects.keys()
+    for name in from_objects:
+        assert from_records[name] == from_objects[name], name
@@ -0,0 +1,25 @@
+import os
+import random
+
+import pytest
+
+import adc_chain_transform
+import synthetic_data
+
+
+def test_repertoire_without_assay(capsys, monkeypatch):
+    study = 'synthetic_missing_assay'
+    rng = random.Random(2)
+    synthetic_data.write_adc_study(os.environ['ADC_IMPORT_DATA'], os.environ['ADC_TRANSFORM_DATA'], study, 'bulk',
+                                   2, 10, rng, synthetic_data.ChainGenerator(rng, pool_size=10))
+    # drop the assay of the second repertoire
+    assay_file = f"{os.environ['ADC_TRANSFORM_DATA']}/adc_jsonl/{study}/Assay.jsonl"
+    with open(assay_file) as f:
+        lines = f.readlines()
+    with open(assay_file, 'w') as f:
+        f.write(lines[0])
+    monkeypatch.setattr(adc_chain_transform, 'cache_list', adc_chain_transform.cache_list + [ study ])
+
+    with pytest.raises(SystemExit):
+        adc_chain_transform.receptor_integrate.callback(study, False, 1, False, None, False, False, True)
+    assert f'no AK assay in {assay_file} for repertoires: {study}_rep1' in capsys.readouterr().out
@@ -0,0 +1,48 @@
+import sys
+
+import pandas as pd
+import pytest
+
+from ak_schema_utils import column_values
+from iedb_transform import read_double_header_df, objects_frame
+
+columns = {
+    ('Assay ID', 'IEDB IRI'): 'str',
+    ('Host', 'IRI'): 'category',
+    ('Reference', 'PMID'): 'int',
+}
+
+
+def write_export(path):
+    lines = [
+        [ 'Assay ID', 'Host', 'Host', 'Reference' ],
+        [ 'IEDB IRI', 'IRI', 'Name', 'PMID' ],
+        [ 'http://www.iedb.org/assay/1', 'http://purl.obolibrary.org/obo/NCBITaxon_9606', 'human', '11' ],
+        [ 'http://www.iedb.org/assay/2', '', 'mouse', '' ],
+        [ 'NA', 'http://purl.obolibrary.org/obo/NCBITaxon_9606', 'human', '12' ],
+    ]
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write('\t'.join(line) + '\n')
+
+
+@pytest.mark.parametrize('engine', [ 'pyarrow', 'pandas' ])
+def test_read_double_header_df(tmp_path, monkeypatch, engine):
+    if engine == 'pandas':
+        # without pyarrow the export is read with pandas
+        monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    else:
+        pytest.importorskip('pyarrow')
+    write_export(f'{tmp_path}/export.tsv')
+    df = read_double_header_df(f'{tmp_path}/export.tsv', columns)
+
+    assert list(df.columns) == list(columns)
+    assert isinstance(df[('Host', 'IRI')].dtype, pd.CategoricalDtype)
+    assert df[('Assay ID', 'IEDB IRI')].tolist() == [ 'http://www.iedb.org/assay/1', 'http://www.iedb.org/assay/2', None ]
+    assert column_values(df[('Host', 'IRI')]) == [ 'http://purl.obolibrary.org/obo/NCBITaxon_9606', None,
+                                                   'http://purl.obolibrary.org/obo/NCBITaxon_9606' ]
+
+    rows = [ row for index, row in objects_frame(df).iterrows() ]
+    assert rows[1]['Host']['IRI'] is None
+    assert rows[2]['Reference']['PMID'] == 12
+    assert isinstance(df[('Host', 'IRI')].dtype, pd.CategoricalDtype)
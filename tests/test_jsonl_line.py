@@ -0,0 +1,38 @@
+import pytest
+
+from ak_schema import Chain, LocusEnum, AIRRKnowledgeCommons, AlphaBetaTCR
+from ak_schema_utils import jsonl_line, jsonl_dumper_line, make_chain_from_adc, make_receptor
+
+
+def chains():
+    """Chains whose values differ in shape: empty, false, zero, missing and enum values."""
+    return [
+        Chain('AKC_HASH:1', species='NCBITAXON:9606', locus=LocusEnum('TRB'), junction_aa='CASSF'),
+        Chain('AKC_HASH:2', species='NCBITAXON:9606', locus=LocusEnum('TRA'), junction_aa='CAVF', complete_vdj=True,
+              sequence='ACGT', sequence_aa='CAVF', v_call='TRAV1*01', j_call='TRAJ1*01'),
+        Chain('AKC_HASH:3', species='NCBITAXON:9606', locus=LocusEnum('TRB'), complete_vdj=False, sequence=''),
+        Chain('AKC_HASH:4', species='NCBITAXON:9606', locus=LocusEnum('TRB'), cdr1_start=0, cdr1_end=5),
+        Chain('AKC_HASH:5'),
+    ]
+
+
+@pytest.mark.parametrize('chain', chains(), ids=lambda c: c.akc_id)
+def test_jsonl_line_chain(chain):
+    assert jsonl_line('chains', chain) == jsonl_dumper_line('chains', chain)
+
+
+def test_jsonl_line_same_class_other_shape():
+    # the first chain of a shape must not decide for chains of other shapes
+    for chain in chains() + list(reversed(chains())):
+        assert jsonl_line('chains', chain) == jsonl_dumper_line('chains', chain)
+
+
+def test_jsonl_line_receptors():
+    container = AIRRKnowledgeCommons()
+    tra = make_chain_from_adc('NCBITAXON:9606', { 'locus': 'TRA', 'sequence': 'ACGT', 'sequence_aa': 'CAVF', 'junction_aa': 'CAVF',
+                                                  'v_call': 'TRAV1*01', 'j_call': 'TRAJ1*01', 'complete_vdj': True })
+    trb = make_chain_from_adc('NCBITAXON:9606', { 'locus': 'TRB', 'sequence': None, 'sequence_aa': None, 'junction_aa': 'CASSF',
+                                                  'v_call': None, 'j_call': None, 'complete_vdj': None })
+    for receptor in [ make_receptor(container, [ tra, trb ]), make_receptor(container, [ trb, None ]) ]:
+        assert type(receptor) == AlphaBetaTCR
+        assert jsonl_line('ab_tcell_receptors', receptor) == jsonl_dumper_line('ab_tcell_receptors', receptor)
@@ -0,0 +1,29 @@
+import pytest
+
+from ak_schema_utils import output_filename, open_output, open_input, input_filename
+
+
+def test_output_replaces_other_compression(tmp_path):
+    filename = f'{tmp_path}/chains.jsonl'
+    with open_output(output_filename(filename, 'gzip'), 'gzip') as f:
+        f.write('old\n')
+    with open_output(output_filename(filename, 'none'), 'none') as f:
+        f.write('new\n')
+    assert input_filename(filename) == filename
+    with open_input(filename) as f:
+        assert f.read() == 'new\n'
+
+    with open_output(output_filename(filename, 'gzip'), 'gzip') as f:
+        f.write('newer\n')
+    assert input_filename(filename) == filename + '.gz'
+    with open_input(filename) as f:
+        assert f.read() == 'newer\n'
+
+
+def test_input_with_several_versions(tmp_path):
+    filename = f'{tmp_path}/chains.jsonl'
+    for name in [ filename, filename + '.gz' ]:
+        with open(name, 'w') as f:
+            f.write('\n')
+    with pytest.raises(SystemExit):
+        input_filename(filename)
@@ -0,0 +1,62 @@
+import gzip
+
+import pandas as pd
+
+from adc_chain_transform import fields, read_rearrangements, read_rearrangements_columnar
+
+bad_junction = 'CASSBADF'
+
+
+def write_tsv(filename, lines):
+    with gzip.open(filename, 'wt') as f:
+        f.write('\t'.join(fields) + '\n')
+        for line in lines:
+            f.write(line + '\n')
+
+
+def rearrangement(junction_aa, extra=None):
+    values = { 'productive': 'T', 'junction_aa': junction_aa, 'locus': 'TRB', 'duplicate_count': '1' }
+    line = '\t'.join([ values.get(f, '') for f in fields ])
+    if extra:
+        line += '\t' + extra
+    return line
+
+
+def failing_read_csv(monkeypatch):
+    """Make the columnar reader fail on the chunk with the bad row, as pandas does on a malformed row."""
+    read_csv = pd.read_csv
+
+    def chunks(*args, **kwargs):
+        for df in read_csv(*args, **kwargs):
+            if (df['junction_aa'] == bad_junction).any():
+                raise pd.errors.ParserError('Error tokenizing data')
+            yield df
+
+    monkeypatch.setattr(pd, 'read_csv', chunks)
+
+
+def test_columnar_fallback_after_blank_line(tmp_path, monkeypatch):
+    filename = f'{tmp_path}/rep.airr.tsv.gz'
+    write_tsv(filename, [ rearrangement('CASSAF'), '', rearrangement('CASSBF'), rearrangement('CASSCF'),
+                          rearrangement(bad_junction, extra='extra'), rearrangement('CASSDF') ])
+
+    counts = { 'rows': 0 }
+    expected = list(read_rearrangements(filename, counts))
+    assert [ row['junction_aa'] for row in expected ] == [ 'CASSAF', 'CASSBF', 'CASSCF', bad_junction, 'CASSDF' ]
+
+    failing_read_csv(monkeypatch)
+    columnar_counts = { 'rows': 0 }
+    rows = list(read_rearrangements_columnar(filename, columnar_counts, chunksize=2))
+    assert rows == expected
+    assert columnar_counts == counts
+
+
+def test_columnar_blank_lines(tmp_path):
+    filename = f'{tmp_path}/rep.airr.tsv.gz'
+    write_tsv(filename, [ '', rearrangement('CASSAF'), '', '', rearrangement('CASSBF') ])
+
+    counts = { 'rows': 0 }
+    expected = list(read_rearrangements(filename, counts))
+    columnar_counts = { 'rows': 0 }
+    assert list(read_rearrangements_columnar(filename, columnar_counts, chunksize=2)) == expected
+    assert columnar_counts == counts
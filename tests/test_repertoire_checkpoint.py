@@ -0,0 +1,27 @@
+import copy
+
+import airr
+
+from adc_chain_transform import checkpointed_repertoire
+from ak_schema_utils import ADC_IMPORT_DATA
+
+
+def test_checkpoint_rebuilt_after_metadata_fix(adc_study, tmp_path):
+    rep = airr.read_airr(f'{ADC_IMPORT_DATA}/{adc_study}/repertoires.airr.json')['Repertoire'][0]
+    assert 'contains_paired_chain' in rep['study']['keywords_study']
+    settings = { 'code': 'test', 'id_mode': 'deterministic', 'columnar': False, 'cell_within_repertoire': True, 'assay': 'test' }
+    checkpoint_dir = f'{tmp_path}/checkpoint'
+
+    paired = checkpointed_repertoire(adc_study, rep, True, False, checkpoint_dir, settings)
+    assert 'checkpointed repertoires' not in paired['metrics']['counters']
+    reused = checkpointed_repertoire(adc_study, rep, True, False, checkpoint_dir, settings)
+    assert reused['metrics']['counters']['checkpointed repertoires'] == 1
+
+    # as iReceptor_metadata_fix.py would, the study is no longer paired
+    fixed = copy.deepcopy(rep)
+    fixed['study']['keywords_study'].remove('contains_paired_chain')
+    unpaired = checkpointed_repertoire(adc_study, fixed, True, False, checkpoint_dir, settings)
+    assert 'checkpointed repertoires' not in unpaired['metrics']['counters']
+    assert len(unpaired['tcell_receptors']) > len(paired['tcell_receptors'])
+    reused = checkpointed_repertoire(adc_study, fixed, True, False, checkpoint_dir, settings)
+    assert reused['metrics']['counters']['checkpointed repertoires'] == 1
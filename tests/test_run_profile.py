@@ -0,0 +1,30 @@
+import os
+
+import click
+
+from run_profile import profile_option
+
+
+def test_profile_positional_arguments(tmp_path):
+    @click.command()
+    @click.argument('cache_id')
+    @click.option('--force', is_flag=True)
+    @profile_option(lambda cache_id, **kwargs: f'{tmp_path}/{cache_id}/run')
+    def command(cache_id, force):
+        return (cache_id, force)
+
+    # adc_transform_all gives the arguments by position
+    assert command.callback('S1', True, profile='cprofile') == ('S1', True)
+    assert os.path.exists(f'{tmp_path}/S1/run.pstats')
+
+    assert command.callback('S2', force=False) == ('S2', False)
+    assert not os.path.exists(f'{tmp_path}/S2')
+
+
+def test_chain_transform_profile(adc_study):
+    from ak_schema_utils import ADC_TRANSFORM_DATA
+    from adc_chain_transform import receptor_integrate
+
+    receptor_integrate.callback(adc_study, False, 1, False, None, False, False, True, profile='cprofile')
+    assert os.path.exists(f'{ADC_TRANSFORM_DATA}/adc_profile/{adc_study}/chain.pstats')
+    assert os.path.exists(f'{ADC_TRANSFORM_DATA}/adc_jsonl/{adc_study}/chains.jsonl')
@@ -1,3 +1,4 @@
+import os
 import airr
 import copy
 from dateutil.parser import parse
@@ -38,12 +39,13 @@ We are going to represent the Genotype as a DataSet that comes out of a DataTran
 '''
 
 
-def transform_airr_genotypes(genotype_filename, vdjbase_name_to_akc_ids, container, participant_id_to_sequencing_files):
+def transform_airr_genotypes(genotype_filename, vdjbase_name_to_akc_ids, container, participant_id_to_sequencing_files, cache_id):
     """Transform ADC repertoire metadata to AK objects.
     
     Args:
         genotype_filename (str): The path to the genotype JSON file
         container (AIRRKnowledgeCommons): The container to populate
+        cache_id (str): Study cache the file is from, part of the keys of the AKC IDs
     Returns:
         AIRRKnowledgeCommons: Container with transformed data
     """
@@ -51,6 +53,7 @@ def transform_airr_genotypes(genotype_filename, vdjbase_name_to_akc_ids, contain
 
     # Load the AIRR data
     data = airr.read_airr(genotype_filename)
+    genotype_key = os.path.basename(genotype_filename)
 
     for row in data['genotype_class_list']:
         subject = row['subject_name']
@@ -88,7 +91,7 @@ def transform_airr_genotypes(genotype_filename, vdjbase_name_to_akc_ids, contain
         )
 
         genotype_data = AIRRGenotypeData(
-            akc_id(),
+            akc_id('VDJbase', cache_id, genotype_key, subject, receptor_genotype_set_id, 'genotype data'),
             data_item_types=['genotype'],
             receptor_genotype_set_id=receptor_genotype_set_id,
             genotype_class_list=genotypes
@@ -97,7 +100,7 @@ def transform_airr_genotypes(genotype_filename, vdjbase_name_to_akc_ids, contain
         container['datasets'][genotype_data.akc_id] = genotype_data
 
         data_transformation = DataTransformation(
-            akc_id(),
+            akc_id('VDJbase', cache_id, genotype_key, subject, receptor_genotype_set_id, 'genotype inference'),
             data_transformation_types=['genotype_inference'],
         )
         container['transformations'][data_transformation.akc_id] = data_transformation
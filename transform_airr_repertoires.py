@@ -1,5 +1,7 @@
+import os
 import airr
 from dateutil.parser import parse
+from time import perf_counter
 
 from ak_schema import (
     Investigation,
@@ -19,9 +21,10 @@ from ak_schema_utils import (
     adc_ontology,
     to_datetime,
 )
+from run_metrics import RunMetrics
 
 
-def transform_airr_repertoires(repertoire_filename, container):
+def transform_airr_repertoires(repertoire_filename, container, cache_id, metrics=None, source='ADC'):
     """Transform ADC repertoire metadata to AK objects.
        
        The code will handle multiple studies in a sinmgle repertoire file,
@@ -32,13 +35,20 @@ def transform_airr_repertoires(repertoire_filename, container):
     Args:
         repertoire_filename (str): The path to the repertoire JSON file
         container (AIRRKnowledgeCommons): The container to populate
+        cache_id (str): Study cache the file is from, part of the keys of the AKC IDs
+        metrics (RunMetrics): Optional, gets the read and transform stage times
+        source (str): Source of the file, ADC or VDJbase, part of the keys of the AKC IDs
     Returns:
         AIRRKnowledgeCommons: Container with transformed data
     """
     print('Processing  repertoire file:', repertoire_filename)
+    if metrics is None:
+        metrics = RunMetrics(None)
 
     # Load the AIRR data
-    data = airr.read_airr(repertoire_filename)
+    with metrics.stage('read'):
+        data = airr.read_airr(repertoire_filename)
+    metrics.count('repertoires', len(data['Repertoire']))
     progress_count = 0
     current_investigation = None
     subject_ids = {}
@@ -50,7 +60,12 @@ def transform_airr_repertoires(repertoire_filename, container):
     for investigation in container.investigations.values():
         investigations[investigation.archival_id] = investigation
 
+    # objects of a repertoire are keyed by the file too, as
+    # VDJbase can have the same repertoire in more than one file
+    file_key = os.path.basename(repertoire_filename)
+
     # loop through the repertoires in the file
+    start = perf_counter()
     for rep in data['Repertoire']:
         #if 'P25_I1_' in rep['repertoire_id']:
         #    breakpoint()
@@ -75,7 +90,7 @@ def transform_airr_repertoires(repertoire_filename, container):
 
         if archival_id not in investigations:
             investigation = Investigation(
-                akc_id(),
+                akc_id(source, cache_id, 'investigation', archival_id),
                 name=rep['study'].get('study_title'),
                 description=rep['study'].get('study_description'),
                 archival_id=archival_id,
@@ -142,7 +157,7 @@ def transform_airr_repertoires(repertoire_filename, container):
         else:
             sub = rep['subject']
             participant = Participant(
-                akc_id(),
+                akc_id(source, cache_id, archival_id, 'participant', sub['subject_id']),
                 name=sub['subject_id'],
                 species=adc_ontology(sub.get('species')),
                 sex=sub.get('sex'),
@@ -162,14 +177,14 @@ def transform_airr_repertoires(repertoire_filename, container):
             # transform disease diagnosis to an immune exposure/life event
             arm = None
             if sub.get('diagnosis') is not None:
-                for diag in sub['diagnosis']:
+                for diag_index, diag in enumerate(sub['diagnosis']):
                     if diag.get('study_group_description'):
                         arm_id = arm_ids.get(diag['study_group_description'])
                         if arm_id:
                             arm = container.study_arms[arm_id]
                         else:
                             arm = StudyArm(
-                                akc_id(),
+                                akc_id(source, cache_id, archival_id, 'study arm', diag['study_group_description']),
                                 name=diag['study_group_description'],
                                 investigation=investigation.akc_id
                             )
@@ -180,13 +195,13 @@ def transform_airr_repertoires(repertoire_filename, container):
                     disease_diagnosis = diag.get('disease_diagnosis')
                     if disease_diagnosis and disease_diagnosis.get('id'):
                         le = LifeEvent(
-                            akc_id(),
+                            akc_id(source, cache_id, archival_id, 'participant', sub['subject_id'], 'diagnosis', diag_index, 'life event'),
                             participant=participant.akc_id,
                             life_event_type='immune exposure'
                         )
                         container.life_events[le.akc_id] = le
                         ie = ImmuneExposure(
-                            akc_id(),
+                            akc_id(source, cache_id, archival_id, 'participant', sub['subject_id'], 'diagnosis', diag_index, 'immune exposure'),
                             t0_event=le.akc_id,
                             disease=adc_ontology(diag.get('disease_diagnosis')),
                             disease_stage=diag.get('disease_stage')
@@ -194,7 +209,7 @@ def transform_airr_repertoires(repertoire_filename, container):
                         container.immune_exposures[ie.akc_id] = ie
 
         # specimen processing
-        for s in rep['sample']:
+        for sample_index, s in enumerate(rep['sample']):
             sample_id = s.get('sample_id', rep['subject']['subject_id'])
             specimen_id = sample_ids.get(sample_id)
             if specimen_id:
@@ -204,7 +219,7 @@ def transform_airr_repertoires(repertoire_filename, container):
                 specimen = container.specimens[specimen_id]
             else:
                 life_event = LifeEvent(
-                    akc_id(),
+                    akc_id(source, cache_id, archival_id, 'sample', sample_id, 'life event'),
                     participant=participant.akc_id,
                     life_event_type='specimen collection',
                     geolocation=None,
@@ -216,7 +231,7 @@ def transform_airr_repertoires(repertoire_filename, container):
                 container.life_events[life_event.akc_id] = life_event
 
                 specimen = Specimen(
-                    akc_id(),
+                    akc_id(source, cache_id, archival_id, 'sample', sample_id, 'specimen'),
                     name=sample_id,
                     life_event=life_event.akc_id,
                     tissue=adc_ontology(s.get('tissue'))
@@ -225,7 +240,7 @@ def transform_airr_repertoires(repertoire_filename, container):
                 container.specimens[specimen.akc_id] = specimen
 
             cell_proc = CellIsolationProcessing(
-                akc_id(),
+                akc_id(source, cache_id, archival_id, file_key, rep['repertoire_id'], sample_index, 'cell isolation'),
                 specimen=specimen.akc_id,
                 tissue_processing=s.get('tissue_processing'),
                 cell_subset=adc_ontology(s.get('cell_subset')),
@@ -242,7 +257,7 @@ def transform_airr_repertoires(repertoire_filename, container):
             container.specimen_processings[cell_proc.akc_id] = cell_proc
 
             lib_proc = LibraryPreparationProcessing(
-                akc_id(),
+                akc_id(source, cache_id, archival_id, file_key, rep['repertoire_id'], sample_index, 'library preparation'),
                 specimen=specimen.akc_id,
                 template_class=s.get('template_class'),
                 template_quality=s.get('template_quality'),
@@ -260,7 +275,7 @@ def transform_airr_repertoires(repertoire_filename, container):
 
             f = s['sequencing_files']
             seq_files = AIRRSequencingData(
-                akc_id(),
+                akc_id(source, cache_id, archival_id, file_key, rep['repertoire_id'], sample_index, 'sequencing data'),
                 sequencing_data_id=f.get('sequencing_data_id'),
                 file_type=f.get('file_type'),
                 filename=f.get('filename'),
@@ -277,7 +292,7 @@ def transform_airr_repertoires(repertoire_filename, container):
                 sequencing_run_date = parse(s.get('sequencing_run_date'))
 
             assay = AIRRSequencingAssay(
-                akc_id(),
+                akc_id(source, cache_id, archival_id, file_key, rep['repertoire_id'], sample_index, 'assay'),
                 repertoire_id=rep['repertoire_id'],
                 specimen=specimen.akc_id,
                 specimen_processing=[cell_proc.akc_id, lib_proc.akc_id],
@@ -293,6 +308,8 @@ def transform_airr_repertoires(repertoire_filename, container):
 
             # data processing, not implemented
 
+    metrics.add_time('transform repertoires', perf_counter() - start, progress_count)
+
     # Print final newline if we didn't just print one
     if progress_count % 75 != 0:
         print()
@@ -2,7 +2,6 @@ import dataclasses
 import click
 import sys
 import os
-from linkml_runtime.utils.schemaview import SchemaView
 import airr
 from ak_schema import AIRRKnowledgeCommons, LibraryPreparationProcessing
 from ak_schema_utils import (
@@ -10,12 +9,13 @@ from ak_schema_utils import (
     write_jsonl,
     write_csv,
     write_all_relationships,
+    check_env,
     vdjbase_data_dir,
+    ak_schema_view,
 )
 from transform_airr_repertoires import transform_airr_repertoires
 from transform_airr_genotypes import transform_airr_genotypes
-
-ak_schema_view = SchemaView("ak-schema/project/linkml/ak_schema.yaml")
+from run_profile import profile_option
 
 
 def map_vdjbase_name_to_study_subject(metadata_file):
@@ -130,9 +130,12 @@ def dump_study(container, study_archival_id):
 
 @click.command()
 @click.argument('cache_id')
+@profile_option(lambda cache_id, **kwargs: f'{vdjbase_data_dir}/vdjbase_profile/{cache_id}/repertoire')
 def repertoire_transform(cache_id):
     """Transform VDJbase metadata to AK objects."""
 
+    check_env()
+
     if cache_id not in vdjbase_cache_list:
         print(f"Given cache id: {cache_id} is not in the vdjbase_cache_list")
         sys.exit(1)
@@ -152,7 +155,7 @@ def repertoire_transform(cache_id):
             else:
                 vdjbase_name_to_study_subject[vdjbase_name] = (study_id, subject_id)
 
-        container = transform_airr_repertoires(vdjbase_data_dir + '/' + cache_id + '/' + filename, container)
+        container = transform_airr_repertoires(vdjbase_data_dir + '/' + cache_id + '/' + filename, container, cache_id, source='VDJbase')
 
     for filename in ['airrseq_metadata_IGH.json', 'airrseq_metadata_IGK.json', 'airrseq_metadata_IGL.json', 'airrseq_metadata_TRB.json']:
         for vdjbase_name, (study_id, subject_id) in map_vdjbase_name_to_study_subject(vdjbase_data_dir + '/' + cache_id + '/' + filename).items():
@@ -162,7 +165,7 @@ def repertoire_transform(cache_id):
                     print(f"Warning: VDJbase name: {vdjbase_name} already mapped to {existing_study_id} / {existing_subject_id}, now found mapping to {study_id} / {subject_id}")
             else:
                 vdjbase_name_to_study_subject[vdjbase_name] = (study_id, subject_id)
-        container = transform_airr_repertoires(vdjbase_data_dir + '/' + cache_id + '/' + filename, container)
+        container = transform_airr_repertoires(vdjbase_data_dir + '/' + cache_id + '/' + filename, container, cache_id, source='VDJbase')
 
 
     # make a mapping of VDJbase subject ID to investigation, participant
@@ -225,8 +228,8 @@ def repertoire_transform(cache_id):
 
     dump_studies_in_container(container)
 
-    container = transform_airr_genotypes(vdjbase_data_dir + '/' + cache_id + '/airrseq_all_genotypes.json', vdjbase_name_to_akc_ids, container, participant_id_to_sequencing_files)
-    container = transform_airr_genotypes(vdjbase_data_dir + '/' + cache_id + '/genomic_all_genotypes.json', vdjbase_name_to_akc_ids, container, participant_id_to_sequencing_files)
+    container = transform_airr_genotypes(vdjbase_data_dir + '/' + cache_id + '/airrseq_all_genotypes.json', vdjbase_name_to_akc_ids, container, participant_id_to_sequencing_files, cache_id)
+    container = transform_airr_genotypes(vdjbase_data_dir + '/' + cache_id + '/genomic_all_genotypes.json', vdjbase_name_to_akc_ids, container, participant_id_to_sequencing_files, cache_id)
     
     # output data for just this cache_id
     directory_name = f'{vdjbase_data_dir}/vdjbase_jsonl/{cache_id}'